@@ -0,0 +1,166 @@
+"""Async variants of the read-heavy endpoints, served when ASYNC_READ_ENDPOINTS is on.
+
+Django 3.2 has no async ORM, so database work runs through
+sync_to_async(thread_sensitive=False): each call gets a pool thread with its
+own connection, and independent queries of one request run concurrently
+under asyncio.gather. While a request waits on the database the event loop
+keeps serving others, instead of a whole sync worker sitting idle.
+
+Anything these views don't implement (writes, ?stream=1, keyset pages) is
+handed to the regular DRF view. Streaming responses from it are buffered:
+Django 3.2's ASGI handler iterates them on the event loop, where the lazy
+queries behind them may not run.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import CachedTokenAuthentication
+from .cache import catalog_cache
+from .daily_exercise import exercise_of_the_day
+from .models import DailyProgress, Exercise, Routine
+from .prefetch import apply_prefetch_plan
+from .serializers import ExerciseOfTheDaySerializer, ExerciseSerializer, RoutineSerializer
+from .versioning import data_version_etag
+from .views import (
+    ExerciseOfTheDayViewSet, ExerciseViewSet, ProgressView, RoutineViewSet, progress_data, progress_date_range,
+)
+
+
+# The loop's default executor has min(32, CPUs + 4) threads, five on a
+# one-CPU dyno, which would cap a worker at five queries in flight. Each
+# thread keeps its own database connection.
+query_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_READ_THREADS, thread_name_prefix='async-read')
+
+
+def run_query(func, *args, **kwargs):
+    """Run blocking ORM work in a pool thread without serializing on the main one."""
+    def call():
+        # Pool threads outlive requests, so apply CONN_MAX_AGE like a request would.
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False, executor=query_executor)()
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def buffered(view):
+    """Wrap a sync view so a streaming response is read into a regular one in the calling thread."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if not response.streaming:
+            return response
+        try:
+            content = b''.join(response.streaming_content)
+        finally:
+            response.close()
+        buffered_response = HttpResponse(content, status=response.status_code)
+        for header, value in response.items():
+            buffered_response[header] = value
+        buffered_response.cookies = response.cookies
+        return buffered_response
+    return wrapper
+
+
+def async_read_view(fallback, handles=lambda request: True):
+    """Authenticate a GET like DRF would, and hand everything else to `fallback`."""
+    fallback = sync_to_async(buffered(fallback))
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not handles(request):
+                return await fallback(request, *args, **kwargs)
+            try:
+                result = await run_query(CachedTokenAuthentication().authenticate, request)
+            except exceptions.AuthenticationFailed as exc:
+                return JsonResponse({'detail': str(exc.detail)}, status=401)
+            if result is None:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+            request.user, request.auth = result
+            return await view(request, *args, **kwargs)
+        # DRF views are csrf exempt; csrf_exempt() itself would hide the coroutine.
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+async def conditional_response(request, build, *etag_parts):
+    """The async counterpart of versioning.conditional_on_data_version."""
+    etag = await run_query(data_version_etag, request, *etag_parts)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = await build()
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+@async_read_view(ProgressView.as_view())
+async def progress(request):
+    start_date, end_date = progress_date_range(request.GET)
+    user = request.user
+
+    async def build():
+        # The rollup rows and the routine names don't depend on each other.
+        daily_progress, routine_names = await asyncio.gather(
+            run_query(lambda: list(DailyProgress.objects.filter(
+                user=user, date__range=[start_date, end_date]
+            ).order_by('date'))),
+            run_query(lambda: dict(Routine.objects.filter(user=user).values_list('id', 'name'))),
+        )
+        return json_response(progress_data(daily_progress, routine_names))
+
+    return await conditional_response(request, build, start_date, end_date)
+
+
+@async_read_view(
+    ExerciseViewSet.as_view({'get': 'list', 'post': 'create'}),
+    handles=lambda request: not request.GET,
+)
+async def exercise_list(request):
+    content = await run_query(
+        catalog_cache.get_json,
+        'exercises',
+        lambda: ExerciseSerializer(Exercise.objects.all(), many=True).data,
+    )
+    return HttpResponse(content, content_type='application/json')
+
+
+@async_read_view(RoutineViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def routine_list(request):
+    user = request.user
+
+    async def build():
+        queryset = apply_prefetch_plan(Routine.objects.filter(user=user), RoutineSerializer)
+        data = await run_query(lambda: RoutineSerializer(queryset, many=True, context={'request': request}).data)
+        return json_response(data)
+
+    return await conditional_response(request, build)
+
+
+@async_read_view(ExerciseOfTheDayViewSet.as_view({'get': 'today'}))
+async def exercise_of_the_day_today(request):
+    entry = await run_query(exercise_of_the_day, timezone.now().date())
+    if entry is None:
+        return JsonResponse({'message': 'No exercises available.'}, status=404)
+    data = await run_query(lambda: ExerciseOfTheDaySerializer(entry).data)
+    return json_response(data)
@@ -0,0 +1,90 @@
+import copy
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import LocalLRU
+
+
+def _cache_key(key):
+    # Token keys are credentials, so only their digest goes into the shared cache.
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenSnapshotCache:
+    """Validated token -> (user, token) snapshots, per process and shared.
+
+    The per-process LRU holds entries for at most `local_ttl` seconds, the
+    shared cache for `timeout` seconds. Every shared entry is stamped with
+    the token's version, read before the database lookup that produced the
+    snapshot; invalidation replaces the version, so a snapshot loaded
+    before a revocation but stored after it never matches again. Other
+    processes pick up the revocation once their local entry expires.
+
+    `shared` says whether the default cache is shared between processes;
+    when None it is taken to be unless it's a LocMemCache. A per-process
+    cache never sees other workers' invalidations, so its entries expire
+    after `local_ttl` as well.
+    """
+
+    def __init__(self, max_entries=10000, local_ttl=5.0, timeout=5 * 60, shared=None):
+        self.local = LocalLRU(max_entries)
+        self.local_ttl = local_ttl
+        self.timeout = timeout
+        self.shared = shared
+
+    def shared_timeout(self):
+        shared = self.shared
+        if shared is None:
+            shared = not isinstance(caches['default'], LocMemCache)
+        return self.timeout if shared else min(self.timeout, self.local_ttl)
+
+    def get_or_load(self, key, load):
+        """The snapshot for `key`, calling `load(key)` on a miss or a stale entry."""
+        cache_key = _cache_key(key)
+        entry = self.local.get(cache_key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        version_key = cache_key + ':version'
+        cached = cache.get_many([cache_key, version_key])
+        version = cached.get(version_key)
+        entry = cached.get(cache_key)
+        if entry is not None and entry[0] == version:
+            snapshot = entry[1]
+        else:
+            snapshot = load(key)
+            cache.set(cache_key, (version, snapshot), timeout=self.shared_timeout())
+        self.local.set(cache_key, (time.monotonic() + self.local_ttl, snapshot))
+        return snapshot
+
+    def invalidate(self, *keys):
+        cache_keys = [_cache_key(key) for key in keys]
+        # The version outlives any entry stamped with the one it replaces.
+        version = uuid.uuid4().hex
+        cache.set_many({cache_key + ':version': version for cache_key in cache_keys}, timeout=2 * self.timeout)
+        cache.delete_many(cache_keys)
+        for cache_key in cache_keys:
+            self.local.pop(cache_key)
+
+
+token_cache = TokenSnapshotCache(**getattr(settings, 'AUTH_TOKEN_CACHE', {}))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the Token/User query for known tokens.
+
+    Snapshots are dropped whenever the user is saved or deleted or the
+    token is deleted (see api/signals.py), which covers password changes,
+    profile updates, account deletion and token rotation.
+    """
+
+    def authenticate_credentials(self, key):
+        user, token = token_cache.get_or_load(key, super().authenticate_credentials)
+        # Views may modify request.user, so each request gets its own copy.
+        return copy.copy(user), token
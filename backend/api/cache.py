@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+class LocalLRU:
+    """A small thread-safe LRU kept in each worker process."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CatalogCache:
+    """Versioned cache for the exercise catalog and other reference data.
+
+    Values are built once, rendered to JSON bytes and stored both in the
+    shared cache and a per-process LRU under the current catalog version.
+    Any Exercise/MuscleGroup write bumps the version (see api/signals.py),
+    so stale entries are never read again and simply age out. The version
+    itself is re-read from the shared cache at most every `version_ttl`
+    seconds, which bounds how long other processes can serve old data.
+    """
+
+    def __init__(self, max_entries=64, version_ttl=1.0, timeout=24 * 60 * 60):
+        self.local = LocalLRU(max_entries)
+        self.version_ttl = version_ttl
+        self.timeout = timeout
+        self._version = None
+        self._version_checked = 0.0
+
+    def version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked > self.version_ttl:
+            version = cache.get(CATALOG_VERSION_KEY)
+            if version is None:
+                cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+                version = cache.get(CATALOG_VERSION_KEY, 1)
+            self._version = version
+            self._version_checked = now
+        return self._version
+
+    def invalidate(self):
+        try:
+            self._version = cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+            self._version = cache.incr(CATALOG_VERSION_KEY)
+        self._version_checked = time.monotonic()
+        self.local.clear()
+        return self._version
+
+    def get_or_build(self, name, build):
+        """Return the cached value of `build()` for the current catalog version."""
+        key = f'catalog:{self.version()}:{name}'
+        value = self.local.get(key)
+        if value is None:
+            value = cache.get(key)
+            if value is None:
+                value = build()
+                cache.set(key, value, timeout=self.timeout)
+            self.local.set(key, value)
+        return value
+
+    def get_json(self, name, build):
+        """Like get_or_build, but stores the rendered JSON bytes of `build()`."""
+        # Imported here so loading the app (signals, Celery workers) doesn't pull in DRF.
+        from rest_framework.renderers import JSONRenderer
+        return self.get_or_build(f'{name}:json', lambda: JSONRenderer().render(build()))
+
+
+catalog_cache = CatalogCache(**getattr(settings, 'CATALOG_CACHE', {}))
@@ -0,0 +1,294 @@
+import csv
+import json
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, UniqueConstraint, Value, When, Window
+from django.db.models.functions import FirstValue
+
+from .cache import catalog_cache
+from .challenges import recount_progress
+from .models import Exercise, MuscleGroup, UserChallenge, UserChallengeExercise
+from .versioning import batched_data_version_bumps, bump_data_version
+
+DEFAULT_CATALOG = Path(__file__).resolve().parent / 'data' / 'exercise_catalog.json'
+CATALOG_FIELDS = ('name', 'muscle_group', 'exercise_type', 'description')
+EXERCISE_TYPES = {value for value, _ in Exercise.EXERCISE_TYPES}
+# When re-pointing makes rows collide on a unique constraint, the first row
+# of each collision in this order is kept and the others are deleted.
+KEEP_ORDER = {UserChallengeExercise: ('-completed', 'id')}
+# Duplicates re-pointed per UPDATE; three parameters each stay under
+# SQLite's 999 parameter limit.
+REPOINT_BATCH_SIZE = 300
+
+
+def load_catalog(path=DEFAULT_CATALOG):
+    """Read catalog rows from a JSON list or a CSV file with CATALOG_FIELDS columns.
+
+    Rows are checked and normalised; a later row with the same natural key
+    (name, muscle group) as an earlier one replaces it.
+    """
+    path = Path(path)
+    with open(path, newline='', encoding='utf-8') as catalog_file:
+        if path.suffix.lower() == '.csv':
+            rows = list(csv.DictReader(catalog_file))
+        else:
+            rows = json.load(catalog_file)
+    if not isinstance(rows, list):
+        raise ValueError(f'{path}: expected a list of exercises')
+
+    catalog = {}
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f'{path}: row {number} is not an object')
+        name = (row.get('name') or '').strip()
+        muscle_group = (row.get('muscle_group') or '').strip()
+        exercise_type = (row.get('exercise_type') or '').strip()
+        if not name or not muscle_group:
+            raise ValueError(f'{path}: row {number} needs a name and a muscle_group')
+        if exercise_type not in EXERCISE_TYPES:
+            raise ValueError(f'{path}: row {number} has unknown exercise_type {exercise_type!r}')
+        if len(name) > Exercise._meta.get_field('name').max_length:
+            raise ValueError(f'{path}: row {number} name is too long')
+        catalog[(name, muscle_group)] = {
+            'name': name,
+            'muscle_group': muscle_group,
+            'exercise_type': exercise_type,
+            'description': (row.get('description') or '').strip(),
+        }
+    return list(catalog.values())
+
+
+def update_exercises(rows, batch_size):
+    """Set (exercise_type, description) by id for many exercises.
+
+    One prepared UPDATE run per row: bulk_update spends far longer building
+    its CASE expression in Python than the database spends on the rows.
+    """
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s, {} = %s WHERE {} = %s'.format(
+        quote(Exercise._meta.db_table),
+        quote(Exercise._meta.get_field('exercise_type').column),
+        quote(Exercise._meta.get_field('description').column),
+        quote(Exercise._meta.pk.column),
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def sync_catalog(rows, dry_run=False, batch_size=1000):
+    """Bring the Exercise and MuscleGroup tables in line with catalog rows.
+
+    Rows are matched to exercises by (name, muscle group name); new ones
+    are bulk inserted and changed ones updated in batches, all inside one
+    transaction. Nothing is deleted: exercises missing
+    from the catalog are only counted, since deleting them would cascade
+    into users' routines, history and favorites. Where the database
+    already holds duplicates of a key, the oldest row is the one synced.
+
+    Returns counts of what was (or, with dry_run, would be) written.
+    """
+    with transaction.atomic():
+        # Exercises under any copy of a duplicated group match by its name;
+        # new exercises go under the oldest copy.
+        group_names, muscle_groups = {}, {}
+        for group_id, name in MuscleGroup.objects.order_by('-id').values_list('id', 'name'):
+            group_names[group_id] = name
+            muscle_groups[name] = group_id
+        new_groups = sorted({row['muscle_group'] for row in rows} - set(muscle_groups))
+        if new_groups and not dry_run:
+            MuscleGroup.objects.bulk_create([MuscleGroup(name=name) for name in new_groups])
+            for group_id, name in MuscleGroup.objects.filter(name__in=new_groups).order_by('-id').values_list('id', 'name'):
+                group_names[group_id] = name
+                muscle_groups[name] = group_id
+
+        existing = {}
+        for exercise_id, name, group_id, exercise_type, description in Exercise.objects.order_by('-id').values_list(
+            'id', 'name', 'muscle_group_id', 'exercise_type', 'description'
+        ).iterator(chunk_size=5000):
+            existing[(name, group_names.get(group_id))] = (exercise_id, exercise_type, description)
+
+        to_create, to_update, retyped = [], [], []
+        for row in rows:
+            key = (row['name'], row['muscle_group'])
+            current = existing.pop(key, None)
+            if current is None:
+                to_create.append(Exercise(
+                    name=row['name'],
+                    muscle_group_id=muscle_groups.get(row['muscle_group']),
+                    exercise_type=row['exercise_type'],
+                    description=row['description'],
+                ))
+            elif current[1:] != (row['exercise_type'], row['description']):
+                to_update.append((row['exercise_type'], row['description'], current[0]))
+                if current[1] != row['exercise_type']:
+                    retyped.append(current[0])
+
+        if not dry_run:
+            Exercise.objects.bulk_create(to_create, batch_size=batch_size)
+            update_exercises(to_update, batch_size)
+            if to_update:
+                # Routines show each exercise's type; challenge progress
+                # shows the whole exercise.
+                with batched_data_version_bumps():
+                    if retyped:
+                        bump_data_version(routines__exercises__exercise__in=tuple(retyped))
+                    bump_data_version(userchallenge__exercise_progress__exercise__in=tuple(row[-1] for row in to_update))
+            if new_groups or to_create or to_update:
+                # Bulk writes skip the signal receivers; a new catalog version
+                # also makes every process rebuild its search index.
+                transaction.on_commit(catalog_cache.invalidate)
+
+    return {
+        'muscle_groups_created': len(new_groups),
+        'created': len(to_create),
+        'updated': len(to_update),
+        'unchanged': len(rows) - len(to_create) - len(to_update),
+        'not_in_catalog': len(existing),
+    }
+
+
+def find_duplicates(queryset, key_fields, order_by):
+    """{duplicate id: survivor id} for rows sharing key_fields, from one window query.
+
+    The survivor of each group is its first row in `order_by`.
+    """
+    rows = queryset.annotate(survivor=Window(
+        FirstValue('id'), partition_by=[F(field) for field in key_fields], order_by=order_by,
+    )).values_list('id', 'survivor')
+    return {row_id: survivor for row_id, survivor in rows if row_id != survivor}
+
+
+def _references(model):
+    """(referencing model, foreign key) for every foreign key to `model`, M2M tables included."""
+    return [
+        (field.related_model, field.field)
+        for field in model._meta.get_fields(include_hidden=True)
+        if (field.one_to_many or field.one_to_one) and field.auto_created and not field.concrete
+    ]
+
+
+def _unique_with(model, field):
+    """The other columns of each unique constraint on `model` that includes `field`."""
+    unique = [tuple(fields) for fields in model._meta.unique_together]
+    unique += [
+        tuple(constraint.fields) for constraint in model._meta.constraints
+        if isinstance(constraint, UniqueConstraint) and constraint.condition is None
+    ]
+    return [
+        [model._meta.get_field(name).attname for name in fields if name != field.name]
+        for fields in unique if field.name in fields
+    ]
+
+
+def repoint(model, mapping):
+    """Move every reference to a key of `mapping` onto its value.
+
+    Rows that would then duplicate another row under a unique constraint
+    are deleted first, keeping one per KEEP_ORDER. The rest are moved by
+    one UPDATE per referencing table (per REPOINT_BATCH_SIZE duplicates)
+    that maps each duplicate to its survivor with a CASE. Returns
+    {table: (rows re-pointed, rows dropped)}.
+    """
+    quote = connection.ops.quote_name
+    changes = {}
+    for related, field in _references(model):
+        manager = related._base_manager
+        dropped = set()
+        for others in _unique_with(related, field):
+            kept = set()
+            rows = manager.filter(**{f'{field.name}__in': set(mapping) | set(mapping.values())}).order_by(
+                *KEEP_ORDER.get(related, ('id',))
+            ).values_list('pk', field.attname, *others)
+            for pk, target, *rest in rows:
+                key = (mapping.get(target, target), *rest)
+                if key in kept:
+                    dropped.add(pk)
+                else:
+                    kept.add(key)
+        if dropped:
+            manager.filter(pk__in=dropped).delete()
+
+        referenced = dict(manager.filter(**{f'{field.name}__in': list(mapping)}).values_list(
+            field.attname
+        ).annotate(rows=Count('pk')).order_by())
+        duplicates = sorted(referenced)
+        with connection.cursor() as cursor:
+            for start in range(0, len(duplicates), REPOINT_BATCH_SIZE):
+                batch = duplicates[start:start + REPOINT_BATCH_SIZE]
+                sql = 'UPDATE {table} SET {column} = CASE {column} {cases} END WHERE {column} IN ({placeholders})'.format(
+                    table=quote(related._meta.db_table), column=quote(field.column),
+                    cases=' '.join(['WHEN %s THEN %s'] * len(batch)), placeholders=', '.join(['%s'] * len(batch)),
+                )
+                cursor.execute(sql, [value for duplicate in batch for value in (duplicate, mapping[duplicate])] + batch)
+        if referenced or dropped:
+            changes[related._meta.db_table] = (sum(referenced.values()), len(dropped))
+    return changes
+
+
+def dedupe_catalog(muscle_groups=True, exercises=True, dry_run=False):
+    """Merge duplicate muscle groups (by name) and exercises (by name and muscle group).
+
+    Muscle groups keep their oldest row. Exercises keep their oldest row
+    with a description, or their oldest row if none has one. Every
+    reference to a duplicate (routines, favorites, exercise of the day,
+    challenges and challenge progress) is moved to the survivor before
+    the duplicates are deleted, so nothing cascades, and the progress of
+    challenges that listed several copies is recounted. It all happens in
+    one transaction; with dry_run it is rolled back.
+
+    Returns {'muscle_groups': [...], 'exercises': [...], 'references': {...}}:
+    a (key, survivor id, duplicate ids) entry per merged group, and the
+    (re-pointed, dropped) row counts per referencing table.
+    """
+    report = {'muscle_groups': [], 'exercises': [], 'references': {}}
+    with transaction.atomic():
+        with batched_data_version_bumps():
+            if muscle_groups:
+                mapping = find_duplicates(MuscleGroup.objects.all(), ['name'], [F('id').asc()])
+                names = dict(MuscleGroup.objects.filter(pk__in=set(mapping.values())).values_list('id', 'name'))
+                report['muscle_groups'] = _merge(MuscleGroup, mapping, names, report['references'])
+
+            if exercises:
+                mapping = find_duplicates(
+                    Exercise.objects.all(),
+                    ['name', 'muscle_group_id'],
+                    [Case(When(description='', then=Value(1)), default=Value(0)).asc(), F('id').asc()],
+                )
+                names = {
+                    exercise_id: f'{name} ({muscle_group})'
+                    for exercise_id, name, muscle_group in Exercise.objects.filter(
+                        pk__in=set(mapping.values())
+                    ).values_list('id', 'name', 'muscle_group__name')
+                }
+                # Merging can drop the progress row of a duplicate that a
+                # challenge also lists the survivor of.
+                user_challenges = list(UserChallenge.objects.filter(
+                    exercise_progress__exercise__in=list(mapping),
+                ).values_list('id', flat=True).distinct())
+                report['exercises'] = _merge(Exercise, mapping, names, report['references'])
+                if user_challenges:
+                    recount_progress(user_challenges)
+                if mapping:
+                    survivors = tuple(sorted(set(mapping.values())))
+                    bump_data_version(routines__exercises__exercise__in=survivors)
+                    bump_data_version(userchallenge__exercise_progress__exercise__in=survivors)
+
+        if dry_run:
+            transaction.set_rollback(True)
+        elif report['muscle_groups'] or report['exercises']:
+            transaction.on_commit(catalog_cache.invalidate)
+    return report
+
+
+def _merge(model, mapping, names, references):
+    for table, (repointed, dropped) in repoint(model, mapping).items():
+        previous = references.get(table, (0, 0))
+        references[table] = (previous[0] + repointed, previous[1] + dropped)
+    model._base_manager.filter(pk__in=list(mapping)).delete()
+
+    groups = {}
+    for duplicate, survivor in sorted(mapping.items()):
+        groups.setdefault(survivor, []).append(duplicate)
+    return [(names[survivor], survivor, duplicates) for survivor, duplicates in sorted(groups.items())]
@@ -0,0 +1,175 @@
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Exercise, WorkoutChallenge
+
+logger = logging.getLogger(__name__)
+
+# The beat job runs weekly, so five weeks always covers the next month's
+# challenges before it starts without piling up a year of them.
+PLAN_DAYS_AHEAD = 35
+CADENCES = ('monthly', 'weekly')
+EXERCISE_TYPES = tuple(value for value, _ in Exercise.EXERCISE_TYPES)
+DIFFICULTIES = tuple(value for value, _ in WorkoutChallenge._meta.get_field('difficulty').choices)
+EXERCISE_COUNTS = {'Easy': 3, 'Medium': 5, 'Hard': 7}
+GOALS = {
+    'monthly': {'Easy': 12, 'Medium': 16, 'Hard': 20},
+    'weekly': {'Easy': 3, 'Medium': 4, 'Hard': 5},
+}
+
+
+def period_start(cadence, day):
+    return day - timedelta(days=day.weekday()) if cadence == 'weekly' else day.replace(day=1)
+
+
+def next_period_start(cadence, first_day):
+    return first_day + timedelta(days=7) if cadence == 'weekly' else (first_day + timedelta(days=32)).replace(day=1)
+
+
+def previous_period_start(cadence, first_day):
+    return first_day - timedelta(days=7) if cadence == 'weekly' else (first_day - timedelta(days=1)).replace(day=1)
+
+
+def challenge_name(cadence, exercise_type, difficulty, first_day):
+    if cadence == 'weekly':
+        return f'{exercise_type} Week ({difficulty}): {first_day:%b %d, %Y}'
+    return f'{exercise_type} Month ({difficulty}): {first_day:%B %Y}'
+
+
+def sample_exercises(pool, size, seed, previous=None):
+    """A seeded sample of up to `size` ids from `pool` that differs from `previous`.
+
+    Samples leave at least one exercise of the pool out, so consecutive
+    periods can always differ; only a single-exercise pool repeats.
+    """
+    rng = random.Random(seed)
+    size = min(size, max(len(pool) - 1, 1))
+    chosen = frozenset(rng.sample(pool, size))
+    if previous is not None and len(pool) > 1:
+        while chosen == previous:
+            chosen = frozenset(rng.sample(pool, size))
+    return chosen
+
+
+def plan_challenge_calendar(
+    start=None, days=PLAN_DAYS_AHEAD, cadences=CADENCES, exercise_types=EXERCISE_TYPES,
+    difficulties=DIFFICULTIES, seed=0, dry_run=False,
+):
+    """Create rotating challenges for every period overlapping `start` .. `start + days`.
+
+    Each (cadence, exercise type, difficulty) is a series with one
+    challenge per week or calendar month. A challenge's exercises are
+    drawn from a generator seeded with `seed`, its series and its first
+    day, so the same seed always plans the same calendar, and no period
+    repeats the exercise set of the one before it. Periods that already
+    have their challenge are left alone. Everything is read in three
+    queries and written with bulk_create. Returns the planned
+    (unsaved, with dry_run) challenges; nothing if a concurrent run
+    planned some of the same periods first, in which case the next run
+    fills in the rest.
+    """
+    start = start or timezone.now().date()
+    end = start + timedelta(days=days)
+
+    pools = defaultdict(list)
+    for exercise_type, exercise_id in Exercise.objects.filter(
+        exercise_type__in=exercise_types
+    ).order_by('id').values_list('exercise_type', 'id'):
+        pools[exercise_type].append(exercise_id)
+
+    # The period before the horizon is read too, so the first planned
+    # period doesn't repeat the set that precedes it.
+    earliest = min(previous_period_start(cadence, period_start(cadence, start)) for cadence in cadences)
+    existing = {
+        (name, start_date): challenge_id
+        for challenge_id, name, start_date in WorkoutChallenge.objects.filter(
+            start_date__gte=earliest, start_date__lt=end,
+        ).values_list('id', 'name', 'start_date')
+    }
+    through = WorkoutChallenge.exercises.through
+    existing_sets = defaultdict(set)
+    for challenge_id, exercise_id in through.objects.filter(
+        workoutchallenge_id__in=list(existing.values())
+    ).values_list('workoutchallenge_id', 'exercise_id'):
+        existing_sets[challenge_id].add(exercise_id)
+
+    planned = []
+    for cadence in cadences:
+        for exercise_type in exercise_types:
+            pool = pools.get(exercise_type)
+            if not pool:
+                continue
+            for difficulty in difficulties:
+                first_day = period_start(cadence, start)
+                before = previous_period_start(cadence, first_day)
+                previous_id = existing.get((challenge_name(cadence, exercise_type, difficulty, before), before))
+                previous = frozenset(existing_sets[previous_id]) if previous_id else None
+                while first_day < end:
+                    following = next_period_start(cadence, first_day)
+                    name = challenge_name(cadence, exercise_type, difficulty, first_day)
+                    challenge_id = existing.get((name, first_day))
+                    if challenge_id is not None:
+                        previous = frozenset(existing_sets[challenge_id])
+                    else:
+                        previous = sample_exercises(
+                            pool, EXERCISE_COUNTS[difficulty],
+                            f'{seed}:{cadence}:{exercise_type}:{difficulty}:{first_day.isoformat()}', previous,
+                        )
+                        challenge = WorkoutChallenge(
+                            name=name,
+                            description=(
+                                f"A {'one-week' if cadence == 'weekly' else 'one-month'} challenge focusing on "
+                                f"{exercise_type.lower()} exercises to improve your overall fitness."
+                            ),
+                            start_date=first_day,
+                            end_date=following - timedelta(days=1),
+                            goal=GOALS[cadence][difficulty],
+                            difficulty=difficulty,
+                            exercise_type=exercise_type,
+                        )
+                        challenge.exercise_ids = sorted(previous)
+                        planned.append(challenge)
+                    first_day = following
+
+    if dry_run or not planned:
+        return planned
+
+    try:
+        with transaction.atomic():
+            WorkoutChallenge.objects.bulk_create(planned, batch_size=1000)
+            if planned[0].pk is None:
+                # Backends that can't return ids from a bulk insert.
+                ids = {
+                    (name, start_date): challenge_id
+                    for challenge_id, name, start_date in WorkoutChallenge.objects.filter(
+                        start_date__gte=earliest, start_date__lt=end,
+                    ).values_list('id', 'name', 'start_date')
+                }
+                for challenge in planned:
+                    challenge.pk = ids[(challenge.name, challenge.start_date)]
+            through.objects.bulk_create(
+                [
+                    through(workoutchallenge_id=challenge.pk, exercise_id=exercise_id)
+                    for challenge in planned
+                    for exercise_id in challenge.exercise_ids
+                ],
+                batch_size=5000,
+            )
+    except IntegrityError:
+        # Only a concurrent run that planned these periods first is
+        # expected; anything else, like an exercise deleted since it was
+        # sampled, is re-raised.
+        periods = {(challenge.name, challenge.start_date) for challenge in planned}
+        taken = set(WorkoutChallenge.objects.filter(
+            start_date__gte=earliest, start_date__lt=end,
+        ).values_list('name', 'start_date')) & periods
+        if not taken:
+            raise
+        logger.info(f"{len(taken)} of {len(planned)} challenge periods were planned by a concurrent run")
+        return []
+    return planned
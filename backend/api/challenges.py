@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import Case, Count, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .leaderboards import record_progress
+from .models import WorkoutChallenge, UserChallenge, UserChallengeExercise
+from .versioning import batched_data_version_bumps, bump_data_version
+
+ENROLLMENT_CHUNK_SIZE = 1000
+
+
+def challenge_exercise_ids(challenge_id):
+    through = WorkoutChallenge.exercises.through
+    return list(through.objects.filter(workoutchallenge_id=challenge_id).values_list('exercise_id', flat=True))
+
+
+def enroll_users(challenge_id, user_ids, exercise_ids=None):
+    """Enroll users into a challenge; returns the ids of the users newly enrolled.
+
+    Uses one bulk_create for the UserChallenge rows and one for their
+    UserChallengeExercise rows, both ignoring conflicts on the unique
+    pairs, so concurrent or repeated enrollments are harmless.
+    """
+    user_ids = set(user_ids)
+    if exercise_ids is None:
+        exercise_ids = challenge_exercise_ids(challenge_id)
+
+    with transaction.atomic(), batched_data_version_bumps():
+        enrolled = set(UserChallenge.objects.filter(
+            challenge_id=challenge_id, user_id__in=user_ids
+        ).values_list('user_id', flat=True))
+        new_user_ids = user_ids - enrolled
+        if not new_user_ids:
+            return set()
+
+        user_challenges = [UserChallenge(user_id=user_id, challenge_id=challenge_id) for user_id in new_user_ids]
+        UserChallenge.objects.bulk_create(user_challenges, ignore_conflicts=True)
+        user_challenge_ids = UserChallenge.objects.filter(
+            challenge_id=challenge_id, user_id__in=new_user_ids
+        ).values_list('id', flat=True)
+        UserChallengeExercise.objects.bulk_create(
+            [
+                UserChallengeExercise(user_challenge_id=user_challenge_id, exercise_id=exercise_id)
+                for user_challenge_id in user_challenge_ids
+                for exercise_id in exercise_ids
+            ],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+        for user_id in new_user_ids:
+            bump_data_version(user_id)
+        transaction.on_commit(lambda: record_progress(user_challenges))
+    return new_user_ids
+
+
+def enroll_users_in_chunks(challenge_id, user_ids, chunk_size=ENROLLMENT_CHUNK_SIZE):
+    """Enroll an iterable of user ids chunk by chunk, one transaction per chunk."""
+    exercise_ids = challenge_exercise_ids(challenge_id)
+    enrolled = 0
+    chunk = []
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) >= chunk_size:
+            enrolled += len(enroll_users(challenge_id, chunk, exercise_ids))
+            chunk = []
+    if chunk:
+        enrolled += len(enroll_users(challenge_id, chunk, exercise_ids))
+    return enrolled
+
+
+def recount_progress(user_challenge_ids):
+    """Recompute progress and completed of UserChallenges from their completed exercises.
+
+    For bulk changes to UserChallengeExercise rows, which bypass the
+    increments update_progress makes. Leaderboards follow on commit.
+    """
+    user_challenges = UserChallenge.objects.filter(pk__in=list(user_challenge_ids))
+    completed = UserChallengeExercise.objects.filter(
+        user_challenge=OuterRef('pk'), completed=True,
+    ).values('user_challenge').annotate(count=Count('id')).values('count')
+    goal = WorkoutChallenge.objects.filter(pk=OuterRef('challenge_id')).values('goal')[:1]
+    with transaction.atomic():
+        user_challenges.update(progress=Coalesce(Subquery(completed), 0))
+        # A separate UPDATE, so the comparison sees the new progress.
+        user_challenges.update(completed=Case(When(progress__gte=Subquery(goal), then=Value(True)), default=Value(False)))
+        transaction.on_commit(lambda: record_progress(list(user_challenges)))
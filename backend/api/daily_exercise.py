@@ -0,0 +1,76 @@
+import random
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import catalog_cache
+from .models import Exercise, ExerciseOfTheDay
+
+SCHEDULE_DAYS_AHEAD = 30
+
+
+def schedule_exercises_of_the_day(start=None, days=SCHEDULE_DAYS_AHEAD):
+    """Fill in the ExerciseOfTheDay calendar from `start` for `days` days.
+
+    Exercises rotate in id order, continuing after the most recently
+    scheduled one, so none repeats until the whole catalog has been used.
+    Dates that already have an exercise are left alone. Returns the number
+    of days scheduled.
+    """
+    start = start or timezone.now().date()
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    exercise_ids = list(Exercise.objects.order_by('id').values_list('id', flat=True))
+    if not exercise_ids:
+        return 0
+
+    with transaction.atomic():
+        scheduled = set(ExerciseOfTheDay.objects.filter(date__in=dates).values_list('date', flat=True))
+        missing = [day for day in dates if day not in scheduled]
+        if not missing:
+            return 0
+        last = ExerciseOfTheDay.objects.filter(date__lt=missing[0]).order_by('-date').values_list('exercise_id', flat=True).first()
+        if last is None:
+            position = random.randrange(len(exercise_ids))
+        else:
+            position = bisect_right(exercise_ids, last) % len(exercise_ids)
+
+        ExerciseOfTheDay.objects.bulk_create(
+            [
+                ExerciseOfTheDay(date=day, exercise_id=exercise_ids[(position + offset) % len(exercise_ids)])
+                for offset, day in enumerate(missing)
+            ],
+            ignore_conflicts=True,
+        )
+    return len(missing)
+
+
+def random_exercise_id():
+    """Pick a random exercise with one COUNT and one indexed OFFSET lookup."""
+    count = Exercise.objects.count()
+    if not count:
+        return None
+    return Exercise.objects.order_by('id').values_list('id', flat=True)[random.randrange(count)]
+
+
+def exercise_of_the_day(day):
+    """The ExerciseOfTheDay for `day`, cached per date under the catalog version.
+
+    Normally the row was scheduled ahead by the beat task; if not, one is
+    picked at random. get_or_create absorbs the unique-date race between
+    concurrent first requests, so every caller gets the same exercise.
+    """
+    def build():
+        entry = ExerciseOfTheDay.objects.filter(date=day).values_list('exercise_id', flat=True).first()
+        if entry is None:
+            exercise_id = random_exercise_id()
+            if exercise_id is None:
+                return None
+            entry = ExerciseOfTheDay.objects.get_or_create(date=day, defaults={'exercise_id': exercise_id})[0].exercise_id
+        return entry
+
+    exercise_id = catalog_cache.get_or_build(f'exercise-of-the-day:{day.isoformat()}', build)
+    if exercise_id is None:
+        return None
+    return ExerciseOfTheDay(date=day, exercise_id=exercise_id)
@@ -0,0 +1,68 @@
+"""PostgreSQL backend that checks connections out of a per-process pool (api/db_pool.py).
+
+Closing the Django connection, at the end of a request or a Celery task,
+returns it to the pool instead of closing the socket, so the next
+checkout skips the TCP and SSL handshake. Use with CONN_MAX_AGE = 0.
+"""
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from django.db.backends.postgresql import base
+
+from api.db_pool import get_pool
+
+STATUS_IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+STATUS_UNKNOWN = psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+
+
+def _connect(conn_params, options):
+    connection = psycopg2.connect(**conn_params)
+    if 'isolation_level' in options and options['isolation_level'] != connection.isolation_level:
+        connection.set_session(isolation_level=options['isolation_level'])
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def _ping(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if connection.get_transaction_status() != STATUS_IDLE:
+            connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _reset(connection):
+    """Roll back leftovers so the next user gets a clean session; False if unusable."""
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == STATUS_UNKNOWN:
+        return False
+    if status != STATUS_IDLE:
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def pool(self):
+        conn_params = self.get_connection_params()
+        options = self.settings_dict['OPTIONS']
+        return get_pool(self.alias, lambda: _connect(conn_params, options), ping=_ping, reset=_reset)
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool.getconn()
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection, discard=self.errors_occurred and not self.is_usable())
@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+DEFAULT_POOL = {
+    'min_size': 0,
+    'max_size': 10,
+    'timeout': 5.0,
+    'recycle': 30 * 60,
+    'max_idle': 5 * 60,
+    'pre_ping': True,
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of DB-API connections for one process.
+
+    `connect()` opens a connection, `ping(conn)` returns whether it still
+    works, `reset(conn)` returns whether it can be handed out again, and
+    `close(conn)` closes it. Connections older than `recycle` seconds are
+    replaced, idle ones above `min_size` are closed after `max_idle`
+    seconds, and a checkout waits up to `timeout` seconds for a free slot.
+    """
+
+    def __init__(self, connect, ping=None, reset=None, close=None, min_size=0, max_size=10,
+                 timeout=5.0, recycle=30 * 60, max_idle=5 * 60, pre_ping=True):
+        self._connect = connect
+        self._ping = ping
+        self._reset = reset
+        self._close = close or (lambda conn: conn.close())
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.max_idle = max_idle
+        self.pre_ping = pre_ping
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned), most recently returned last; creation times are in _created
+        self._created = {}
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._filled = False
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+                'checkout_seconds_total': self.checkout_seconds_total,
+                'checkout_seconds_max': self.checkout_seconds_max,
+            }
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _fill(self):
+        # Open min_size connections up front so the first requests don't pay for them.
+        with self._cond:
+            if self._filled:
+                return
+            self._filled = True
+            count = max(self.min_size - self._size, 0)
+            self._size += count
+        for _ in range(count):
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self.putconn(conn, checked_out=False)
+
+    def _discard(self, conn):
+        # Called with the lock held; the slot is freed for a new connection.
+        self._created.pop(id(conn), None)
+        self._size -= 1
+        self.discarded += 1
+        self._cond.notify()
+        try:
+            self._close(conn)
+        except Exception:
+            pass
+
+    def _expired(self, conn, now):
+        return self.recycle is not None and now - self._created.get(id(conn), now) > self.recycle
+
+    def getconn(self):
+        self._fill()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    while self._idle and conn is None:
+                        candidate, _ = self._idle.pop()
+                        if self._expired(candidate, now):
+                            self._discard(candidate)
+                        else:
+                            conn = candidate
+                    if conn is not None or self._size < self.max_size:
+                        if conn is None:
+                            self._size += 1
+                        self._in_use += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f'No database connection free within {self.timeout}s ({self.max_size} in use)')
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            elif self.pre_ping and self._ping is not None and not self._ping(conn):
+                # Dead connection (server restart, idle timeout): drop it and retry.
+                with self._cond:
+                    self._in_use -= 1
+                    self._discard(conn)
+                continue
+
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.checkouts += 1
+                self.checkout_seconds_total += elapsed
+                self.checkout_seconds_max = max(self.checkout_seconds_max, elapsed)
+            return conn
+
+    def putconn(self, conn, discard=False, checked_out=True):
+        reusable = not discard and (self._reset is None or self._reset(conn))
+        with self._cond:
+            if checked_out:
+                self._in_use -= 1
+            now = time.monotonic()
+            if not reusable or self._expired(conn, now):
+                self._discard(conn)
+            else:
+                self._idle.append((conn, now))
+                self._cond.notify()
+            # Shrink back towards min_size after a burst.
+            while len(self._idle) and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+                self._discard(self._idle.popleft()[0])
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.popleft()[0])
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_role = 'web'
+
+
+def set_pool_role(role):
+    """Select which DATABASE_POOL entry pools created from now on use ('web' or 'worker')."""
+    global _role
+    _role = role
+
+
+def pool_config(role=None):
+    config = dict(DEFAULT_POOL)
+    config.update(getattr(settings, 'DATABASE_POOL', {}).get(role or _role, {}))
+    return config
+
+
+def get_pool(alias, connect, **callbacks):
+    """The current process's pool for a database alias, created on first use.
+
+    Pools are keyed by process id so forked workers never share the
+    parent's connections.
+    """
+    key = (os.getpid(), alias)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(connect, **callbacks, **pool_config())
+    return pool
+
+
+def pool_stats():
+    """Stats of this process's pools, by database alias."""
+    pid = os.getpid()
+    return {alias: pool.stats() for (owner, alias), pool in list(_pools.items()) if owner == pid}
@@ -0,0 +1,254 @@
+import random
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Progress is the major part of a leaderboard score and the time it was
+# reached the minor part, so equal progress ranks whoever got there first.
+# Scores stay below 2**53 and are exact as Redis doubles, which leaves no
+# room for the user id. Exact ties (same progress in the same second)
+# rank the higher user id first in both backends: Redis orders equal
+# scores by member, descending, and members are zero-padded ids so that
+# byte order is numeric order.
+SCORE_TIME_SPAN = 10 ** 10
+MEMBER_WIDTH = 20
+
+
+def leaderboard_score(progress, last_updated):
+    return progress * SCORE_TIME_SPAN + (SCORE_TIME_SPAN - 1 - int(last_updated.timestamp()))
+
+
+def progress_from_score(score):
+    return int(score // SCORE_TIME_SPAN)
+
+
+class _Node:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class IndexableSkipList:
+    """Sorted keys with O(log n) insert, delete, rank and rank lookup.
+
+    Every forward link records how many nodes it skips, the same layout
+    Redis uses for its sorted sets, so ranks are summed along the search path.
+    """
+
+    MAX_LEVEL = 32
+
+    def __init__(self, seed=None):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self.length
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and self._random.random() < 0.25:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = self.length
+            self.level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.length += 1
+
+    def remove(self, key):
+        update = [None] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        target = node.forward[0]
+        if target is None or target.key != key:
+            return False
+        for i in range(self.level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+        return True
+
+    def rank(self, key):
+        """0-based position of key, or None if absent."""
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if node.key == key:
+                return traversed - 1
+        return None
+
+    def slice(self, start, stop):
+        """Keys at 0-based positions start..stop-1."""
+        start = max(start, 0)
+        stop = min(stop, self.length)
+        if start >= stop:
+            return []
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and traversed + node.span[i] <= start + 1:
+                traversed += node.span[i]
+                node = node.forward[i]
+        keys = []
+        while node is not None and len(keys) < stop - start:
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+
+class InMemoryLeaderboard:
+    """Per-process leaderboards on skiplists; for tests and single-process setups."""
+
+    def __init__(self):
+        self._boards = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _board(self, challenge_id):
+        if challenge_id not in self._boards:
+            self._boards[challenge_id] = IndexableSkipList()
+            self._keys[challenge_id] = {}
+        return self._boards[challenge_id], self._keys[challenge_id]
+
+    def update_many(self, challenge_id, entries):
+        """Set the (user_id, progress, last_updated) entries on a challenge's board."""
+        with self._lock:
+            board, keys = self._board(challenge_id)
+            for user_id, progress, last_updated in entries:
+                old = keys.get(user_id)
+                if old is not None:
+                    board.remove(old)
+                key = (-leaderboard_score(progress, last_updated), -user_id)
+                board.insert(key)
+                keys[user_id] = key
+
+    def remove(self, challenge_id, user_id):
+        with self._lock:
+            board, keys = self._board(challenge_id)
+            key = keys.pop(user_id, None)
+            if key is not None:
+                board.remove(key)
+
+    def clear(self, challenge_id):
+        with self._lock:
+            self._boards.pop(challenge_id, None)
+            self._keys.pop(challenge_id, None)
+
+    def count(self, challenge_id):
+        with self._lock:
+            return len(self._board(challenge_id)[0])
+
+    def rank(self, challenge_id, user_id):
+        with self._lock:
+            board, keys = self._board(challenge_id)
+            key = keys.get(user_id)
+            return board.rank(key) if key is not None else None
+
+    def range(self, challenge_id, start, stop):
+        """[(user_id, progress)] for 0-based ranks start..stop-1."""
+        with self._lock:
+            board, _ = self._board(challenge_id)
+            return [(-user_id, progress_from_score(-score)) for score, user_id in board.slice(start, stop)]
+
+
+class RedisLeaderboard:
+    """Leaderboards stored as Redis sorted sets, shared by every process."""
+
+    key_prefix = 'leaderboard'
+
+    def __init__(self, url=None):
+        import redis
+        self.redis = redis.Redis.from_url(url or settings.LEADERBOARD_REDIS_URL)
+
+    def _key(self, challenge_id):
+        return f'{self.key_prefix}:{challenge_id}'
+
+    @staticmethod
+    def _member(user_id):
+        return f'{user_id:0{MEMBER_WIDTH}d}'
+
+    def update_many(self, challenge_id, entries):
+        mapping = {
+            self._member(user_id): leaderboard_score(progress, last_updated)
+            for user_id, progress, last_updated in entries
+        }
+        if mapping:
+            self.redis.zadd(self._key(challenge_id), mapping)
+
+    def remove(self, challenge_id, user_id):
+        self.redis.zrem(self._key(challenge_id), self._member(user_id))
+
+    def clear(self, challenge_id):
+        self.redis.delete(self._key(challenge_id))
+
+    def count(self, challenge_id):
+        return self.redis.zcard(self._key(challenge_id))
+
+    def rank(self, challenge_id, user_id):
+        return self.redis.zrevrank(self._key(challenge_id), self._member(user_id))
+
+    def range(self, challenge_id, start, stop):
+        if stop <= start:
+            return []
+        rows = self.redis.zrevrange(self._key(challenge_id), max(start, 0), stop - 1, withscores=True)
+        return [(int(member), progress_from_score(score)) for member, score in rows]
+
+
+@lru_cache(maxsize=None)
+def get_leaderboard():
+    return import_string(settings.LEADERBOARD_BACKEND)()
+
+
+def record_progress(user_challenges):
+    """Push the current progress of UserChallenge rows to their leaderboards."""
+    by_challenge = {}
+    for user_challenge in user_challenges:
+        by_challenge.setdefault(user_challenge.challenge_id, []).append(
+            (user_challenge.user_id, user_challenge.progress, user_challenge.last_updated)
+        )
+    leaderboard = get_leaderboard()
+    for challenge_id, entries in by_challenge.items():
+        leaderboard.update_many(challenge_id, entries)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from api.models import User
+from api.rollups import rebuild_daily_progress
+
+class Command(BaseCommand):
+    help = 'Rebuilds the DailyProgress rollup from completed workout history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', help='Username to rebuild (repeatable); defaults to everyone')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of users rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+        user_ids = list(users.values_list('id', flat=True))
+
+        chunk_size = options['chunk_size']
+        total_rows = 0
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            total_rows += rebuild_daily_progress(chunk)
+            self.stdout.write(f"Rebuilt progress for {start + len(chunk)}/{len(user_ids)} users")
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully wrote {total_rows} daily progress rows'))
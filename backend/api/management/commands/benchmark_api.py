@@ -0,0 +1,308 @@
+import json
+import logging
+import subprocess
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api import urls as api_urls
+from api.models import (
+    CompletedExercise, CompletedWorkout, Exercise, ExerciseOfTheDay, MuscleGroup, Reminder, Routine, RoutineExercise,
+    User, UserChallenge, UserChallengeExercise, WorkoutChallenge,
+)
+
+API_PREFIX = '/api/'
+METHODS = ('get', 'post', 'put', 'patch', 'delete')
+
+# (method, path, body, writes). Paths are filled in from the benchmark
+# user's rows; a scenario whose rows are missing is skipped.
+SCENARIOS = [
+    ('get', 'users/', None, False),
+    ('get', 'users/{user}/', None, False),
+    ('get', 'muscle-groups/', None, False),
+    ('get', 'muscle-groups/{muscle_group}/', None, False),
+    ('get', 'exercises/', None, False),
+    ('get', 'exercises/?page_size=100', None, False),
+    ('get', 'exercises/?stream=1', None, False),
+    ('get', 'exercises/{exercise}/', None, False),
+    ('get', 'exercises/search/?q=press', None, False),
+    ('get', 'exercises/favorites/', None, False),
+    ('get', 'favorite-exercises/', None, False),
+    ('get', 'exercise-types/', None, False),
+    ('get', 'routines/', None, False),
+    ('get', 'routines/{routine}/', None, False),
+    ('get', 'routines/{routine}/detail/', None, False),
+    ('get', 'routine-exercises/', None, False),
+    ('get', 'routine-exercises/{routine_exercise}/', None, False),
+    ('get', 'completed-exercises/', None, False),
+    ('get', 'completed-exercises/{completed_exercise}/', None, False),
+    ('get', 'reminders/', None, False),
+    ('get', 'reminders/{reminder}/', None, False),
+    ('get', 'exercise-of-the-day/', None, False),
+    ('get', 'exercise-of-the-day/today/', None, False),
+    ('get', 'exercise-of-the-day/{exercise_of_the_day}/', None, False),
+    ('get', 'workout-challenges/', None, False),
+    ('get', 'workout-challenges/{challenge}/', None, False),
+    ('get', 'workout-challenges/{challenge}/leaderboard/?around_me=1', None, False),
+    ('get', 'user-challenges/', None, False),
+    ('get', 'user-challenges/{user_challenge}/', None, False),
+    ('get', 'user-profile/', None, False),
+    ('get', 'progress/', None, False),
+    ('get', 'progress/?start_date={year_ago}', None, False),
+    ('get', 'db-pool-stats/', None, False),
+    ('post', 'login/', {'username': '{username}', 'password': '{password}'}, False),
+    # Writes that leave the data set as it was, or only grow history.
+    ('post', 'exercises/toggle_favorite/', {'exercise_id': '{exercise}'}, True),
+    ('post', 'toggle-favorite-exercise/', {'exercise_id': '{exercise}'}, True),
+    ('post', 'workout-challenges/{challenge}/join/', None, True),
+    ('post', 'user-challenges/{user_challenge}/update_progress/', {'exercise_id': '{challenge_exercise}'}, True),
+    ('put', 'update-profile/', {'name': '{name}'}, True),
+    ('post', 'completed-workouts/', {'routine': '{routine}'}, True),
+    ('post', 'completed-workouts/batch/', {'sessions': [{
+        'routine': '{routine}', 'idempotency_key': '{key}', 'started_at': '{now}', 'duration': '00:45:00', 'exercises': [
+        {'routine_exercise': '{routine_exercise}', 'sets_completed': 3, 'reps_completed': 10},
+    ]}]}, True),
+]
+
+
+def api_routes(patterns=None, prefix=''):
+    """Every (route, method) the API urlconf serves, format suffix variants aside."""
+    routes = []
+    for pattern in api_urls.urlpatterns if patterns is None else patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            routes += api_routes(pattern.url_patterns, route)
+            continue
+        if 'format' in pattern.pattern.regex.groupindex or pattern.name == 'api-root':
+            continue
+        callback = pattern.callback
+        actions = getattr(callback, 'actions', None)
+        if actions is None:
+            view_class = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+            actions = [method for method in METHODS if hasattr(view_class, method)] if view_class else ['get']
+        routes += [(route, method) for method in actions if method in METHODS]
+    return routes
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def fill(template, sample):
+    if isinstance(template, str):
+        value = template.format(**sample)
+        return int(value) if template.startswith('{') and value.isdigit() else value
+    if isinstance(template, list):
+        return [fill(item, sample) for item in template]
+    if isinstance(template, dict):
+        return {key: fill(value, sample) for key, value in template.items()}
+    return template
+
+
+class Command(BaseCommand):
+    help = 'Drives the API routes under concurrency and reports latency percentiles, throughput and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username the requests authenticate as')
+        parser.add_argument('--password', default='loadtest', help="The user's password, for the login route")
+        parser.add_argument('--requests', type=int, default=100, help='Timed requests per route')
+        parser.add_argument('--concurrency', type=int, default=4, help='Threads issuing requests at once')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route first')
+        parser.add_argument(
+            '--writes', action='store_true',
+            help='Also drive the write routes; they add workouts and toggle rows, and contend for the lock on SQLite',
+        )
+        parser.add_argument('--route', action='append', dest='routes', help='Only paths containing this (repeatable)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='A previous --output file to compare p95 latency and throughput against')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist; see generate_synthetic_load")
+        token, _ = Token.objects.get_or_create(user=user)
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        self.host = next((host for host in settings.ALLOWED_HOSTS if host and '*' not in host and not host.startswith('.')), 'localhost')
+        sample = self.sample(user, options['password'])
+
+        results, skipped, covered = [], [], set()
+        for method, template, body, writes in SCENARIOS:
+            if writes and not options['writes']:
+                continue
+            if options['routes'] and not any(part in template for part in options['routes']):
+                continue
+            try:
+                path = fill(template, sample)
+                fill(body, dict(sample, key=''))
+            except KeyError as missing:
+                skipped.append({'method': method.upper(), 'path': template, 'reason': f'no {missing.args[0]} row'})
+                continue
+            covered.add((resolve('/' + path.split('?')[0], urlconf=api_urls).route, method))
+            result = self.run_route(method, path, body, sample, options)
+            # Paths hold this data set's ids and today's dates; runs are
+            # compared by the scenario they were filled in from.
+            result['scenario'] = template
+            results.append(result)
+            self.stdout.write(
+                '{method} {path}: p50 {p50_ms} ms, p95 {p95_ms} ms, p99 {p99_ms} ms, '
+                '{throughput_rps} req/s, {queries_per_request} queries, {statuses}'.format(**result)
+            )
+
+        uncovered = [
+            {'method': method.upper(), 'route': route}
+            for route, method in api_routes() if (route, method) not in covered
+        ]
+        report = {
+            'commit': self.commit(),
+            'database': connection.vendor,
+            'generated_at': timezone.now().isoformat(),
+            'options': {key: options[key] for key in ('user', 'requests', 'concurrency', 'warmup', 'writes')},
+            'rows': {
+                'users': User.objects.count(),
+                'completed_workouts': CompletedWorkout.objects.count(),
+                'completed_exercises': CompletedExercise.objects.count(),
+                'user_challenges': UserChallenge.objects.count(),
+            },
+            'results': results,
+            'skipped': skipped,
+            'not_driven': uncovered,
+        }
+        self.stdout.write(f'{len(results)} scenarios run, {len(skipped)} skipped, {len(uncovered)} route methods not driven')
+
+        if options['compare']:
+            self.compare(report, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+    def sample(self, user, password):
+        """Ids of rows the benchmark user can reach, keyed as in the scenario paths."""
+        user_challenge = UserChallenge.objects.filter(user=user).values_list('id', 'challenge_id').first()
+        rows = {
+            'user': user.pk,
+            'username': user.username,
+            'password': password,
+            'name': user.name,
+            'now': timezone.now().isoformat(),
+            'year_ago': (timezone.now() - timezone.timedelta(days=365)).date().isoformat(),
+            'muscle_group': MuscleGroup.objects.values_list('id', flat=True).first(),
+            'exercise': Exercise.objects.values_list('id', flat=True).first(),
+            'routine': Routine.objects.filter(user=user).values_list('id', flat=True).first(),
+            'completed_exercise': CompletedExercise.objects.filter(completed_workout__user=user).values_list('id', flat=True).first(),
+            'reminder': Reminder.objects.filter(user=user).values_list('id', flat=True).first(),
+            'exercise_of_the_day': ExerciseOfTheDay.objects.values_list('id', flat=True).first(),
+            'challenge': user_challenge[1] if user_challenge else WorkoutChallenge.objects.values_list('id', flat=True).first(),
+            'user_challenge': user_challenge[0] if user_challenge else None,
+            'challenge_exercise': UserChallengeExercise.objects.filter(
+                user_challenge_id=user_challenge[0]
+            ).values_list('exercise_id', flat=True).first() if user_challenge else None,
+        }
+        rows['routine_exercise'] = RoutineExercise.objects.filter(routine_id=rows['routine']).values_list('id', flat=True).first()
+        # Missing rows raise KeyError in fill(), which skips the scenario.
+        return {key: value for key, value in rows.items() if value is not None}
+
+    def run_route(self, method, path, body, sample, options):
+        latencies, queries, statuses = [], [], Counter()
+        lock = threading.Lock()
+        remaining = [options['warmup'] + options['requests']]
+
+        def worker():
+            client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+            try:
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                        timed = remaining[0] < options['requests']
+                    data = fill(body, dict(sample, key=uuid.uuid4().hex))
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        response = getattr(client, method)(
+                            API_PREFIX + path, data=json.dumps(data) if data is not None else None,
+                            content_type='application/json', **self.headers,
+                        )
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        elapsed = time.perf_counter() - started
+                    if timed:
+                        with lock:
+                            latencies.append(elapsed)
+                            queries.append(len(captured))
+                            statuses[response.status_code] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        # Every 4xx/5xx would otherwise be logged; they are counted in statuses.
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            request_logger.setLevel(level)
+        wall = time.perf_counter() - started
+        # Throughput over the timed share of the wall clock.
+        wall *= options['requests'] / (options['warmup'] + options['requests'])
+
+        latencies.sort()
+        ms = lambda seconds: round(seconds * 1000, 2)
+        return {
+            'method': method.upper(),
+            'path': path,
+            'requests': len(latencies),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'p50_ms': ms(percentile(latencies, 50)),
+            'p95_ms': ms(percentile(latencies, 95)),
+            'p99_ms': ms(percentile(latencies, 99)),
+            'mean_ms': ms(sum(latencies) / len(latencies)),
+            'throughput_rps': round(len(latencies) / wall, 1),
+            'queries_per_request': round(sum(queries) / len(queries), 2),
+        }
+
+    def compare(self, report, baseline_path):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        before = {(item['method'], item.get('scenario', item['path'])): item for item in baseline['results']}
+        self.stdout.write(f"Against {baseline_path} (commit {baseline.get('commit') or 'unknown'}):")
+        for item in report['results']:
+            old = before.get((item['method'], item['scenario']))
+            if old is None:
+                continue
+            p95 = (item['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            rps = (item['throughput_rps'] - old['throughput_rps']) / old['throughput_rps'] * 100 if old['throughput_rps'] else 0
+            style = self.style.WARNING if p95 > 10 else self.style.SUCCESS
+            self.stdout.write(style(
+                f"  {item['method']} {item['path']}: p95 {p95:+.1f}%, throughput {rps:+.1f}%, "
+                f"queries {old['queries_per_request']} -> {item['queries_per_request']}"
+            ))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.utils import CursorWrapper
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+from api.models import User
+
+ENDPOINTS = {
+    'progress': '/api/progress/',
+    'exercises': '/api/exercises/',
+    'routines': '/api/routines/',
+    'exercise-of-the-day': '/api/exercise-of-the-day/today/',
+}
+
+
+@contextmanager
+def database_latency(seconds):
+    """Add a fixed round trip to every query, standing in for a remote database."""
+    execute = CursorWrapper.execute
+
+    def slow_execute(self, *args, **kwargs):
+        time.sleep(seconds)
+        return execute(self, *args, **kwargs)
+
+    with mock.patch.object(CursorWrapper, 'execute', slow_execute):
+        yield
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares requests per second of one WSGI worker and one ASGI worker serving the read endpoints '
+        'under database latency. Requests go through the full handler and middleware stack; '
+        'set ASYNC_READ_ENDPOINTS to choose which views they reach.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), action='append', dest='endpoints', help='Endpoint to benchmark (repeatable); defaults to all')
+        parser.add_argument('--user', required=True, help='Username the requests authenticate as')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once on the ASGI worker')
+        parser.add_argument('--latency-ms', type=float, default=20.0, help='Simulated database round trip per query')
+        parser.add_argument('--host', help='Host header to send; defaults to the first ALLOWED_HOSTS entry')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+        token, _ = Token.objects.get_or_create(user=user)
+        host = options['host'] or next((host for host in settings.ALLOWED_HOSTS if host and '*' not in host), 'localhost')
+        headers = {'Authorization': f'Token {token.key}', 'Host': host}
+        wsgi, asgi = get_wsgi_application(), get_asgi_application()
+
+        results = []
+        for name in options['endpoints'] or sorted(ENDPOINTS):
+            path = ENDPOINTS[name]
+            # Warm caches so both workers measure steady state.
+            self.wsgi_request(wsgi, path, headers)
+
+            with database_latency(options['latency_ms'] / 1000):
+                wsgi_seconds = self.run_wsgi(wsgi, path, headers, options['requests'])
+                asgi_seconds = asyncio.run(self.run_asgi(asgi, path, headers, options['requests'], options['concurrency']))
+
+            result = {
+                'endpoint': name,
+                'async_views': settings.ASYNC_READ_ENDPOINTS,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'latency_ms': options['latency_ms'],
+                'wsgi_rps': round(options['requests'] / wsgi_seconds, 1),
+                'asgi_rps': round(options['requests'] / asgi_seconds, 1),
+            }
+            result['speedup'] = round(result['asgi_rps'] / result['wsgi_rps'], 2)
+            results.append(result)
+            self.stdout.write(
+                f"{name}: WSGI {result['wsgi_rps']} req/s, ASGI {result['asgi_rps']} req/s ({result['speedup']}x)"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+    def run_wsgi(self, application, path, headers, count):
+        # A sync worker serves one request at a time.
+        started = time.perf_counter()
+        for _ in range(count):
+            self.wsgi_request(application, path, headers)
+        return time.perf_counter() - started
+
+    async def run_asgi(self, application, path, headers, count, concurrency):
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with slots:
+                await self.asgi_request(application, path, headers)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(count)))
+        return time.perf_counter() - started
+
+    def wsgi_request(self, application, path, headers):
+        environ = RequestFactory().get(path).environ
+        environ.update({'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()})
+        environ['SERVER_NAME'] = headers['Host']
+        statuses = []
+        body = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+        try:
+            for _ in body:
+                pass
+        finally:
+            body.close()
+        self.check_status(int(statuses[0].split()[0]))
+
+    async def asgi_request(self, application, path, headers):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': '',
+            'query_string': b'',
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            'server': (headers['Host'], 80),
+            'client': ('127.0.0.1', 0),
+        }
+        statuses = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await application(scope, receive, send)
+        self.check_status(statuses[0])
+
+    def check_status(self, status_code):
+        if status_code != 200:
+            raise CommandError(f'Benchmark request failed with status {status_code}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.catalog import dedupe_catalog
+
+
+class Command(BaseCommand):
+    help = 'Merges duplicate muscle groups and exercises, moving every reference to the surviving row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change and roll it back')
+        parser.add_argument('--only', choices=['muscle-groups', 'exercises'], help='Merge only one of the two tables')
+
+    def handle(self, *args, **options):
+        report = dedupe_catalog(
+            muscle_groups=options['only'] in (None, 'muscle-groups'),
+            exercises=options['only'] in (None, 'exercises'),
+            dry_run=options['dry_run'],
+        )
+        verb = 'Would merge' if options['dry_run'] else 'Merged'
+        for kind in ('muscle_groups', 'exercises'):
+            for key, survivor, duplicates in report[kind]:
+                self.stdout.write(f"{verb} {kind.replace('_', ' ')[:-1]} {key}: {', '.join(map(str, duplicates))} into {survivor}")
+        for table, (repointed, dropped) in sorted(report['references'].items()):
+            self.stdout.write(f'  {table}: {repointed} rows re-pointed, {dropped} duplicate rows dropped')
+
+        removed = {kind: sum(len(duplicates) for _, _, duplicates in report[kind]) for kind in ('muscle_groups', 'exercises')}
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} away {removed['muscle_groups']} duplicate muscle groups and {removed['exercises']} duplicate exercises"
+        ))
@@ -1,39 +1,40 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from api.models import WorkoutChallenge, Exercise
-from datetime import timedelta
-import random
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
 
-class Command(BaseCommand):
-    help = 'Generates workout challenges based on exercise types'
-
-    def handle(self, *args, **kwargs):
-        exercise_types = ['Strength', 'Cardio', 'Flexibility', 'Balance', 'Plyometric', 'Bodyweight']
-
-        for exercise_type in exercise_types:
-            exercises = Exercise.objects.filter(exercise_type=exercise_type)
-
-            if exercises.exists():
-                challenge_name = f"{exercise_type} Challenge"
-                description = f"A 30-day challenge focusing on {exercise_type.lower()} exercises to improve your overall fitness."
-                start_date = timezone.now().date()
-                end_date = start_date + timedelta(days=30)
-                goal = random.randint(15, 25)
-                difficulty = random.choice(['Easy', 'Medium', 'Hard'])
+from api.challenge_calendar import CADENCES, DIFFICULTIES, EXERCISE_TYPES, PLAN_DAYS_AHEAD, plan_challenge_calendar
 
-                challenge = WorkoutChallenge.objects.create(
-                    name=challenge_name,
-                    description=description,
-                    start_date=start_date,
-                    end_date=end_date,
-                    goal=goal,
-                    difficulty=difficulty,
-                    exercise_type=exercise_type
-                )
 
-                selected_exercises = random.sample(list(exercises), min(5, exercises.count()))
-                challenge.exercises.set(selected_exercises)
-
-                self.stdout.write(self.style.SUCCESS(f'Successfully created {challenge_name}'))
-
-        self.stdout.write(self.style.SUCCESS('Finished generating challenges'))
+class Command(BaseCommand):
+    help = 'Plans rotating weekly and monthly workout challenges per exercise type and difficulty'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=PLAN_DAYS_AHEAD, help='How far ahead to plan')
+        parser.add_argument('--start', help='First day to plan from (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--cadence', choices=CADENCES, action='append', dest='cadences', help='Repeatable; defaults to all')
+        parser.add_argument('--type', choices=EXERCISE_TYPES, action='append', dest='exercise_types', help='Repeatable; defaults to all')
+        parser.add_argument('--difficulty', choices=DIFFICULTIES, action='append', dest='difficulties', help='Repeatable; defaults to all')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed always plans the same exercises')
+        parser.add_argument('--dry-run', action='store_true', help='List the challenges without creating them')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['start']:
+            start = parse_date(options['start'])
+            if start is None:
+                raise CommandError('--start must be a date in YYYY-MM-DD format')
+
+        planned = plan_challenge_calendar(
+            start=start,
+            days=options['days'],
+            cadences=options['cadences'] or CADENCES,
+            exercise_types=options['exercise_types'] or EXERCISE_TYPES,
+            difficulties=options['difficulties'] or DIFFICULTIES,
+            seed=options['seed'],
+            dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            for challenge in planned:
+                self.stdout.write(f'{challenge.name}: exercises {challenge.exercise_ids}, goal {challenge.goal}')
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(planned)} challenges'))
@@ -0,0 +1,187 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.challenges import challenge_exercise_ids, enroll_users
+from api.leaderboards import record_progress
+from api.models import (
+    CompletedExercise, CompletedWorkout, Exercise, Routine, RoutineExercise, User, UserChallenge,
+    UserChallengeExercise, WorkoutChallenge,
+)
+from api.rollups import apply_workouts_bulk
+from api.versioning import batched_data_version_bumps, bump_data_version
+
+ROUTINE_NAMES = ['Push Day', 'Pull Day', 'Leg Day', 'Full Body', 'Morning Cardio', 'Core', 'Mobility', 'Upper Body']
+
+
+class Command(BaseCommand):
+    help = 'Bulk-creates synthetic users with routines, workout history and challenge enrollments for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, required=True)
+        parser.add_argument('--workouts-per-user', type=int, required=True, help='Average; each user gets between half and one and a half times this')
+        parser.add_argument('--routines-per-user', type=int, default=3)
+        parser.add_argument('--exercises-per-routine', type=int, default=5)
+        parser.add_argument('--days', type=int, default=90, help='How far back workout history goes')
+        parser.add_argument('--challenge-share', type=float, default=0.3, help='Share of users enrolled in each challenge')
+        parser.add_argument('--prefix', default='loaduser', help='Usernames are <prefix><n>')
+        parser.add_argument('--password', default='loadtest', help='Password of every generated user')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Users written per transaction')
+        parser.add_argument('--seed', type=int, help='Seed for a reproducible data set')
+
+    def handle(self, *args, **options):
+        exercise_ids = list(Exercise.objects.values_list('id', flat=True))
+        if len(exercise_ids) < options['exercises_per_routine']:
+            raise CommandError('Not enough exercises; run populate_exercises first.')
+
+        self.random = random.Random(options['seed'])
+        self.options = options
+        self.now = timezone.now()
+        # Hashing is deliberately slow, so every user shares one hash.
+        password = make_password(options['password'])
+        # Numbering continues after the highest existing <prefix><n>, so
+        # gaps left by deleted users can't cause collisions.
+        prefix = options['prefix']
+        suffixes = User.objects.filter(username__startswith=prefix).values_list('username', flat=True)
+        first = max((int(name[len(prefix):]) for name in suffixes.iterator() if name[len(prefix):].isdigit()), default=-1) + 1
+        challenges = [
+            (challenge_id, goal, challenge_exercise_ids(challenge_id))
+            for challenge_id, goal in WorkoutChallenge.objects.values_list('id', 'goal')
+        ]
+
+        totals = {'users': 0, 'workouts': 0, 'exercises': 0, 'enrollments': 0}
+        for start in range(first, first + options['users'], options['chunk_size']):
+            stop = min(start + options['chunk_size'], first + options['users'])
+            usernames = [f"{options['prefix']}{n}" for n in range(start, stop)]
+            counts = self.generate_chunk(usernames, password, exercise_ids, challenges)
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(f"{totals['users']}/{options['users']} users, {totals['workouts']} workouts")
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created {users} users, {workouts} workouts, {exercises} completed exercises, '
+            '{enrollments} challenge enrollments'.format(**totals)
+        ))
+
+    def generate_chunk(self, usernames, password, exercise_ids, challenges):
+        options = self.options
+        rng = self.random
+        with transaction.atomic(), batched_data_version_bumps():
+            User.objects.bulk_create([
+                User(username=username, name=username.title(), password=password, gender=rng.choice(['Male', 'Female', 'Other']))
+                for username in usernames
+            ])
+            # The users are new, so everything below is found again through
+            # them; sqlite can't return ids from a bulk insert.
+            user_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+            Token.objects.bulk_create([Token(user_id=user_id, key=Token.generate_key()) for user_id in user_ids])
+
+            Routine.objects.bulk_create([
+                Routine(user_id=user_id, name=name)
+                for user_id in user_ids
+                for name in rng.sample(ROUTINE_NAMES, min(options['routines_per_user'], len(ROUTINE_NAMES)))
+            ])
+            routines = list(Routine.objects.filter(user_id__in=user_ids).values_list('id', 'user_id'))
+            RoutineExercise.objects.bulk_create([
+                RoutineExercise(
+                    routine_id=routine_id,
+                    exercise_id=exercise_id,
+                    sets=rng.randint(2, 5),
+                    reps=rng.choice([5, 8, 10, 12, 15]),
+                )
+                for routine_id, _ in routines
+                for exercise_id in rng.sample(exercise_ids, options['exercises_per_routine'])
+            ], batch_size=1000)
+            routine_exercises = {}
+            for routine_exercise_id, routine_id in RoutineExercise.objects.filter(
+                routine__user_id__in=user_ids
+            ).values_list('id', 'routine_id'):
+                routine_exercises.setdefault(routine_id, []).append(routine_exercise_id)
+
+            user_routines = {}
+            for routine_id, user_id in routines:
+                user_routines.setdefault(user_id, []).append(routine_id)
+            CompletedWorkout.objects.bulk_create(
+                [self.workout(user_id, rng.choice(user_routines[user_id])) for user_id in user_ids for _ in range(self.workout_count())],
+                batch_size=1000,
+            )
+            workouts = list(CompletedWorkout.objects.filter(user_id__in=user_ids))
+
+            # Most sessions log most of their routine; some are cut short.
+            completed_exercises = [
+                CompletedExercise(
+                    completed_workout_id=workout.pk,
+                    routine_exercise_id=routine_exercise_id,
+                    sets_completed=rng.randint(1, 5),
+                    reps_completed=rng.choice([5, 8, 10, 12, 15]),
+                )
+                for workout in workouts
+                for routine_exercise_id in routine_exercises[workout.routine_id]
+                if rng.random() < 0.85
+            ]
+            CompletedExercise.objects.bulk_create(completed_exercises, batch_size=2000)
+            exercise_counts = {}
+            for completed_exercise in completed_exercises:
+                exercise_counts[completed_exercise.completed_workout_id] = exercise_counts.get(completed_exercise.completed_workout_id, 0) + 1
+            apply_workouts_bulk(workouts, exercise_counts)
+
+            enrollments = sum(self.enroll(user_ids, *challenge) for challenge in challenges)
+            for user_id in user_ids:
+                bump_data_version(user_id)
+
+        return {'users': len(user_ids), 'workouts': len(workouts), 'exercises': len(completed_exercises), 'enrollments': enrollments}
+
+    def workout_count(self):
+        average = self.options['workouts_per_user']
+        return self.random.randint(average // 2, average + average // 2)
+
+    def workout(self, user_id, routine_id):
+        rng = self.random
+        # Recent days are busier than old ones and most sessions are in the evening.
+        days_ago = min(int(rng.expovariate(3 / self.options['days'])), self.options['days'] - 1)
+        started_at = (self.now - timedelta(days=days_ago)).replace(
+            hour=min(max(int(rng.gauss(18, 3)), 5), 22), minute=rng.randint(0, 59), second=0, microsecond=0,
+        )
+        if started_at > self.now:
+            started_at -= timedelta(days=1)
+        duration = timedelta(minutes=max(10, int(rng.gauss(45, 15))))
+        return CompletedWorkout(
+            user_id=user_id,
+            routine_id=routine_id,
+            started_at=started_at,
+            completed_at=started_at + duration,
+            duration=duration,
+            calories_burned=int(duration.total_seconds() / 60 * rng.uniform(5, 11)),
+        )
+
+    def enroll(self, user_ids, challenge_id, goal, exercise_ids):
+        """Enroll a share of the users and complete part of their challenge exercises."""
+        rng = self.random
+        chosen = [user_id for user_id in user_ids if rng.random() < self.options['challenge_share']]
+        if not chosen or not enroll_users(challenge_id, chosen, exercise_ids):
+            return 0
+
+        rows = UserChallengeExercise.objects.filter(
+            user_challenge__challenge_id=challenge_id, user_challenge__user_id__in=chosen,
+        ).values_list('id', flat=True)
+        done = [row_id for row_id in rows if rng.random() < rng.random()]
+        for start in range(0, len(done), 1000):
+            UserChallengeExercise.objects.filter(id__in=done[start:start + 1000]).update(
+                completed=True, completed_date=self.now,
+            )
+
+        user_challenges = UserChallenge.objects.filter(challenge_id=challenge_id, user_id__in=chosen)
+        completed = UserChallengeExercise.objects.filter(
+            user_challenge=OuterRef('pk'), completed=True,
+        ).values('user_challenge').annotate(count=Count('id')).values('count')
+        user_challenges.update(progress=Coalesce(Subquery(completed), 0), last_updated=self.now)
+        user_challenges.filter(progress__gte=goal).update(completed=True)
+        transaction.on_commit(lambda: record_progress(list(user_challenges)))
+        return len(chosen)
@@ -0,0 +1,134 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from api.models import (
+    CompletedExercise, CompletedWorkout, DailyProgress, Exercise, Reminder, Routine, UserChallenge,
+    UserChallengeExercise,
+)
+from api.pagination import ExerciseKeysetPagination, rows_after
+from api.tasks import MISSED_EXERCISE_MESSAGE
+from api.utils import day_bounds
+
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(.*)')
+
+
+def hot_queries(sample):
+    """(name, queryset, (model, index) the shape relies on or None) for each hot path.
+
+    The index is named by a Meta.indexes entry, or by a field whose own
+    db_index serves the shape. The querysets mirror the ones the endpoints
+    and tasks run, filled in with ids from `sample`.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    month_ago = today - timedelta(days=30)
+    today_start, today_end = day_bounds(today)
+    yield 'progress view: DailyProgress by user and date range', DailyProgress.objects.filter(
+        user_id=sample['user'], date__range=[month_ago, today]
+    ).order_by('date'), None
+    yield 'rollup rebuild: CompletedWorkout history by user and day', CompletedWorkout.objects.filter(
+        user_id=sample['user'], started_at__gte=day_bounds(month_ago)[0]
+    ).order_by('started_at'), (CompletedWorkout, 'completedworkout_user_start')
+    # Reached through the routine's exercises; the day is checked on each
+    # joined workout by primary key, so no started_at index takes part.
+    yield 'missed-exercise chunk: CompletedExercise by routine and day', CompletedExercise.objects.filter(
+        routine_exercise__routine=sample['routine'],
+        completed_workout__started_at__gte=today_start,
+        completed_workout__started_at__lt=today_end,
+    ).values('routine_exercise__routine').annotate(count=Count('id')), (CompletedExercise, 'routine_exercise')
+    yield 'send_reminders: due unsent reminders', Reminder.objects.filter(
+        is_sent=False, reminder_time__lte=now
+    ).order_by('reminder_time')[:500], (Reminder, 'reminder_due')
+    yield 'missed-exercise chunk: users already reminded today', Reminder.objects.filter(
+        user__id__range=(sample['user'], sample['user'] + 1000),
+        message=MISSED_EXERCISE_MESSAGE,
+        reminder_time__gte=today_start,
+        reminder_time__lt=today_end,
+    ).values_list('user_id', flat=True), (Reminder, 'reminder_user_time')
+    yield 'routines list: routines by user', Routine.objects.filter(user_id=sample['user']), None
+    yield 'update_progress: challenge exercise to flip', UserChallengeExercise.objects.filter(
+        user_challenge_id=sample['user_challenge'], exercise_id=sample['exercise'], completed=False
+    ), None
+    yield 'rebuild_leaderboards: participants by challenge', UserChallenge.objects.filter(
+        challenge_id=sample['challenge']
+    ).values_list('user_id', 'progress', 'last_updated'), None
+    yield 'exercise keyset page', rows_after(
+        Exercise.objects.all(), ExerciseKeysetPagination.ordering, (sample['muscle_group'], 0),
+    ).order_by(*ExerciseKeysetPagination.ordering)[:100], (Exercise, 'exercise_group_id')
+
+
+def plan_problems(plan):
+    """Sequential scans and explicit sorts in an EXPLAIN plan."""
+    problems = []
+    if connection.vendor == 'postgresql':
+        problems += [f'sequential scan on {table}' for table in SEQ_SCAN.findall(plan)]
+        problems += ['sort' for line in plan.splitlines() if line.strip().lstrip('-> ').startswith('Sort ')]
+    else:
+        problems += [f'full scan of {table}' for table, rest in SQLITE_SCAN.findall(plan) if 'USING' not in rest]
+        problems += ['sort' for line in plan.splitlines() if 'TEMP B-TREE' in line]
+    return problems
+
+
+class Command(BaseCommand):
+    help = 'EXPLAINs the queries behind the hot endpoints and tasks, flagging scans and sorts and proposing indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-analyze', action='store_true', help='Plan only; skip EXPLAIN ANALYZE (which runs the queries)')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only the flagged ones')
+
+    def handle(self, *args, **options):
+        sample = {
+            'user': Routine.objects.values_list('user_id', flat=True).first(),
+            'routine': Routine.objects.values_list('id', flat=True).first(),
+            'user_challenge': UserChallengeExercise.objects.values_list('user_challenge_id', flat=True).first(),
+            'exercise': UserChallengeExercise.objects.values_list('exercise_id', flat=True).first(),
+            'challenge': UserChallenge.objects.values_list('challenge_id', flat=True).first(),
+            'muscle_group': Exercise.objects.values_list('muscle_group_id', flat=True).first(),
+        }
+        if sample['user'] is None:
+            raise CommandError('Need at least one routine to sample ids from; see generate_synthetic_load.')
+        sample = {key: value or 0 for key, value in sample.items()}
+
+        explain_options = {}
+        if connection.vendor == 'postgresql' and not options['no_analyze']:
+            explain_options = {'analyze': True, 'buffers': True}
+
+        flagged = 0
+        for name, queryset, index in hot_queries(sample):
+            plan = queryset.explain(**explain_options)
+            problems = plan_problems(plan)
+            style = self.style.WARNING if problems else self.style.SUCCESS
+            self.stdout.write(style(f"{name}: {', '.join(problems) or 'ok'}"))
+            if problems or options['verbose_plans']:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+            if problems:
+                flagged += 1
+                self.propose(index)
+
+        self.stdout.write(f'{flagged} query shapes flagged')
+
+    def propose(self, index):
+        if index is None:
+            self.stdout.write('    no index proposed; small tables are often scanned regardless')
+            return
+        model, name = index
+        existing = connection.introspection.get_constraints(connection.cursor(), model._meta.db_table)
+        index = next((index for index in model._meta.indexes if index.name == name), None)
+        if index is None:
+            # A field's own db_index, named by the backend.
+            field = model._meta.get_field(name)
+            found = any(info['index'] and info['columns'] == [field.column] for info in existing.values())
+        else:
+            found = name in existing
+        if found:
+            self.stdout.write(f'    {name} index exists; the planner may prefer a scan on a small table or stale statistics (ANALYZE)')
+            return
+        with connection.schema_editor(collect_sql=True) as editor:
+            sql = editor._create_index_sql(model, fields=[field]) if index is None else index.create_sql(model, editor)
+            self.stdout.write(f'    proposed (shipped in migrations): {sql}')
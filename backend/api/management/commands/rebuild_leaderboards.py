@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from api.leaderboards import get_leaderboard
+from api.models import UserChallenge, WorkoutChallenge
+
+class Command(BaseCommand):
+    help = 'Rebuilds challenge leaderboards from UserChallenge progress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--challenge', type=int, action='append', dest='challenges', help='Challenge id to rebuild (repeatable); defaults to all')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        challenge_ids = options['challenges'] or list(WorkoutChallenge.objects.values_list('id', flat=True))
+        leaderboard = get_leaderboard()
+
+        for challenge_id in challenge_ids:
+            leaderboard.clear(challenge_id)
+            rows = UserChallenge.objects.filter(challenge_id=challenge_id).values_list(
+                'user_id', 'progress', 'last_updated'
+            ).iterator(chunk_size=options['chunk_size'])
+            entries = []
+            for entry in rows:
+                entries.append(entry)
+                if len(entries) >= options['chunk_size']:
+                    leaderboard.update_many(challenge_id, entries)
+                    entries = []
+            leaderboard.update_many(challenge_id, entries)
+            self.stdout.write(f"Rebuilt leaderboard for challenge {challenge_id}: {leaderboard.count(challenge_id)} entries")
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {len(challenge_ids)} leaderboards'))
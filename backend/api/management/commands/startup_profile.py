@@ -0,0 +1,111 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What each kind of process loads before it can serve its first request or task.
+TARGETS = {
+    'setup': 'import django; django.setup()',
+    'web': (
+        'from django.core.wsgi import get_wsgi_application; get_wsgi_application(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    ),
+    'worker': (
+        'import django; django.setup(); '
+        'from exercise_tracker.celery import app; app.loader.import_default_modules(); app.finalize()'
+    ),
+}
+
+SCRIPT = '''
+import json, time
+started = time.perf_counter()
+{code}
+print(json.dumps({{"wall_ms": (time.perf_counter() - started) * 1000}}))
+'''
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from `python -X importtime` output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Reports process boot time and per-module import cost, like python -X importtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), action='append', dest='targets', help='Process kind to profile (repeatable); defaults to all')
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per target; medians are reported')
+        parser.add_argument('--top', type=int, default=15, help='Number of modules and packages to list')
+        parser.add_argument('--budget-ms', type=float, help='Fail if any target boots slower than this')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = [self.profile(target, options['runs'], options['top']) for target in options['targets'] or sorted(TARGETS)]
+        for result in results:
+            self.report(result)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+        over = [result['target'] for result in results if options['budget_ms'] and result['wall_ms'] > options['budget_ms']]
+        if over:
+            raise CommandError(f"Over the {options['budget_ms']}ms startup budget: {', '.join(over)}")
+
+    def profile(self, target, runs, top):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE))
+        walls = []
+        self_times = defaultdict(list)
+        for _ in range(runs):
+            process = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', SCRIPT.format(code=TARGETS[target])],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if process.returncode != 0:
+                raise CommandError(f'{target} failed to start:\n{process.stderr[-2000:]}')
+            walls.append(json.loads(process.stdout.strip().splitlines()[-1])['wall_ms'])
+            for name, self_us, _ in parse_importtime(process.stderr):
+                self_times[name].append(self_us)
+
+        modules = {name: statistics.median(times) / 1000 for name, times in self_times.items()}
+        packages = defaultdict(float)
+        for name, ms in modules.items():
+            packages[name.split('.')[0]] += ms
+        return {
+            'target': target,
+            'runs': runs,
+            'wall_ms': round(statistics.median(walls), 1),
+            'import_ms': round(sum(modules.values()), 1),
+            'modules': len(modules),
+            'top_modules': [
+                {'module': name, 'self_ms': round(ms, 1)}
+                for name, ms in sorted(modules.items(), key=lambda item: -item[1])[:top]
+            ],
+            'top_packages': [
+                {'package': name, 'self_ms': round(ms, 1)}
+                for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:top]
+            ],
+        }
+
+    def report(self, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{result['target']}: {result['wall_ms']}ms to boot, {result['import_ms']}ms importing {result['modules']} modules (median of {result['runs']})"
+        ))
+        self.stdout.write('  slowest packages:')
+        for item in result['top_packages']:
+            self.stdout.write(f"    {item['self_ms']:>8.1f}ms  {item['package']}")
+        self.stdout.write('  slowest modules:')
+        for item in result['top_modules']:
+            self.stdout.write(f"    {item['self_ms']:>8.1f}ms  {item['module']}")
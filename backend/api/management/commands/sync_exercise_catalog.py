@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog import DEFAULT_CATALOG, load_catalog, sync_catalog
+
+
+class Command(BaseCommand):
+    help = 'Inserts and updates exercises from a JSON or CSV catalog file, matching on name and muscle group; never deletes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_CATALOG), help='Catalog file; defaults to the bundled catalog')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without writing them')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            rows = load_catalog(options['path'])
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot load catalog: {error}')
+
+        counts = sync_catalog(rows, dry_run=options['dry_run'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Exercises: {created} created, {updated} updated, {unchanged} unchanged; '
+            '{muscle_groups_created} muscle groups created ({seconds:.2f}s){dry_run}'.format(
+                seconds=time.perf_counter() - started,
+                dry_run=', dry run: nothing was written' if options['dry_run'] else '',
+                **counts,
+            )
+        ))
+        if counts['not_in_catalog']:
+            self.stdout.write(f"{counts['not_in_catalog']} exercises in the database are not in the catalog and were kept")
@@ -0,0 +1,355 @@
+"""Per-process request, SQL and Celery task metrics in Prometheus text format.
+
+Each process aggregates into plain dicts under one lock. With
+METRICS_MULTIPROC_DIR set, every process also dumps its totals to
+`<dir>/<pid>-<token>.json` at most every METRICS_FLUSH_INTERVAL seconds,
+and /metrics sums those files, so one scrape covers all gunicorn and
+Celery workers sharing the directory. The token keeps a reused pid from
+writing over another process's file; when a process first flushes, the
+files of processes that have exited are folded into `archive.json`, so the
+directory stays small and the summed counters never go down.
+"""
+import asyncio
+import atexit
+import fcntl
+import ipaddress
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by URL name, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name and method.'),
+    'http_request_db_queries': ('histogram', 'SQL queries per request by URL name and method.'),
+    'http_request_db_seconds_total': ('counter', 'Time spent in SQL by URL name and method.'),
+    'http_response_size_bytes_total': ('counter', 'Response body bytes by URL name and method.'),
+    'celery_task_duration_seconds': ('histogram', 'api.tasks task run time by task and state.'),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+        self._owner = None
+        self._path = None
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+            histogram['counts'][bisect_left(histogram['buckets'], value)] += 1
+            histogram['sum'] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, list(labels), histogram['buckets'], list(histogram['counts']), histogram['sum']]
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+            }
+
+    def maybe_flush(self, force=False):
+        directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+        now = time.monotonic()
+        if not directory or (not force and now - self._last_flush < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self._last_flush = now
+        if self._owner != (os.getpid(), directory):
+            # First flush of this process (forked workers included).
+            self._owner = (os.getpid(), directory)
+            self._path = os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex}.json')
+            archive_exited_processes(directory)
+        _write_snapshot(self._path, self.snapshot())
+
+
+registry = Registry()
+atexit.register(registry.maybe_flush, force=True)
+
+
+ARCHIVE = 'archive.json'
+
+
+def _write_snapshot(path, snapshot):
+    # Write then rename, so a scrape never reads a half-written file.
+    with open(f'{path}.tmp', 'w') as output:
+        json.dump(snapshot, output)
+    os.replace(f'{path}.tmp', path)
+
+
+def _read_snapshots(directory, filenames):
+    snapshots = []
+    for filename in filenames:
+        try:
+            with open(os.path.join(directory, filename)) as source:
+                snapshots.append(json.load(source))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+@contextmanager
+def _directory_lock(directory, operation):
+    """Archiving holds this exclusively, scrapes shared, so no scrape sees a file in both places."""
+    with open(os.path.join(directory, 'archive.lock'), 'a') as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def archive_exited_processes(directory):
+    """Fold the files of processes that no longer run into ARCHIVE and delete them."""
+    with _directory_lock(directory, fcntl.LOCK_EX):
+        exited = []
+        for filename in os.listdir(directory):
+            pid = filename.split('-', 1)[0]
+            if filename.endswith('.json') and pid.isdigit() and not _process_exists(int(pid)):
+                exited.append(filename)
+        if not exited:
+            return
+        counters, histograms = _merge(_read_snapshots(directory, [ARCHIVE] + exited))
+        _write_snapshot(os.path.join(directory, ARCHIVE), {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [
+                [name, list(labels), histogram['buckets'], histogram['counts'], histogram['sum']]
+                for (name, labels), histogram in histograms.items()
+            ],
+        })
+        for filename in exited:
+            os.remove(os.path.join(directory, filename))
+
+
+def _merged_snapshots():
+    directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+    if not directory:
+        return [registry.snapshot()]
+    registry.maybe_flush(force=True)
+    with _directory_lock(directory, fcntl.LOCK_SH):
+        return _read_snapshots(directory, [filename for filename in os.listdir(directory) if filename.endswith('.json')])
+
+
+def _merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total in snapshot['histograms']:
+            key = (name, tuple(labels))
+            merged = histograms.setdefault(key, {'buckets': buckets, 'counts': [0] * len(counts), 'sum': 0.0})
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], counts)]
+            merged['sum'] += total
+    return counters, histograms
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+LABEL_NAMES = {
+    'http_requests_total': ('view', 'method', 'status'),
+    'http_request_duration_seconds': ('view', 'method'),
+    'http_request_db_queries': ('view', 'method'),
+    'http_request_db_seconds_total': ('view', 'method'),
+    'http_response_size_bytes_total': ('view', 'method'),
+    'celery_task_duration_seconds': ('task', 'state'),
+}
+
+
+def render_metrics():
+    counters, histograms = _merge(_merged_snapshots())
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        names = LABEL_NAMES[name]
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(names, labels)} {value}')
+            continue
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(names, labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(names, labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{_labels(names, labels)} {cumulative}')
+
+    from .db_pool import pool_stats
+    pools = pool_stats()
+    if pools:
+        for stat in ('size', 'in_use', 'idle', 'waiting', 'timeouts', 'checkout_seconds_total'):
+            lines.append(f'# TYPE db_pool_{stat} gauge')
+            for alias, stats in sorted(pools.items()):
+                lines.append(f'db_pool_{stat}{_labels(("alias", "pid"), (alias, os.getpid()))} {stats[stat]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _scrape_allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in getattr(settings, 'METRICS_ALLOWED_NETWORKS', ())
+    )
+
+
+def metrics_view(request):
+    # Hidden unless the scraper sends the token or connects from an allowed network.
+    if not _scrape_allowed(request):
+        return HttpResponseNotFound()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+# The timer of the request being served. sync_to_async copies the context
+# into the threads it runs code in, so queries an async view runs in pool
+# threads are counted against its request too.
+_request_timer = ContextVar('metrics_request_timer', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(sender=None, connection=connection, **kwargs):
+    """connection_created receiver putting every connection's queries through the request timer."""
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _timed_execute)
+
+
+class MetricsMiddleware:
+    """Record latency, SQL queries, DB time, response size and status per URL name.
+
+    Works sync and async, so under ASGI it doesn't push the requests below
+    it onto Django's single thread_sensitive executor thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes the instance look like a coroutine function to Django, as
+            # MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        install_query_timer()
+        timer = _QueryTimer()
+        reset = _request_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timer.reset(reset)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        reset = _request_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timer.reset(reset)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed, timer):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        labels = (view, request.method)
+        registry.inc('http_requests_total', labels + (str(response.status_code),))
+        registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+        registry.observe('http_request_db_queries', labels, timer.queries, QUERY_BUCKETS)
+        registry.inc('http_request_db_seconds_total', labels, timer.seconds)
+        if not response.streaming:
+            registry.inc('http_response_size_bytes_total', labels, len(response.content))
+        registry.maybe_flush()
+
+
+_task_starts = {}
+
+
+def task_started(task_id=None, task=None, **kwargs):
+    if task is not None and task.name.startswith('api.tasks.'):
+        _task_starts[task_id] = time.perf_counter()
+
+
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_starts.pop(task_id, None)
+    if started is not None:
+        registry.observe('celery_task_duration_seconds', (task.name, state or 'UNKNOWN'), time.perf_counter() - started, TASK_BUCKETS)
+        registry.maybe_flush()
@@ -0,0 +1,41 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """WhiteNoise that can sit in an async middleware chain.
+
+    WhiteNoise's middleware is sync-only in every release that supports
+    Django 3.2, and under ASGI Django then runs everything below it in its
+    single thread_sensitive executor thread, so a worker serves one request
+    at a time. Looking a path up is a dict read; only serving a static file
+    touches the disk, and that happens in a pool thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes the instance look like a coroutine function to Django, as
+            # MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            response = await sync_to_async(self.process_request, thread_sensitive=False)(request)
+        else:
+            static_file = self.files.get(request.path_info)
+            response = None
+            if static_file is not None:
+                response = await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.9 on 2026-10-18 16:37
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_alter_user_profile_picture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('workout_count', models.IntegerField(default=0)),
+                ('exercise_count', models.IntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('calories_burned', models.IntegerField(default=0)),
+                ('routine_counts', models.JSONField(default=dict)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
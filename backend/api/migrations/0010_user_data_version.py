@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_dailyprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
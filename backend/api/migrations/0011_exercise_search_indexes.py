@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Only Postgres gets these; other databases use the in-memory index in
+# api/search.py. The tsvector expression must match
+# PostgresExerciseSearch.vector_sql.
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS api_exercise_name_trgm ON api_exercise USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS api_exercise_search_vector ON api_exercise USING gin (("
+    "setweight(to_tsvector('english', api_exercise.name), 'A') || "
+    "setweight(to_tsvector('english', api_exercise.description), 'B')))",
+]
+DROP_SQL = [
+    "DROP INDEX IF EXISTS api_exercise_search_vector",
+    "DROP INDEX IF EXISTS api_exercise_name_trgm",
+]
+
+
+def run(statements):
+    def forwards(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return forwards
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_user_data_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.9 on 2026-10-18 16:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_exercise_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedworkout',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='completedworkout',
+            name='started_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterUniqueTogether(
+            name='completedworkout',
+            unique_together={('user', 'idempotency_key')},
+        ),
+    ]
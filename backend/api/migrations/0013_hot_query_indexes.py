@@ -0,0 +1,25 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_completedworkout_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='completedworkout',
+            index=models.Index(fields=['user', 'started_at'], name='completedworkout_user_start'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('is_sent', False)), fields=['reminder_time'], name='reminder_due'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['user', 'reminder_time'], name='reminder_user_time'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:56
+
+from django.db import migrations
+from django.db.models import F, Window
+from django.db.models.functions import FirstValue
+
+
+def rename_duplicates(apps, schema_editor):
+    """Suffix the later copies of a (name, start_date) with their id.
+
+    They may already have participants, so they are kept rather than
+    deleted.
+    """
+    WorkoutChallenge = apps.get_model('api', 'WorkoutChallenge')
+    rows = WorkoutChallenge.objects.annotate(first=Window(
+        FirstValue('id'), partition_by=[F('name'), F('start_date')], order_by=F('id').asc(),
+    )).values_list('id', 'name', 'first')
+    for challenge_id, name, first in list(rows):
+        if challenge_id != first:
+            suffix = f' #{challenge_id}'
+            WorkoutChallenge.objects.filter(pk=challenge_id).update(name=name[:100 - len(suffix)] + suffix)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='workoutchallenge',
+            unique_together={('name', 'start_date')},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_workoutchallenge_unique_period'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['muscle_group', 'id'], name='exercise_group_id'),
+        ),
+    ]
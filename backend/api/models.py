@@ -9,10 +9,23 @@ class User(AbstractUser):
     gender = models.CharField(max_length=10,
     choices=[('Male', 'Male'), ('Female', 'Female'), ('Other', 'Other')])
     profile_picture = CloudinaryField('image', null=True, blank=True)
+    # Bumped on every write to the user's routines, workouts, challenges and
+    # reminders; drives the ETags in api/versioning.py.
+    data_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        # Profile and password saves must not write back a stale data_version
+        # over a concurrent bump, so it is only ever changed with F() updates.
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'data_version'
+            ]
+        super().save(*args, **kwargs)
+
 class MuscleGroup(models.Model):
     name = models.CharField(max_length=50)
 
@@ -34,6 +47,12 @@ class Exercise(models.Model):
     description = models.TextField(blank=True)
     exercise_type = models.CharField(max_length=20, choices=EXERCISE_TYPES)
 
+    class Meta:
+        indexes = [
+            # Keyset pages and the streamed catalog, in (muscle_group, id) order.
+            models.Index(fields=['muscle_group', 'id'], name='exercise_group_id'),
+        ]
+
     def __str__(self):
         return str(self.name)
 
@@ -62,11 +81,19 @@ class RoutineExercise(models.Model):
 class CompletedWorkout(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     routine = models.ForeignKey(Routine, on_delete=models.CASCADE)
-    started_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(default=timezone.now)  # may come from an offline client
     completed_at = models.DateTimeField(default=timezone.now)  # Add default here
     duration = models.DurationField(null=True, blank=True)
     calories_burned = models.IntegerField(default=0)
     notes = models.TextField(blank=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)  # set by batch uploads
+
+    class Meta:
+        unique_together = ('user', 'idempotency_key')
+        indexes = [
+            # Per-user history by date: rollup rebuilds and missed-exercise checks.
+            models.Index(fields=['user', 'started_at'], name='completedworkout_user_start'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s {self.routine.name} on {self.started_at.strftime('%Y-%m-%d')}"
@@ -90,6 +117,14 @@ class Reminder(models.Model):
     message = models.CharField(max_length=200)
     is_sent = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # The dispatch queue: only unsent reminders, in due order.
+            models.Index(fields=['reminder_time'], name='reminder_due', condition=models.Q(is_sent=False)),
+            # "Already reminded today" lookups per user range.
+            models.Index(fields=['user', 'reminder_time'], name='reminder_user_time'),
+        ]
+
     def __str__(self):
         return f"Reminder for {self.user.username}: {self.routine.name}"
 
@@ -131,6 +166,10 @@ class WorkoutChallenge(models.Model):
         default='Strength'  # Added default value
     )
 
+    class Meta:
+        # One challenge per series and period, however many planners run.
+        unique_together = ('name', 'start_date')
+
     def __str__(self):
         return self.name
 
@@ -155,3 +194,24 @@ class UserChallengeExercise(models.Model):
 
     class Meta:
         unique_together = ('user_challenge', 'exercise')
+
+
+class DailyProgress(models.Model):
+    """Per-user, per-day rollup of completed workouts read by ProgressView.
+
+    Kept in step with CompletedWorkout/CompletedExercise by the receivers in
+    api/signals.py; rebuild with `manage.py backfill_daily_progress`.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_progress')
+    date = models.DateField()
+    workout_count = models.IntegerField(default=0)
+    exercise_count = models.IntegerField(default=0)
+    total_duration = models.DurationField(default=timezone.timedelta)
+    calories_burned = models.IntegerField(default=0)
+    routine_counts = models.JSONField(default=dict)  # {routine_id: workouts}
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        return f"{self.user.username}'s progress on {self.date}"
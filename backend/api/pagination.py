@@ -0,0 +1,101 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def rows_after(queryset, fields, values):
+    """Filter to rows whose `fields` compare greater than `values` as a row.
+
+    A row comparison, unlike the equivalent OR of column comparisons,
+    lets the database seek straight to the position in an index on the
+    same columns.
+    """
+    quote = connection.ops.quote_name
+    table = quote(queryset.model._meta.db_table)
+    columns = ', '.join(f'{table}.{quote(queryset.model._meta.get_field(field).column)}' for field in fields)
+    placeholders = ', '.join(['%s'] * len(values))
+    return queryset.filter(RawSQL(f'({columns}) > ({placeholders})', values, output_field=BooleanField()))
+
+
+class ExerciseKeysetPagination(BasePagination):
+    """Keyset pagination over the exercise catalog ordered by (muscle_group, id).
+
+    The cursor is the (muscle_group_id, id) of the last row on the previous
+    page. Pages start with a row comparison against it, so with the
+    exercise_group_id index each one is an index range scan no matter how
+    deep it is.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    ordering = ('muscle_group_id', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = rows_after(queryset, self.ordering, position)
+
+        # One extra row tells us whether there is a next page.
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            muscle_group_id, pk = urlsafe_b64decode(encoded.encode()).decode().split(':')
+            return int(muscle_group_id), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance):
+        return urlsafe_b64encode(f'{instance.muscle_group_id}:{instance.pk}'.encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,87 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework import serializers
+
+
+def _relation(model, source):
+    try:
+        field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+@lru_cache(maxsize=None)
+def _plan(serializer_class):
+    """Describe the relations a ModelSerializer reads as (select, prefetch).
+
+    `select` holds select_related paths, `prefetch` holds
+    (lookup, related model, nested plan) tuples. Nested model serializers
+    are walked automatically, and a serializer can add relations read
+    through dotted sources via `Meta.select_related` and
+    `Meta.prefetch_related`.
+    """
+    meta = serializer_class.Meta
+    model = meta.model
+    select = list(getattr(meta, 'select_related', ()))
+    prefetch = [(lookup, None, None) for lookup in getattr(meta, 'prefetch_related', ())]
+
+    for field in serializer_class().fields.values():
+        many = isinstance(field, serializers.ListSerializer)
+        nested = field.child if many else field
+        if not isinstance(nested, serializers.ModelSerializer):
+            continue
+        relation = _relation(model, field.source)
+        if relation is None:
+            continue
+        child_select, child_prefetch = _plan(type(nested))
+        if relation.many_to_many or relation.one_to_many:
+            prefetch.append((field.source, relation.related_model, (child_select, child_prefetch)))
+        else:
+            select.append(field.source)
+            select.extend(f'{field.source}__{path}' for path in child_select)
+            prefetch.extend(
+                (f'{field.source}__{lookup}', related, nested_plan)
+                for lookup, related, nested_plan in child_prefetch
+            )
+    return tuple(select), tuple(prefetch)
+
+
+def _prefetch_objects(prefetch):
+    lookups = []
+    for lookup, related_model, nested_plan in prefetch:
+        if related_model is None:
+            lookups.append(lookup)
+            continue
+        child_select, child_prefetch = nested_plan
+        queryset = related_model.objects.select_related(*child_select).prefetch_related(*_prefetch_objects(child_prefetch))
+        lookups.append(Prefetch(lookup, queryset=queryset))
+    return lookups
+
+
+def apply_prefetch_plan(queryset, serializer_class):
+    select, prefetch = _plan(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*_prefetch_objects(prefetch))
+    return queryset
+
+
+class PrefetchPlanMixin:
+    """Load what the viewset's serializer reads in a fixed number of queries.
+
+    Applied in filter_queryset, which DRF runs for list, retrieve and every
+    detail action through get_object.
+    """
+
+    def filter_queryset(self, queryset):
+        return apply_prefetch_plan(super().filter_queryset(queryset), self.get_serializer_class())
+
+    def refresh_prefetch(self, instance):
+        """Reload the planned relations of an instance after it was written."""
+        instance._prefetched_objects_cache = {}
+        _, prefetch = _plan(self.get_serializer_class())
+        prefetch_related_objects([instance], *_prefetch_objects(prefetch))
@@ -0,0 +1,163 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CompletedWorkout, CompletedExercise, DailyProgress
+
+
+def progress_date(started_at):
+    """The day a workout counts towards, matching `started_at__date` lookups."""
+    return timezone.localtime(started_at).date() if timezone.is_aware(started_at) else started_at.date()
+
+
+def apply_progress_delta(user_id, day, workouts=0, exercises=0, duration=None, calories=0, routine_id=None):
+    """Add (or, with negative values, remove) activity from one DailyProgress row.
+
+    The row is locked for the read-modify-write so concurrent saves for the
+    same user and day cannot lose an update. Rows that drop back to zero are
+    removed, so the rollup only ever holds days with activity.
+    """
+    duration = duration or timedelta()
+    with transaction.atomic():
+        progress = DailyProgress.objects.select_for_update().filter(user_id=user_id, date=day).first()
+        if progress is None:
+            if workouts <= 0 and exercises <= 0:
+                # Nothing to take away, e.g. the row already went with its user.
+                return
+            progress, _ = DailyProgress.objects.get_or_create(user_id=user_id, date=day)
+            progress = DailyProgress.objects.select_for_update().get(pk=progress.pk)
+
+        progress.workout_count += workouts
+        progress.exercise_count += exercises
+        progress.total_duration += duration
+        progress.calories_burned += calories
+        if routine_id is not None and workouts:
+            key = str(routine_id)
+            count = progress.routine_counts.get(key, 0) + workouts
+            if count > 0:
+                progress.routine_counts[key] = count
+            else:
+                progress.routine_counts.pop(key, None)
+
+        if progress.workout_count <= 0 and progress.exercise_count <= 0:
+            progress.delete()
+        else:
+            progress.save()
+
+
+def apply_workout(values, sign=1, exercises=0):
+    """Apply a CompletedWorkout snapshot (a dict of its rollup fields) to the rollup."""
+    duration = values['duration'] or timedelta()
+    apply_progress_delta(
+        values['user_id'],
+        progress_date(values['started_at']),
+        workouts=sign,
+        exercises=sign * exercises,
+        duration=duration if sign > 0 else -duration,
+        calories=sign * (values['calories_burned'] or 0),
+        routine_id=values['routine_id'],
+    )
+
+
+def workout_snapshot(workout):
+    return {
+        'user_id': workout.user_id,
+        'routine_id': workout.routine_id,
+        'started_at': workout.started_at,
+        'duration': workout.duration,
+        'calories_burned': workout.calories_burned,
+    }
+
+
+def apply_workouts_bulk(workouts, exercise_counts):
+    """Add bulk-created workouts to the rollup, since bulk_create skips the signal receivers.
+
+    `exercise_counts` maps each workout's pk to how many CompletedExercise
+    rows were created with it. Runs a fixed number of queries however many
+    users and days the workouts span.
+    """
+    deltas = defaultdict(lambda: {'workouts': 0, 'exercises': 0, 'duration': timedelta(), 'calories': 0, 'routines': defaultdict(int)})
+    for workout in workouts:
+        delta = deltas[(workout.user_id, progress_date(workout.started_at))]
+        delta['workouts'] += 1
+        delta['exercises'] += exercise_counts.get(workout.pk, 0)
+        delta['duration'] += workout.duration or timedelta()
+        delta['calories'] += workout.calories_burned or 0
+        delta['routines'][str(workout.routine_id)] += 1
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        DailyProgress.objects.bulk_create(
+            [
+                DailyProgress(user_id=user_id, date=day, total_duration=timedelta(), routine_counts={})
+                for user_id, day in deltas
+            ],
+            ignore_conflicts=True,
+        )
+        candidates = DailyProgress.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in deltas},
+            date__in={day for _, day in deltas},
+        )
+        rows = [progress for progress in candidates if (progress.user_id, progress.date) in deltas]
+        for progress in rows:
+            delta = deltas[(progress.user_id, progress.date)]
+            progress.workout_count += delta['workouts']
+            progress.exercise_count += delta['exercises']
+            progress.total_duration += delta['duration']
+            progress.calories_burned += delta['calories']
+            for key, count in delta['routines'].items():
+                progress.routine_counts[key] = progress.routine_counts.get(key, 0) + count
+        DailyProgress.objects.bulk_update(
+            rows, ['workout_count', 'exercise_count', 'total_duration', 'calories_burned', 'routine_counts'],
+            batch_size=1000,
+        )
+
+
+def rebuild_daily_progress(user_ids=None):
+    """Recompute DailyProgress from raw history, optionally for a subset of users.
+
+    Returns the number of rollup rows written.
+    """
+    workouts = CompletedWorkout.objects.all()
+    exercises = CompletedExercise.objects.all()
+    if user_ids is not None:
+        workouts = workouts.filter(user_id__in=user_ids)
+        exercises = exercises.filter(completed_workout__user_id__in=user_ids)
+
+    # Workouts and exercises are aggregated separately so the exercise join
+    # doesn't multiply the duration and calorie sums.
+    per_routine = workouts.annotate(date=TruncDate('started_at')).values('user_id', 'date', 'routine_id').annotate(
+        workouts=Count('id'),
+        duration=Sum('duration'),
+        calories=Sum('calories_burned'),
+    ).order_by()
+    exercise_counts = exercises.annotate(date=TruncDate('completed_workout__started_at')).values(
+        'completed_workout__user_id', 'date'
+    ).annotate(exercises=Count('id')).order_by()
+
+    rows = defaultdict(lambda: DailyProgress(total_duration=timedelta(), routine_counts={}))
+    for item in per_routine:
+        progress = rows[(item['user_id'], item['date'])]
+        progress.workout_count += item['workouts']
+        progress.total_duration += item['duration'] or timedelta()
+        progress.calories_burned += item['calories'] or 0
+        progress.routine_counts[str(item['routine_id'])] = item['workouts']
+    for item in exercise_counts:
+        rows[(item['completed_workout__user_id'], item['date'])].exercise_count += item['exercises']
+
+    for (user_id, date), progress in rows.items():
+        progress.user_id = user_id
+        progress.date = date
+
+    with transaction.atomic():
+        stale = DailyProgress.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        DailyProgress.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
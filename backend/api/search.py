@@ -0,0 +1,229 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache import catalog_cache
+from .models import Exercise
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'into', 'is',
+    'it', 'of', 'on', 'or', 'the', 'then', 'to', 'up', 'while', 'with', 'your', 'you',
+])
+
+NAME_WEIGHT = 3
+MAX_EXPANSIONS = 50
+EXACT, PREFIX, TYPO = 1.0, 0.7, 0.5
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insert, delete, substitution or swap."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    return any(longer[:i] + longer[i + 1:] == shorter for i in range(len(longer)))
+
+
+class ExerciseIndex:
+    """In-memory inverted index over Exercise.name and description.
+
+    Ranking is BM25 over a combined field where name terms count
+    NAME_WEIGHT times. Each query token matches exact terms, terms it is a
+    prefix of and, for tokens of four or more letters, terms one edit away
+    (via a deletion-neighbourhood lookup), with the latter two discounted.
+
+    The index is tied to the catalog version in api/cache.py: single
+    exercise writes are applied incrementally by api/signals.py, and any
+    other version change triggers a full rebuild on the next search.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)  # term -> {exercise_id: weighted tf}
+        self.terms = []  # sorted, for prefix ranges
+        self.neighbours = defaultdict(set)  # single-deletion variant -> terms
+        self.docs = {}  # exercise_id -> (length, muscle_group_id, exercise_type, {term: tf})
+        self.total_length = 0
+
+    # Building
+
+    def rebuild(self):
+        version = catalog_cache.version()
+        rows = Exercise.objects.values('id', 'name', 'description', 'muscle_group_id', 'exercise_type')
+        with self._lock:
+            self._reset()
+            for row in rows.iterator(chunk_size=2000):
+                self._add(row)
+            self.version = version
+
+    def ensure_current(self):
+        if self.version != catalog_cache.version():
+            self.rebuild()
+
+    def apply(self, exercise_id, version):
+        """Apply one exercise write made while the catalog moved to `version`."""
+        with self._lock:
+            if self.version is None or self.version != version - 1:
+                # Other writes happened that this process didn't see.
+                self.version = None
+                return
+            self._remove(exercise_id)
+            row = Exercise.objects.filter(pk=exercise_id).values(
+                'id', 'name', 'description', 'muscle_group_id', 'exercise_type'
+            ).first()
+            if row is not None:
+                self._add(row)
+            self.version = version
+
+    def _add(self, row):
+        frequencies = defaultdict(int)
+        for token in tokenize(row['name']):
+            frequencies[token] += NAME_WEIGHT
+        for token in tokenize(row['description'] or ''):
+            frequencies[token] += 1
+        length = sum(frequencies.values())
+
+        for term, tf in frequencies.items():
+            if term not in self.postings:
+                insort(self.terms, term)
+                if len(term) >= 3:
+                    for variant in _deletes(term):
+                        self.neighbours[variant].add(term)
+            self.postings[term][row['id']] = tf
+        self.docs[row['id']] = (length, row['muscle_group_id'], row['exercise_type'], dict(frequencies))
+        self.total_length += length
+
+    def _remove(self, exercise_id):
+        doc = self.docs.pop(exercise_id, None)
+        if doc is None:
+            return
+        length, _, _, frequencies = doc
+        self.total_length -= length
+        for term in frequencies:
+            postings = self.postings[term]
+            postings.pop(exercise_id, None)
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect_left(self.terms, term)]
+                for variant in _deletes(term):
+                    self.neighbours[variant].discard(term)
+
+    # Querying
+
+    def _expand(self, token):
+        """Index terms matching a query token, with their match weight."""
+        matches = {}
+        start = bisect_left(self.terms, token)
+        for term in self.terms[start:start + MAX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            matches[term] = EXACT if term == token else PREFIX
+        if len(token) >= 4:
+            candidates = set(self.neighbours.get(token, ()))
+            for variant in _deletes(token):
+                candidates.update(self.neighbours.get(variant, ()))
+                if variant in self.postings:
+                    candidates.add(variant)
+            for term in candidates:
+                if term not in matches and _within_one_edit(token, term):
+                    matches[term] = TYPO
+        return matches
+
+    def search(self, query, muscle_group=None, exercise_type=None, limit=20):
+        """Return [(exercise_id, score)] for the best matches, best first."""
+        tokens = tokenize(query)
+        with self._lock:
+            if not tokens or not self.docs:
+                return []
+            doc_count = len(self.docs)
+            average_length = self.total_length / doc_count
+            scores = defaultdict(float)
+            for token in dict.fromkeys(tokens):
+                token_scores = {}
+                for term, weight in self._expand(token).items():
+                    postings = self.postings[term]
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for exercise_id, tf in postings.items():
+                        length, group_id, kind, _ = self.docs[exercise_id]
+                        if muscle_group is not None and group_id != muscle_group:
+                            continue
+                        if exercise_type is not None and kind != exercise_type:
+                            continue
+                        norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+                        score = weight * idf * norm
+                        if score > token_scores.get(exercise_id, 0.0):
+                            token_scores[exercise_id] = score
+                for exercise_id, score in token_scores.items():
+                    scores[exercise_id] += score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+class PostgresExerciseSearch:
+    """Full-text search in Postgres using the indexes from migration 0011.
+
+    The tsvector expression must stay identical to the one in that
+    migration for the GIN index to be used.
+    """
+
+    vector_sql = (
+        "setweight(to_tsvector('english', api_exercise.name), 'A') || "
+        "setweight(to_tsvector('english', api_exercise.description), 'B')"
+    )
+
+    def search(self, query, muscle_group=None, exercise_type=None, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        text = ' '.join(tokens)
+        exercises = Exercise.objects.extra(
+            select={
+                'score': f"ts_rank_cd({self.vector_sql}, to_tsquery('english', %s)) + similarity(api_exercise.name, %s)",
+            },
+            select_params=[tsquery, text],
+            where=[f"({self.vector_sql}) @@ to_tsquery('english', %s) OR api_exercise.name %% %s"],
+            params=[tsquery, text],
+        )
+        if muscle_group is not None:
+            exercises = exercises.filter(muscle_group_id=muscle_group)
+        if exercise_type is not None:
+            exercises = exercises.filter(exercise_type=exercise_type)
+        return list(exercises.order_by('-score', 'id').values_list('id', 'score')[:limit])
+
+
+exercise_index = ExerciseIndex()
+
+
+def get_search_backend():
+    if getattr(settings, 'EXERCISE_SEARCH_BACKEND', 'memory') == 'postgres':
+        return PostgresExerciseSearch()
+    exercise_index.ensure_current()
+    return exercise_index
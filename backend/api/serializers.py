@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from .cache import catalog_cache
+from .versioning import batched_data_version_bumps, bump_data_version
 from .models import MuscleGroup, Exercise, Routine, RoutineExercise ,CompletedWorkout, CompletedExercise, Reminder,FavoriteExercise, ExerciseOfTheDay,WorkoutChallenge,UserChallenge
 
 User = get_user_model()
@@ -45,13 +48,44 @@ class ExerciseSerializer(serializers.ModelSerializer):
         model = Exercise
         fields = ['id', 'name', 'muscle_group', 'description', 'exercise_type']
 
+
+def cached_exercise_data(exercise_id):
+    """Serialized exercise from the catalog cache, or None if it isn't there."""
+    exercises = catalog_cache.get_or_build(
+        'exercise_map',
+        lambda: {item['id']: dict(item) for item in ExerciseSerializer(Exercise.objects.all(), many=True).data},
+    )
+    return exercises.get(exercise_id)
+
+class ExerciseIdField(serializers.IntegerField):
+    """Exercise primary key validated against the catalog cache.
+
+    Used in nested writes, where a PrimaryKeyRelatedField would run one
+    query per row.
+    """
+    default_error_messages = {
+        'does_not_exist': 'Invalid pk "{pk_value}" - object does not exist.',
+    }
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if cached_exercise_data(value) is None and not Exercise.objects.filter(pk=value).exists():
+            self.fail('does_not_exist', pk_value=value)
+        return value
+
+
 class RoutineExerciseSerializer(serializers.ModelSerializer):
+    # Writable so nested routine updates can match rows to existing ones.
+    id = serializers.IntegerField(required=False)
+    exercise = ExerciseIdField(source='exercise_id')
     exercise_name = serializers.CharField(source='exercise.name', read_only=True)
     exercise_type = serializers.CharField(source='exercise.exercise_type', read_only=True)
 
     class Meta:
         model = RoutineExercise
         fields = ['id', 'exercise', 'exercise_name', 'exercise_type', 'sets', 'reps', 'duration', 'distance']
+        # exercise_name/exercise_type read through this; see api/prefetch.py.
+        select_related = ['exercise']
 
 class RoutineSerializer(serializers.ModelSerializer):
     exercises = RoutineExerciseSerializer(many=True)
@@ -60,40 +94,62 @@ class RoutineSerializer(serializers.ModelSerializer):
         model = Routine
         fields = ['id', 'name', 'exercises']
 
+    # Fields a nested exercise entry may change on an existing RoutineExercise.
+    exercise_update_fields = ['exercise', 'sets', 'reps', 'duration', 'distance']
+
     def create(self, validated_data):
         exercises_data = validated_data.pop('exercises')
-        routine = Routine.objects.create(**validated_data)
-        for exercise_data in exercises_data:
-            RoutineExercise.objects.create(routine=routine, **exercise_data)
+        with transaction.atomic(), batched_data_version_bumps():
+            routine = Routine.objects.create(**validated_data)
+            RoutineExercise.objects.bulk_create([
+                RoutineExercise(routine=routine, **self._exercise_fields(exercise_data))
+                for exercise_data in exercises_data
+            ])
+            bump_data_version(routine.user_id)
         return routine
 
     def update(self, instance, validated_data):
-        exercises_data = validated_data.pop('exercises', [])
+        exercises_data = validated_data.pop('exercises', None)
         instance.name = validated_data.get('name', instance.name)
-        instance.save()
 
-        # Keep track of existing exercises
-        existing_exercises = {exercise.id: exercise for exercise in instance.exercises.all()}
+        with transaction.atomic(), batched_data_version_bumps():
+            instance.save()
+            if exercises_data is not None:
+                self._sync_exercises(instance, exercises_data)
+        return instance
+
+    def _sync_exercises(self, routine, exercises_data):
+        """Diff the submitted exercises against the routine's rows.
 
-        # Update or create exercises
-        updated_exercises = []
+        Matching ids are updated, the rest created and any row left out is
+        deleted, each in one statement whatever the routine size.
+        """
+        existing = {exercise.id: exercise for exercise in routine.exercises.all()}
+        to_update, to_create, kept = [], [], set()
         for exercise_data in exercises_data:
             exercise_id = exercise_data.get('id')
-            if exercise_id and exercise_id in existing_exercises:
-                exercise = existing_exercises[exercise_id]
-                for attr, value in exercise_data.items():
+            fields = self._exercise_fields(exercise_data)
+            if exercise_id in existing and exercise_id not in kept:
+                exercise = existing[exercise_id]
+                for attr, value in fields.items():
                     setattr(exercise, attr, value)
-                exercise.save()
+                to_update.append(exercise)
+                kept.add(exercise_id)
             else:
-                exercise = RoutineExercise.objects.create(routine=instance, **exercise_data)
-            updated_exercises.append(exercise)
+                to_create.append(RoutineExercise(routine=routine, **fields))
 
-        # Delete exercises not in the update data
-        for exercise in existing_exercises.values():
-            if exercise not in updated_exercises:
-                exercise.delete()
+        if to_update:
+            RoutineExercise.objects.bulk_update(to_update, self.exercise_update_fields)
+        if to_create:
+            RoutineExercise.objects.bulk_create(to_create)
+        removed = existing.keys() - kept
+        if removed:
+            RoutineExercise.objects.filter(routine=routine, id__in=removed).delete()
+        bump_data_version(routine.user_id)
 
-        return instance
+    @staticmethod
+    def _exercise_fields(exercise_data):
+        return {attr: value for attr, value in exercise_data.items() if attr != 'id'}
 
     def validate_exercises(self, value):
         if not value:
@@ -122,6 +178,37 @@ class CompletedWorkoutSerializer(serializers.ModelSerializer):
         validated_data['user'] = user
         return super().create(validated_data)
 
+class CompletedExerciseBatchSerializer(serializers.ModelSerializer):
+    # Plain ids; ownership is checked for the whole batch at once in the view.
+    routine_exercise = serializers.IntegerField(source='routine_exercise_id')
+
+    class Meta:
+        model = CompletedExercise
+        fields = ['routine_exercise', 'sets_completed', 'reps_completed', 'duration_completed', 'distance_completed', 'notes']
+
+class CompletedWorkoutBatchItemSerializer(serializers.ModelSerializer):
+    idempotency_key = serializers.CharField(max_length=64)
+    routine = serializers.IntegerField(source='routine_id')
+    started_at = serializers.DateTimeField()
+    completed_at = serializers.DateTimeField(required=False)
+    exercises = CompletedExerciseBatchSerializer(many=True, required=False)
+
+    class Meta:
+        model = CompletedWorkout
+        fields = ['idempotency_key', 'routine', 'started_at', 'completed_at', 'duration', 'calories_burned', 'notes', 'exercises']
+
+    def validate(self, attrs):
+        started_at = attrs['started_at']
+        completed_at = attrs.get('completed_at')
+        if completed_at is None:
+            completed_at = started_at + attrs['duration'] if attrs.get('duration') else started_at
+            attrs['completed_at'] = completed_at
+        if completed_at < started_at:
+            raise serializers.ValidationError({"completed_at": "Must not be before started_at."})
+        if attrs.get('duration') is None:
+            attrs['duration'] = completed_at - started_at
+        return attrs
+
 class ReminderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reminder
@@ -164,12 +251,18 @@ class FavoriteExerciseSerializer(serializers.ModelSerializer):
 
 
 class ExerciseOfTheDaySerializer(serializers.ModelSerializer):
-    exercise = ExerciseSerializer()
+    exercise = serializers.SerializerMethodField()
 
     class Meta:
         model = ExerciseOfTheDay
         fields = ['date', 'exercise']
 
+    def get_exercise(self, obj):
+        data = cached_exercise_data(obj.exercise_id)
+        if data is None:
+            data = ExerciseSerializer(obj.exercise).data
+        return data
+
 
 class ProgressSerializer(serializers.Serializer):
     date = serializers.DateField()
@@ -188,6 +281,13 @@ class WorkoutChallengeSerializer(serializers.ModelSerializer):
         model = WorkoutChallenge
         fields = ['id', 'name', 'description', 'start_date', 'end_date', 'goal', 'exercises', 'difficulty', 'image_url']
 
+class WorkoutChallengeSummarySerializer(WorkoutChallengeSerializer):
+    """For responses that replace `exercises` with the user's exercise progress."""
+    exercises = None
+
+    class Meta(WorkoutChallengeSerializer.Meta):
+        fields = [field for field in WorkoutChallengeSerializer.Meta.fields if field != 'exercises']
+
 class UserChallengeExerciseSerializer(serializers.ModelSerializer):
     exercise = ExerciseSerializer(read_only=True)
 
@@ -0,0 +1,186 @@
+from celery.signals import task_postrun, task_prerun
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .cache import catalog_cache
+from .models import (
+    User, MuscleGroup, Exercise, Routine, RoutineExercise, CompletedWorkout, CompletedExercise, Reminder,
+    UserChallenge, UserChallengeExercise,
+)
+from .authentication import token_cache
+from . import metrics
+from .leaderboards import get_leaderboard, record_progress
+from .search import exercise_index
+from .rollups import apply_progress_delta, apply_workout, progress_date, workout_snapshot
+from .versioning import bump_data_version
+
+
+def _workout_day(completed_workout_id):
+    row = CompletedWorkout.objects.filter(pk=completed_workout_id).values_list('user_id', 'started_at').first()
+    if row is None:
+        return None
+    return row[0], progress_date(row[1])
+
+
+# CompletedWorkout -> DailyProgress
+
+@receiver(pre_save, sender=CompletedWorkout)
+def remember_workout_rollup(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk:
+        instance._rollup_previous = CompletedWorkout.objects.filter(pk=instance.pk).values(
+            'user_id', 'routine_id', 'started_at', 'duration', 'calories_burned'
+        ).first()
+
+
+@receiver(post_save, sender=CompletedWorkout)
+def update_workout_rollup(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    current = workout_snapshot(instance)
+    if previous is None:
+        apply_workout(current)
+        return
+
+    # An edit: move the workout out of its old day and into its new one. Its
+    # exercises only need to follow it when the (user, day) key changed.
+    moved = (previous['user_id'], progress_date(previous['started_at'])) != (
+        current['user_id'], progress_date(current['started_at'])
+    )
+    exercises = instance.completed_exercises.count() if moved else 0
+    apply_workout(previous, sign=-1, exercises=exercises)
+    apply_workout(current, exercises=exercises)
+
+
+@receiver(post_delete, sender=CompletedWorkout)
+def remove_workout_rollup(sender, instance, **kwargs):
+    apply_workout(workout_snapshot(instance), sign=-1)
+
+
+# CompletedExercise -> DailyProgress
+
+@receiver(pre_save, sender=CompletedExercise)
+def remember_exercise_rollup(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk:
+        instance._rollup_previous = CompletedExercise.objects.filter(pk=instance.pk).values_list(
+            'completed_workout_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=CompletedExercise)
+def update_exercise_rollup(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous == instance.completed_workout_id:
+        return
+    if previous is not None:
+        old_day = _workout_day(previous)
+        if old_day:
+            apply_progress_delta(*old_day, exercises=-1)
+    new_day = _workout_day(instance.completed_workout_id)
+    if new_day:
+        apply_progress_delta(*new_day, exercises=1)
+
+
+@receiver(post_delete, sender=CompletedExercise)
+def remove_exercise_rollup(sender, instance, **kwargs):
+    day = _workout_day(instance.completed_workout_id)
+    if day:
+        apply_progress_delta(*day, exercises=-1)
+
+
+# Per-user data version behind the ETags in api/versioning.py
+
+@receiver(post_save, sender=Routine)
+@receiver(post_delete, sender=Routine)
+@receiver(post_save, sender=CompletedWorkout)
+@receiver(post_delete, sender=CompletedWorkout)
+@receiver(post_save, sender=UserChallenge)
+@receiver(post_delete, sender=UserChallenge)
+@receiver(post_save, sender=Reminder)
+@receiver(post_delete, sender=Reminder)
+def bump_owner_data_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=RoutineExercise)
+@receiver(post_delete, sender=RoutineExercise)
+def bump_routine_data_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(routines__id=instance.routine_id)
+
+
+@receiver(post_save, sender=CompletedExercise)
+@receiver(post_delete, sender=CompletedExercise)
+def bump_workout_data_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(completedworkout__id=instance.completed_workout_id)
+
+
+@receiver(post_save, sender=UserChallengeExercise)
+@receiver(post_delete, sender=UserChallengeExercise)
+def bump_challenge_data_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(userchallenge__id=instance.user_challenge_id)
+
+
+# Exercise catalog cache in api/cache.py and search index in api/search.py
+
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def refresh_exercise_catalog(sender, instance, **kwargs):
+    exercise_id = instance.pk
+    # Wait for the commit so no process can rebuild the new version from
+    # rows that are still uncommitted.
+    transaction.on_commit(lambda: exercise_index.apply(exercise_id, catalog_cache.invalidate()))
+
+
+@receiver(post_save, sender=MuscleGroup)
+@receiver(post_delete, sender=MuscleGroup)
+def invalidate_catalog_cache(sender, **kwargs):
+    transaction.on_commit(catalog_cache.invalidate)
+
+
+# Challenge leaderboards in api/leaderboards.py
+
+@receiver(post_save, sender=UserChallenge)
+def update_leaderboard(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: record_progress([instance]))
+
+
+@receiver(post_delete, sender=UserChallenge)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    challenge_id, user_id = instance.challenge_id, instance.user_id
+    transaction.on_commit(lambda: get_leaderboard().remove(challenge_id, user_id))
+
+
+# Cached token authentication in api/authentication.py
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created=False, raw=False, **kwargs):
+    # Covers password changes and profile updates; deleting a user deletes
+    # its token, which the receiver below handles.
+    if not created and not raw:
+        keys = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+        transaction.on_commit(lambda: token_cache.invalidate(*keys))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: token_cache.invalidate(key))
+
+
+# Celery task durations and per-request SQL for /metrics (api/metrics.py)
+task_prerun.connect(metrics.task_started)
+task_postrun.connect(metrics.task_finished)
+connection_created.connect(metrics.install_query_timer)
@@ -1,34 +1,211 @@
-from celery import shared_task
+import logging
+import time
+
+from collections import defaultdict
+
+from celery import group, shared_task
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from .models import Reminder, CompletedExercise, RoutineExercise
+from django.utils.dateparse import parse_date
+from .models import Reminder, CompletedExercise, Routine, RoutineExercise
+from .challenges import ENROLLMENT_CHUNK_SIZE, enroll_users_in_chunks
+from .challenge_calendar import PLAN_DAYS_AHEAD, plan_challenge_calendar
+from .daily_exercise import SCHEDULE_DAYS_AHEAD, schedule_exercises_of_the_day
+from .utils import day_bounds
+from .versioning import batched_data_version_bumps, bump_data_version
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+REMINDER_BATCH_SIZE = 500
+
+
+def deliver_reminder(reminder):
+    # Here you would typically send an email or push notification
+    logger.info(f"Sending reminder to {reminder.user.email}: {reminder.message}")
+
+
+def dispatch_reminder_batch(batch_size=REMINDER_BATCH_SIZE, now=None, failed=None):
+    """Claim, send and mark one batch of due reminders; returns the reminders sent.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+    of workers can drain the queue at once. A reminder whose delivery
+    raises is logged, added to `failed` and left unsent for a later run;
+    the rest of the batch is still marked sent. Reminders in `failed` are
+    not claimed again. If the worker dies mid-batch the claim rolls back
+    and the whole batch is sent again, so delivery is at least once.
+    """
+    now = now or timezone.now()
+    failed = set() if failed is None else failed
+    with transaction.atomic():
+        batch = list(
+            Reminder.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('user', 'routine')
+            .filter(is_sent=False, reminder_time__lte=now)
+            .exclude(pk__in=failed)
+            .order_by('reminder_time')[:batch_size]
+        )
+        sent = []
+        for reminder in batch:
+            try:
+                deliver_reminder(reminder)
+            except Exception:
+                logger.exception(f"Could not deliver reminder {reminder.pk}")
+                failed.add(reminder.pk)
+            else:
+                sent.append(reminder)
+        if not sent:
+            return []
+        Reminder.objects.filter(pk__in=[reminder.pk for reminder in sent]).update(is_sent=True)
+        with batched_data_version_bumps():
+            for reminder in sent:
+                bump_data_version(reminder.user_id)
+    return sent
+
 
 @shared_task
-def send_reminders():
+def send_reminders(batch_size=REMINDER_BATCH_SIZE, max_batches=None):
+    """Drain due reminders in batches and report throughput, failures and lag."""
+    started = time.monotonic()
     now = timezone.now()
-    reminders = Reminder.objects.filter(reminder_date__lte=now, is_sent=False)
-    for reminder in reminders:
-        # Here you would typically send an email or push notification
-        print(f"Sending reminder to {reminder.user.email}: {reminder.message}")
-        reminder.is_sent = True
-        reminder.save()
+    sent = batches = 0
+    failed = set()
+    max_lag = total_lag = 0.0
+    while max_batches is None or batches < max_batches:
+        failures = len(failed)
+        batch = dispatch_reminder_batch(batch_size, now=now, failed=failed)
+        if not batch and len(failed) == failures:
+            break
+        batches += 1
+        sent += len(batch)
+        for reminder in batch:
+            lag = (now - reminder.reminder_time).total_seconds()
+            max_lag = max(max_lag, lag)
+            total_lag += lag
+
+    elapsed = time.monotonic() - started
+    metrics = {
+        'sent': sent,
+        'failed': len(failed),
+        'batches': batches,
+        'seconds': round(elapsed, 3),
+        'per_second': round(sent / elapsed, 1) if elapsed else 0.0,
+        'max_lag_seconds': round(max_lag, 1),
+        'avg_lag_seconds': round(total_lag / sent, 1) if sent else 0.0,
+    }
+    logger.info(f"Reminder dispatch: {metrics}")
+    return metrics
+
+MISSED_EXERCISE_MESSAGE = "You missed some exercises yesterday. Don't forget to catch up!"
+MISSED_EXERCISE_CHUNK_SIZE = 1000
+
 
 @shared_task
-def create_missed_exercise_reminders():
+def create_missed_exercise_reminders(chunk_size=MISSED_EXERCISE_CHUNK_SIZE):
+    """Fan yesterday's missed-exercise check out over user-id ranges."""
     yesterday = timezone.now().date() - timezone.timedelta(days=1)
-    users = User.objects.all()
-    for user in users:
-        total_exercises = RoutineExercise.objects.filter(routine__user=user).count()
-        completed_exercises = CompletedExercise.objects.filter(user=user, completed_at__date=yesterday).count()
-        if completed_exercises < total_exercises:
-            Reminder.objects.create(
-                user=user,
-                message="You missed some exercises yesterday. Don't forget to catch up!",
-                reminder_date=timezone.now()
-            )
+    bounds = User.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return 0
+    chunks = [
+        create_missed_exercise_reminders_chunk.s(start, start + chunk_size - 1, yesterday.isoformat())
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+    ]
+    group(chunks).apply_async()
+    return len(chunks)
+
+
+@shared_task
+def create_missed_exercise_reminders_chunk(first_user_id, last_user_id, day):
+    """Remind users in [first_user_id, last_user_id] who completed fewer exercises on `day` than their routines hold.
+
+    One grouped query gives, per routine, its exercise count and how many
+    of its exercises were completed that day; the reminders for the whole
+    chunk are then written with one bulk_create. Users already reminded
+    today are skipped so the task is safe to re-run.
+    """
+    day_start, day_end = day_bounds(parse_date(day))
+    completed_on_day = CompletedExercise.objects.filter(
+        routine_exercise__routine=OuterRef('pk'),
+        completed_workout__started_at__gte=day_start,
+        completed_workout__started_at__lt=day_end,
+    ).values('routine_exercise__routine').annotate(count=Count('id')).values('count')
+    routines = Routine.objects.filter(user__id__range=(first_user_id, last_user_id)).annotate(
+        total=Count('exercises'),
+        done=Coalesce(Subquery(completed_on_day), 0),
+    ).values_list('id', 'user_id', 'total', 'done')
+
+    totals = defaultdict(lambda: [0, 0, None, -1])  # user -> [total, done, routine, shortfall]
+    for routine_id, user_id, total, done in routines:
+        summary = totals[user_id]
+        summary[0] += total
+        summary[1] += done
+        if total - done > summary[3]:
+            # Point the reminder at the routine with the most left undone.
+            summary[2], summary[3] = routine_id, total - done
+
+    now = timezone.now()
+    today_start, today_end = day_bounds(timezone.localdate(now))
+    already_reminded = set(Reminder.objects.filter(
+        user__id__range=(first_user_id, last_user_id),
+        message=MISSED_EXERCISE_MESSAGE,
+        reminder_time__gte=today_start,
+        reminder_time__lt=today_end,
+    ).values_list('user_id', flat=True))
+
+    reminders = [
+        Reminder(user_id=user_id, routine_id=routine_id, message=MISSED_EXERCISE_MESSAGE, reminder_time=now)
+        for user_id, (total, done, routine_id, _) in totals.items()
+        if done < total and user_id not in already_reminded
+    ]
+    with transaction.atomic(), batched_data_version_bumps():
+        Reminder.objects.bulk_create(reminders, batch_size=1000)
+        for reminder in reminders:
+            bump_data_version(reminder.user_id)
+    return len(reminders)
+
+
+@shared_task
+def enroll_users_in_challenge(challenge_id, user_ids=None, chunk_size=ENROLLMENT_CHUNK_SIZE):
+    """Bulk-enroll the given users, or every active user, into a challenge."""
+    if user_ids is None:
+        user_ids = _active_user_ids(chunk_size)
+    enrolled = enroll_users_in_chunks(challenge_id, user_ids, chunk_size=chunk_size)
+    logger.info(f"Enrolled {enrolled} users into challenge {challenge_id}")
+    return enrolled
+
+
+def _active_user_ids(chunk_size):
+    last_id = 0
+    while True:
+        ids = list(User.objects.filter(is_active=True, id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield from ids
+        last_id = ids[-1]
 
 
 from celery import shared_task
 
+@shared_task
+def schedule_exercise_of_the_day_calendar(days=SCHEDULE_DAYS_AHEAD):
+    """Beat job keeping the Exercise of the Day calendar filled `days` ahead."""
+    scheduled = schedule_exercises_of_the_day(days=days)
+    logger.info(f"Scheduled {scheduled} exercise of the day entries")
+    return scheduled
+
+
+@shared_task
+def schedule_challenge_calendar(days=PLAN_DAYS_AHEAD):
+    """Beat job keeping the weekly and monthly challenges planned `days` ahead."""
+    planned = plan_challenge_calendar(days=days)
+    logger.info(f"Planned {len(planned)} challenges")
+    return len(planned)
+
+
 @shared_task
 def add(x, y):
     return x + y
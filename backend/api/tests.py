@@ -1,3 +1,1129 @@
-from django.test import TestCase
+import bisect
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import path
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .models import (
+    CompletedExercise, CompletedWorkout, DailyProgress, Exercise, ExerciseOfTheDay, MuscleGroup, Reminder, Routine,
+    RoutineExercise, User, UserChallenge, UserChallengeExercise, WorkoutChallenge,
+)
+from . import async_views
+from .authentication import TokenSnapshotCache, token_cache
+from .cache import catalog_cache
+from .catalog import dedupe_catalog, sync_catalog
+from .challenge_calendar import plan_challenge_calendar
+from .daily_exercise import schedule_exercises_of_the_day
+from .db_pool import ConnectionPool, PoolTimeout
+from .leaderboards import IndexableSkipList, InMemoryLeaderboard, get_leaderboard
+from .metrics import archive_exited_processes, registry
+from .prefetch import _plan
+from .rollups import rebuild_daily_progress
+from .serializers import RoutineSerializer
+from .tasks import (
+    MISSED_EXERCISE_MESSAGE, create_missed_exercise_reminders_chunk, enroll_users_in_challenge, send_reminders,
+)
+from .utils import day_bounds
+
+
+def rollup_rows():
+    return sorted(
+        (row.user_id, row.date, row.workout_count, row.exercise_count, row.total_duration,
+         row.calories_burned, row.routine_counts)
+        for row in DailyProgress.objects.all()
+    )
+
+
+def write_count(queries):
+    return sum(query['sql'].lstrip().split()[0] in ('INSERT', 'UPDATE', 'DELETE') for query in queries.captured_queries)
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='password')
+        self.muscle_group = MuscleGroup.objects.create(name='Chest')
+        self.exercise = Exercise.objects.create(name='Bench Press', muscle_group=self.muscle_group, exercise_type='Strength')
+        self.routine = Routine.objects.create(user=self.user, name='Push')
+        self.routine_exercise = RoutineExercise.objects.create(routine=self.routine, exercise=self.exercise)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertRollupMatchesHistory(self):
+        rows = rollup_rows()
+        rebuild_daily_progress()
+        self.assertEqual(rows, rollup_rows())
+
+
+class DailyProgressRollupTests(APITestCase):
+    def test_create_edit_and_delete_keep_rollup_in_step(self):
+        workout = CompletedWorkout.objects.create(
+            user=self.user, routine=self.routine, duration=timedelta(minutes=30), calories_burned=100,
+        )
+        CompletedExercise.objects.create(completed_workout=workout, routine_exercise=self.routine_exercise)
+        CompletedExercise.objects.create(completed_workout=workout, routine_exercise=self.routine_exercise)
+        other = CompletedWorkout.objects.create(
+            user=self.user, routine=self.routine, duration=timedelta(minutes=10), calories_burned=5,
+        )
+        day = DailyProgress.objects.get()
+        self.assertEqual(
+            (day.workout_count, day.exercise_count, day.calories_burned, day.routine_counts),
+            (2, 2, 105, {str(self.routine.id): 2}),
+        )
+        self.assertRollupMatchesHistory()
+
+        other.calories_burned = 50
+        other.save()
+        self.assertEqual(DailyProgress.objects.get().calories_burned, 150)
+        other.started_at -= timedelta(days=2)
+        other.save()
+        self.assertEqual(DailyProgress.objects.count(), 2)
+        self.assertRollupMatchesHistory()
+
+        workout.completed_exercises.first().delete()
+        self.assertRollupMatchesHistory()
+        workout.delete()
+        self.assertEqual(DailyProgress.objects.count(), 1)
+        self.assertRollupMatchesHistory()
+        self.routine.delete()
+        self.assertFalse(DailyProgress.objects.exists())
+
+    def test_progress_view_reads_rollup(self):
+        CompletedWorkout.objects.create(
+            user=self.user, routine=self.routine, duration=timedelta(minutes=30), calories_burned=100,
+        )
+        response = self.client.get('/api/progress/')
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()['summary']
+        self.assertEqual((summary['totalWorkouts'], summary['totalCaloriesBurned']), (1, 100))
+        self.assertEqual(summary['workoutDistribution'], [{'name': 'Push', 'value': 1}])
+
+
+class ConditionalGetTests(APITestCase):
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_unchanged_data_answers_304(self):
+        for url in ('/api/routines/', f'/api/routines/{self.routine.id}/', '/api/progress/', '/api/user-challenges/'):
+            with self.subTest(url=url):
+                self.assertNotModified(url)
+
+    def test_writes_invalidate_etag(self):
+        etag = self.assertNotModified('/api/routines/')
+        self.client.post('/api/completed-workouts/', {'routine': self.routine.id}, format='json')
+        self.assertEqual(self.client.get('/api/routines/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.assertNotModified('/api/routines/')
+        self.routine.name = 'Push day'
+        self.routine.save()
+        self.assertEqual(self.client.get('/api/routines/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_query_and_user(self):
+        etag = self.client.get('/api/progress/')['ETag']
+        self.assertNotEqual(self.client.get('/api/progress/?start_date=2020-01-01')['ETag'], etag)
+        other = User.objects.create_user(username='bob', password='password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/progress/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_default_progress_window_moves_with_the_day(self):
+        etag = self.assertNotModified('/api/progress/')
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=tomorrow):
+            self.assertEqual(self.client.get('/api/progress/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # Rolled-back test data never bumped the version, so start fresh.
+        catalog_cache.invalidate()
+
+    def names(self, url):
+        return sorted(item['name'] for item in self.client.get(url).json())
+
+    def test_warm_catalog_reads_cost_no_queries(self):
+        for url in ('/api/exercises/', '/api/muscle-groups/'):
+            self.client.get(url)
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_catalog_writes_refresh_cached_json(self):
+        version = catalog_cache.version()
+        self.assertEqual(self.names('/api/exercises/'), ['Bench Press'])
+        with self.captureOnCommitCallbacks(execute=True):
+            squat = Exercise.objects.create(name='Squat', muscle_group=self.muscle_group, exercise_type='Strength')
+        self.assertGreater(catalog_cache.version(), version)
+        self.assertEqual(self.names('/api/exercises/'), ['Bench Press', 'Squat'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            squat.name = 'Front Squat'
+            squat.save()
+        self.assertEqual(self.names('/api/exercises/'), ['Bench Press', 'Front Squat'])
+        with self.captureOnCommitCallbacks(execute=True):
+            squat.delete()
+        self.assertEqual(self.names('/api/exercises/'), ['Bench Press'])
+
+        self.assertEqual(self.names('/api/muscle-groups/'), ['Chest'])
+        with self.captureOnCommitCallbacks(execute=True):
+            legs = MuscleGroup.objects.create(name='Legs')
+        self.assertEqual(self.names('/api/muscle-groups/'), ['Chest', 'Legs'])
+        with self.captureOnCommitCallbacks(execute=True):
+            legs.delete()
+        self.assertEqual(self.names('/api/muscle-groups/'), ['Chest'])
+
+
+class ExerciseListTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        back = MuscleGroup.objects.create(name='Back')
+        for index in range(4):
+            Exercise.objects.create(name=f'Row {index}', muscle_group=back, exercise_type='Strength')
+            Exercise.objects.create(name=f'Fly {index}', muscle_group=self.muscle_group, exercise_type='Strength')
+        self.ordered = list(Exercise.objects.order_by('muscle_group_id', 'id').values_list('id', flat=True))
+
+    def test_cursor_pages_cover_catalog_once(self):
+        seen, url = [], '/api/exercises/?page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 3)
+            seen += [exercise['id'] for exercise in data['results']]
+            url = data['next']
+        self.assertEqual(seen, self.ordered)
+
+    def test_invalid_cursor_is_404(self):
+        for cursor in ('not-base64!', 'bm9jb2xvbg==', 'YTpi'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/exercises/', {'cursor': cursor}).status_code, 404)
+
+    def test_page_size_is_clamped(self):
+        for page_size, expected in (('0', 1), ('-5', 1), ('abc', len(self.ordered)), ('5000', len(self.ordered))):
+            with self.subTest(page_size=page_size):
+                data = self.client.get('/api/exercises/', {'page_size': page_size}).json()
+                self.assertEqual(len(data['results']), expected)
+
+    def test_stream_returns_whole_catalog_as_json(self):
+        response = self.client.get('/api/exercises/?stream=1')
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in rows], self.ordered)
+        self.assertEqual(set(rows[0]), {'id', 'name', 'muscle_group', 'description', 'exercise_type'})
+
+
+class ExerciseSearchTests(APITestCase):
+    def test_limit_is_clamped(self):
+        for index in range(3):
+            Exercise.objects.create(name=f'Incline Bench Press {index}', muscle_group=self.muscle_group, exercise_type='Strength')
+        for limit, expected in (('0', 1), ('-2', 1), ('2', 2), ('500', 4)):
+            with self.subTest(limit=limit):
+                response = self.client.get('/api/exercises/search/', {'q': 'bench', 'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), expected)
+        self.assertEqual(self.client.get('/api/exercises/search/', {'q': 'bench', 'limit': 'all'}).status_code, 400)
+
+
+class RoutineWriteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.exercises = [
+            Exercise.objects.create(name=f'Fly {index}', muscle_group=self.muscle_group, exercise_type='Strength')
+            for index in range(30)
+        ]
+
+    def write_routine(self, size):
+        """Create a routine of `size` exercises and rewrite half of it; returns both write counts."""
+        with CaptureQueriesContext(connection) as create_queries:
+            response = self.client.post('/api/routines/', {
+                'name': 'Chest', 'exercises': [{'exercise': exercise.id, 'sets': 3} for exercise in self.exercises[:size]],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        routine_id = response.json()['id']
+        rows = response.json()['exercises']
+
+        kept = rows[:size // 2]
+        payload = [{'id': row['id'], 'exercise': row['exercise'], 'sets': 5} for row in kept]
+        payload += [{'exercise': self.exercise.id, 'reps': 12}, {'id': self.routine_exercise.id, 'exercise': self.exercise.id}]
+        with CaptureQueriesContext(connection) as update_queries:
+            response = self.client.put(f'/api/routines/{routine_id}/', {'name': 'Chest day', 'exercises': payload}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        saved = RoutineExercise.objects.filter(routine_id=routine_id)
+        self.assertEqual(len(saved), len(kept) + 2)
+        self.assertEqual({row.id for row in saved if row.sets == 5}, {row['id'] for row in kept})
+        # Another routine's row id is never taken over.
+        self.assertEqual(RoutineExercise.objects.get(pk=self.routine_exercise.id).routine_id, self.routine.id)
+        return write_count(create_queries), write_count(update_queries)
+
+    def test_write_count_does_not_grow_with_routine_size(self):
+        self.assertEqual(self.write_routine(4), self.write_routine(30))
+
+
+class ExerciseOfTheDayTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        catalog_cache.invalidate()
+        for index in range(4):
+            Exercise.objects.create(name=f'Lunge {index}', muscle_group=self.muscle_group, exercise_type='Strength')
+        self.exercise_ids = list(Exercise.objects.order_by('id').values_list('id', flat=True))
+        self.start = timezone.now().date()
+
+    def calendar(self):
+        return list(ExerciseOfTheDay.objects.order_by('date').values_list('exercise_id', flat=True))
+
+    def test_no_repeat_until_catalog_is_used_up(self):
+        self.assertEqual(schedule_exercises_of_the_day(self.start, days=3), 3)
+        # A rerun continues the rotation after the last scheduled day.
+        self.assertEqual(schedule_exercises_of_the_day(self.start, days=12), 9)
+        calendar = self.calendar()
+        self.assertEqual(sorted(calendar[:5]), self.exercise_ids)
+        self.assertEqual(calendar[5:10], calendar[:5])
+        position = self.exercise_ids.index(calendar[0])
+        self.assertEqual(calendar[:5], self.exercise_ids[position:] + self.exercise_ids[:position])
+
+    def test_existing_dates_are_untouched(self):
+        ExerciseOfTheDay.objects.create(date=self.start + timedelta(days=2), exercise_id=self.exercise_ids[0])
+        self.assertEqual(schedule_exercises_of_the_day(self.start, days=5), 4)
+        self.assertEqual(ExerciseOfTheDay.objects.get(date=self.start + timedelta(days=2)).exercise_id, self.exercise_ids[0])
+        self.assertEqual(schedule_exercises_of_the_day(self.start, days=5), 0)
+        self.assertEqual(ExerciseOfTheDay.objects.count(), 5)
+
+    def test_today_without_a_scheduled_row_picks_one(self):
+        data = self.client.get('/api/exercise-of-the-day/today/').json()
+        entry = ExerciseOfTheDay.objects.get()
+        self.assertEqual((data['date'], data['exercise']['id']), (entry.date.isoformat(), entry.exercise_id))
+        self.assertEqual(self.client.get('/api/exercise-of-the-day/today/').json(), data)
+
+        ExerciseOfTheDay.objects.all().delete()
+        Exercise.objects.all().delete()
+        catalog_cache.invalidate()
+        self.assertEqual(self.client.get('/api/exercise-of-the-day/today/').status_code, 404)
+
+
+class RoutinePrefetchTests(APITestCase):
+    def add_exercises(self, routine, count):
+        RoutineExercise.objects.bulk_create([
+            RoutineExercise(routine=routine, exercise=Exercise.objects.create(
+                name=f'Dip {routine.id}-{index}', muscle_group=self.muscle_group, exercise_type='Strength',
+            ))
+            for index in range(count)
+        ])
+
+    def query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_plan_follows_nested_serializers(self):
+        self.assertEqual(_plan(RoutineSerializer), ((), (('exercises', RoutineExercise, (('exercise',), ())),)))
+
+    def test_list_query_count_is_fixed(self):
+        expected = self.query_count('/api/routines/')
+        for index in range(5):
+            self.add_exercises(Routine.objects.create(user=self.user, name=f'Pull {index}'), 3)
+        with self.assertNumQueries(expected):
+            self.assertEqual(len(self.client.get('/api/routines/').json()), 6)
+
+    def test_retrieve_and_detail_query_counts_are_fixed(self):
+        for url in (f'/api/routines/{self.routine.id}/', f'/api/routines/{self.routine.id}/detail/'):
+            with self.subTest(url=url):
+                expected = self.query_count(url)
+                self.add_exercises(self.routine, 4)
+                with self.assertNumQueries(expected):
+                    data = self.client.get(url).json()
+                self.assertEqual(len(data['exercises']), self.routine.exercises.count())
+        self.assertIn('created_at', data)
+
+
+class WorkoutBatchUploadTests(APITestCase):
+    def session(self, key, days_ago=0, **fields):
+        completed_at = timezone.now() - timedelta(days=days_ago)
+        return dict({
+            'idempotency_key': key,
+            'routine': self.routine.id,
+            'started_at': (completed_at - timedelta(hours=1)).isoformat(),
+            'completed_at': completed_at.isoformat(),
+            'calories_burned': 10,
+            'exercises': [{'routine_exercise': self.routine_exercise.id, 'sets_completed': 3}],
+        }, **fields)
+
+    def upload(self, sessions):
+        return self.client.post('/api/completed-workouts/batch/', {'sessions': sessions}, format='json')
+
+    def test_retried_upload_reports_duplicates(self):
+        sessions = [self.session(f'session-{index}', days_ago=index % 3) for index in range(6)]
+        other_routine = Routine.objects.create(user=User.objects.create_user(username='bob'), name='Theirs')
+        sessions += [self.session('foreign', routine=other_routine.id), self.session('session-0'), {'routine': self.routine.id}]
+        response = self.upload(sessions)
+        self.assertEqual(response.status_code, 201, response.content)
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['created'] * 6 + ['invalid'] * 3)
+        self.assertEqual(CompletedExercise.objects.count(), 6)
+        self.assertRollupMatchesHistory()
+
+        created = {result['idempotency_key']: result['id'] for result in response.json()['results'][:6]}
+        response = self.upload(sessions[:6])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {result['idempotency_key']: (result['status'], result['id']) for result in response.json()['results']},
+            {key: ('duplicate', workout_id) for key, workout_id in created.items()},
+        )
+        self.assertEqual(CompletedWorkout.objects.count(), 6)
+        self.assertRollupMatchesHistory()
+
+    def test_concurrent_upload_of_the_same_key_conflicts(self):
+        bulk_create = CompletedWorkout.objects.bulk_create
+
+        def racing_bulk_create(workouts, **kwargs):
+            # Another upload with the same key gets its row in first.
+            CompletedWorkout.objects.create(user=self.user, routine=self.routine, idempotency_key='session-1')
+            return bulk_create(workouts, **kwargs)
+
+        with mock.patch.object(CompletedWorkout.objects, 'bulk_create', side_effect=racing_bulk_create):
+            response = self.upload([self.session('session-0'), self.session('session-1')])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(CompletedWorkout.objects.exists())
+        self.assertFalse(DailyProgress.objects.exists())
+
+
+class ReminderDispatchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.due = [
+            Reminder.objects.create(
+                user=self.user, routine=self.routine, message=f'Go {index}', reminder_time=now - timedelta(minutes=index),
+            )
+            for index in range(5)
+        ]
+        self.later = Reminder.objects.create(user=self.user, routine=self.routine, message='Later', reminder_time=now + timedelta(hours=1))
+
+    def test_drains_due_reminders_in_batches(self):
+        metrics = send_reminders(batch_size=2)
+        self.assertEqual((metrics['sent'], metrics['failed'], metrics['batches']), (5, 0, 3))
+        self.assertGreater(metrics['max_lag_seconds'], metrics['avg_lag_seconds'])
+        self.assertEqual(set(Reminder.objects.filter(is_sent=True)), set(self.due))
+        self.assertEqual(send_reminders()['sent'], 0)
+
+    def test_failed_delivery_leaves_only_that_reminder_unsent(self):
+        failing = self.due[2]
+
+        def deliver(reminder):
+            if reminder.pk == failing.pk:
+                raise ConnectionError('push service down')
+
+        with mock.patch('api.tasks.deliver_reminder', side_effect=deliver), self.assertLogs('api.tasks', 'ERROR'):
+            metrics = send_reminders(batch_size=2)
+        self.assertEqual((metrics['sent'], metrics['failed']), (4, 1))
+        self.assertEqual(list(Reminder.objects.filter(is_sent=False).order_by('id')), [failing, self.later])
+
+        self.assertEqual(send_reminders()['sent'], 1)
+        self.assertFalse(Reminder.objects.get(pk=self.later.pk).is_sent)
+
+
+class MissedExerciseReminderTests(APITestCase):
+    def test_reminds_users_who_missed_exercises_once(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        bob = User.objects.create_user(username='bob')
+        bob_routine = Routine.objects.create(user=bob, name='Legs')
+        bob_exercise = RoutineExercise.objects.create(routine=bob_routine, exercise=self.exercise)
+        workout = CompletedWorkout.objects.create(user=bob, routine=bob_routine, duration=timedelta(minutes=20))
+        CompletedWorkout.objects.filter(pk=workout.pk).update(started_at=day_bounds(yesterday)[0] + timedelta(hours=12))
+        CompletedExercise.objects.create(completed_workout=workout, routine_exercise=bob_exercise)
+
+        first, last = min(self.user.id, bob.id), max(self.user.id, bob.id)
+        self.assertEqual(create_missed_exercise_reminders_chunk(first, last, yesterday.isoformat()), 1)
+        reminder = Reminder.objects.get()
+        self.assertEqual((reminder.user, reminder.routine, reminder.message), (self.user, self.routine, MISSED_EXERCISE_MESSAGE))
+        self.assertEqual(create_missed_exercise_reminders_chunk(first, last, yesterday.isoformat()), 0)
+        self.assertEqual(Reminder.objects.count(), 1)
+
+
+class ChallengeTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        today = timezone.now().date()
+        self.challenge_exercises = [self.exercise] + [
+            Exercise.objects.create(name=f'Push-up {index}', muscle_group=self.muscle_group, exercise_type='Strength')
+            for index in range(3)
+        ]
+        self.challenge = WorkoutChallenge.objects.create(
+            name='Chest Month', description='Chest work', start_date=today - timedelta(days=3),
+            end_date=today + timedelta(days=3), goal=3, difficulty='Easy',
+        )
+        self.challenge.exercises.set(self.challenge_exercises)
+
+
+class ChallengeEnrollmentTests(ChallengeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='admin', password='password', email='admin@example.com')
+        self.others = [User.objects.create_user(username=f'user{index}') for index in range(5)]
+        # Run the job in-process instead of through the broker.
+        delay = mock.patch.object(
+            enroll_users_in_challenge, 'delay',
+            side_effect=lambda *args, **kwargs: enroll_users_in_challenge.apply(args, kwargs),
+        )
+        delay.start()
+        self.addCleanup(delay.stop)
+
+    def enroll(self, payload):
+        self.client.force_authenticate(self.admin)
+        return self.client.post(f'/api/workout-challenges/{self.challenge.id}/enroll/', payload, format='json')
+
+    def test_join_is_idempotent(self):
+        url = f'/api/workout-challenges/{self.challenge.id}/join/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        user_challenge = UserChallenge.objects.get(user=self.user)
+        self.assertEqual(
+            set(user_challenge.exercise_progress.values_list('exercise_id', flat=True)),
+            {exercise.id for exercise in self.challenge_exercises},
+        )
+
+    def test_enroll_by_ids_skips_unknown_users(self):
+        self.client.post(f'/api/workout-challenges/{self.challenge.id}/join/')
+        user_ids = [self.user.id, self.others[0].id, self.others[1].id, 987654]
+        self.assertEqual(self.enroll({'user_ids': user_ids}).status_code, 202)
+        self.assertEqual(
+            set(UserChallenge.objects.values_list('user_id', flat=True)), {self.user.id, self.others[0].id, self.others[1].id},
+        )
+        self.assertEqual(UserChallengeExercise.objects.count(), 3 * len(self.challenge_exercises))
+
+    def test_enroll_rejects_malformed_input(self):
+        for payload in ({'user_ids': ['1', 2]}, {'user_ids': 5}, {'user_ids': [True]}, {'usernames': 'user0'}, {}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.enroll(payload).status_code, 400)
+        self.assertFalse(UserChallenge.objects.exists())
+
+    def test_enroll_all_users(self):
+        self.assertEqual(self.enroll({'all_users': True}).status_code, 202)
+        self.assertEqual(UserChallenge.objects.count(), User.objects.count())
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'/api/workout-challenges/{self.challenge.id}/enroll/', {'all_users': True}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ChallengeProgressTests(ChallengeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(f'/api/workout-challenges/{self.challenge.id}/join/')
+        self.user_challenge = UserChallenge.objects.get(user=self.user)
+
+    def complete(self, exercise, user_challenge_id=None):
+        return self.client.post(
+            f'/api/user-challenges/{user_challenge_id or self.user_challenge.id}/update_progress/',
+            {'exercise_id': exercise.id}, format='json',
+        )
+
+    def test_each_exercise_counts_once(self):
+        first, second, third = self.challenge_exercises[:3]
+        self.assertEqual(self.complete(first).json()['progress'], 1)
+        self.assertEqual(self.complete(first).json()['progress'], 1)
+        self.assertEqual(self.complete(second).json()['completed'], False)
+        data = self.complete(third).json()
+        self.assertEqual((data['progress'], data['completed']), (3, True))
+        self.assertEqual(sum(exercise['completed'] for exercise in data['exercises']), 3)
+
+    def test_unknown_targets_are_404(self):
+        other = Exercise.objects.create(name='Squat', muscle_group=self.muscle_group, exercise_type='Strength')
+        self.assertEqual(self.complete(other).status_code, 404)
+        self.assertEqual(self.complete(self.exercise, user_challenge_id='abc').status_code, 404)
+        self.client.force_authenticate(User.objects.create_user(username='bob'))
+        self.assertEqual(self.complete(self.exercise).status_code, 404)
+        self.assertEqual(UserChallenge.objects.get(pk=self.user_challenge.pk).progress, 0)
+
+
+class CatalogSyncTests(APITestCase):
+    def catalog_row(self, name, muscle_group='Chest', exercise_type='Strength', description=''):
+        return {'name': name, 'muscle_group': muscle_group, 'exercise_type': exercise_type, 'description': description}
+
+    def test_second_sync_changes_nothing(self):
+        rows = [self.catalog_row('Bench Press', description='Flat bench'), self.catalog_row('Squat', 'Legs')]
+        first = sync_catalog(rows)
+        self.assertEqual(
+            (first['muscle_groups_created'], first['created'], first['updated'], first['unchanged']), (1, 1, 1, 0),
+        )
+        exercises = sorted(Exercise.objects.values_list('id', 'name', 'muscle_group__name', 'description'))
+
+        second = sync_catalog(rows)
+        self.assertEqual(
+            (second['muscle_groups_created'], second['created'], second['updated'], second['unchanged']), (0, 0, 0, 2),
+        )
+        self.assertEqual(sorted(Exercise.objects.values_list('id', 'name', 'muscle_group__name', 'description')), exercises)
+
+    def test_exercise_under_duplicate_group_is_matched(self):
+        duplicate_group = MuscleGroup.objects.create(name='Chest')
+        fly = Exercise.objects.create(name='Fly', muscle_group=duplicate_group, exercise_type='Strength')
+        result = sync_catalog([self.catalog_row('Bench Press'), self.catalog_row('Fly', description='Cables')])
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        self.assertEqual(Exercise.objects.filter(name='Fly').get().description, 'Cables')
+        self.assertEqual(Exercise.objects.get(pk=fly.pk).muscle_group, duplicate_group)
+
+    def test_type_change_invalidates_routine_etag(self):
+        etag = self.client.get('/api/routines/')['ETag']
+        sync_catalog([self.catalog_row('Bench Press', exercise_type='Flexibility')])
+        response = self.client.get('/api/routines/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['exercises'][0]['exercise_type'], 'Flexibility')
+
+
+class CatalogDedupeTests(ChallengeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.copy = Exercise.objects.create(name='Bench Press', muscle_group=self.muscle_group, exercise_type='Strength')
+
+    def test_references_move_to_survivor_in_one_update(self):
+        other_copy = Exercise.objects.create(name='Bench Press', muscle_group=self.muscle_group, exercise_type='Strength')
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.copy)
+        RoutineExercise.objects.create(routine=self.routine, exercise=other_copy)
+        with CaptureQueriesContext(connection) as queries:
+            report = dedupe_catalog()
+        self.assertEqual(report['exercises'], [('Bench Press (Chest)', self.exercise.id, [self.copy.id, other_copy.id])])
+        self.assertEqual(report['references']['api_routineexercise'], (2, 0))
+        self.assertEqual(
+            sum(query['sql'].startswith('UPDATE "api_routineexercise"') for query in queries.captured_queries), 1,
+        )
+        self.assertEqual(set(self.routine.exercises.values_list('exercise_id', flat=True)), {self.exercise.id})
+        self.assertEqual(Exercise.objects.filter(name='Bench Press').count(), 1)
+
+    def test_colliding_progress_keeps_completed_row_and_recounts(self):
+        self.challenge.exercises.add(self.copy)
+        self.client.post(f'/api/workout-challenges/{self.challenge.id}/join/')
+        user_challenge = UserChallenge.objects.get(user=self.user)
+        for exercise in (self.copy, self.exercise, self.challenge_exercises[1]):
+            self.client.post(
+                f'/api/user-challenges/{user_challenge.id}/update_progress/', {'exercise_id': exercise.id}, format='json',
+            )
+        user_challenge.refresh_from_db()
+        self.assertEqual((user_challenge.progress, user_challenge.completed), (3, True))
+
+        with mock.patch('api.challenges.record_progress') as record_progress:
+            with self.captureOnCommitCallbacks(execute=True):
+                report = dedupe_catalog()
+        self.assertEqual(report['references']['api_userchallengeexercise'], (0, 1))
+        self.assertEqual(report['references']['api_workoutchallenge_exercises'], (0, 1))
+        self.assertEqual(
+            sorted(user_challenge.exercise_progress.values_list('exercise_id', 'completed')),
+            sorted([(exercise.id, exercise in self.challenge_exercises[:2]) for exercise in self.challenge_exercises]),
+        )
+        user_challenge.refresh_from_db()
+        self.assertEqual((user_challenge.progress, user_challenge.completed), (2, False))
+        [recorded] = record_progress.call_args.args[0]
+        self.assertEqual((recorded.pk, recorded.progress), (user_challenge.pk, 2))
+
+    def test_collision_keeps_the_completed_copy(self):
+        self.challenge.exercises.add(self.copy)
+        self.client.post(f'/api/workout-challenges/{self.challenge.id}/join/')
+        user_challenge = UserChallenge.objects.get(user=self.user)
+        self.client.post(
+            f'/api/user-challenges/{user_challenge.id}/update_progress/', {'exercise_id': self.copy.id}, format='json',
+        )
+        dedupe_catalog()
+        self.assertTrue(user_challenge.exercise_progress.get(exercise=self.exercise).completed)
+        self.assertEqual(UserChallenge.objects.get(pk=user_challenge.pk).progress, 1)
+
+    def test_dry_run_changes_nothing(self):
+        RoutineExercise.objects.create(routine=self.routine, exercise=self.copy)
+        report = dedupe_catalog(dry_run=True)
+        self.assertEqual(report['references']['api_routineexercise'], (1, 0))
+        self.assertTrue(Exercise.objects.filter(pk=self.copy.pk).exists())
+        self.assertTrue(self.routine.exercises.filter(exercise=self.copy).exists())
+
+    def test_duplicate_muscle_groups_merge(self):
+        duplicate_group = MuscleGroup.objects.create(name='Chest')
+        fly = Exercise.objects.create(name='Fly', muscle_group=duplicate_group, exercise_type='Strength')
+        report = dedupe_catalog(exercises=False)
+        self.assertEqual(report['muscle_groups'], [('Chest', self.muscle_group.id, [duplicate_group.id])])
+        self.assertEqual(Exercise.objects.get(pk=fly.pk).muscle_group_id, self.muscle_group.id)
+        self.assertFalse(MuscleGroup.objects.filter(pk=duplicate_group.pk).exists())
+
+
+class ChallengeListTests(ChallengeTestCase):
+    def setUp(self):
+        super().setUp()
+        today = timezone.now().date()
+        self.ended = WorkoutChallenge.objects.create(
+            name='Chest Week', description='', start_date=today - timedelta(days=10),
+            end_date=today - timedelta(days=4), goal=3, difficulty='Easy',
+        )
+        self.upcoming = WorkoutChallenge.objects.create(
+            name='Chest Week', description='', start_date=today + timedelta(days=4),
+            end_date=today + timedelta(days=10), goal=3, difficulty='Easy',
+        )
+
+    def listed(self, url='/api/workout-challenges/'):
+        return [challenge['id'] for challenge in self.client.get(url).json()]
+
+    def test_lists_running_challenges_and_upcoming_on_request(self):
+        self.assertEqual(self.listed(), [self.challenge.id])
+        self.assertEqual(self.listed('/api/workout-challenges/?upcoming=3'), [self.challenge.id])
+        self.assertEqual(self.listed('/api/workout-challenges/?upcoming=7'), [self.challenge.id, self.upcoming.id])
+        self.assertEqual(self.client.get('/api/workout-challenges/?upcoming=soon').status_code, 400)
+
+    def test_ended_challenges_cannot_be_joined(self):
+        self.assertEqual(self.client.post(f'/api/workout-challenges/{self.ended.id}/join/').status_code, 404)
+        self.assertEqual(self.client.post(f'/api/workout-challenges/{self.upcoming.id}/join/').status_code, 201)
+        self.assertEqual(self.client.get(f'/api/workout-challenges/{self.ended.id}/').status_code, 200)
+
+
+class ChallengeCalendarTests(TestCase):
+    def setUp(self):
+        muscle_group = MuscleGroup.objects.create(name='Legs')
+        for index in range(8):
+            Exercise.objects.create(name=f'Squat {index}', muscle_group=muscle_group, exercise_type='Strength')
+        self.start = timezone.now().date().replace(day=1)
+
+    def plan(self, **kwargs):
+        return plan_challenge_calendar(start=self.start, days=120, exercise_types=('Strength',), **kwargs)
+
+    def test_same_seed_plans_same_calendar(self):
+        first = [(challenge.name, challenge.start_date, challenge.exercise_ids) for challenge in self.plan(dry_run=True)]
+        second = [(challenge.name, challenge.start_date, challenge.exercise_ids) for challenge in self.plan(dry_run=True)]
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), len({(name, start_date) for name, start_date, _ in first}))
+
+    def test_consecutive_periods_differ_and_replanning_is_a_no_op(self):
+        planned = self.plan()
+        self.assertEqual(WorkoutChallenge.objects.count(), len(planned))
+        series = {}
+        for challenge in WorkoutChallenge.objects.prefetch_related('exercises').order_by('start_date'):
+            series.setdefault(challenge.name.split(':')[0], []).append(frozenset(exercise.id for exercise in challenge.exercises.all()))
+        self.assertEqual(len(series), 6)
+        for sets in series.values():
+            self.assertTrue(all(previous != current for previous, current in zip(sets, sets[1:])))
+
+        self.assertEqual(self.plan(), [])
+        self.assertEqual(WorkoutChallenge.objects.count(), len(planned))
+
+    def test_losing_a_race_to_another_planner_returns_nothing(self):
+        first = self.plan(dry_run=True)[0]
+        through = WorkoutChallenge.exercises.through
+        read_sets = through.objects.filter
+
+        def other_run_commits_first(*args, **kwargs):
+            # Runs after this planner read the existing periods.
+            WorkoutChallenge.objects.create(
+                name=first.name, description='', start_date=first.start_date, end_date=first.end_date, goal=1,
+                difficulty='Easy',
+            )
+            return read_sets(*args, **kwargs)
+
+        with mock.patch.object(through.objects, 'filter', side_effect=other_run_commits_first), \
+                self.assertLogs('api.challenge_calendar', 'INFO'):
+            self.assertEqual(self.plan(), [])
+        self.assertEqual(WorkoutChallenge.objects.count(), 1)
+
+    def test_other_integrity_errors_are_raised(self):
+        through = WorkoutChallenge.exercises.through
+        with mock.patch.object(through.objects, 'bulk_create', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            with self.assertRaises(IntegrityError):
+                self.plan()
+        self.assertFalse(WorkoutChallenge.objects.exists())
+
+    def test_period_is_unique(self):
+        challenge = self.plan()[0]
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            WorkoutChallenge.objects.create(
+                name=challenge.name, description='', start_date=challenge.start_date,
+                end_date=challenge.end_date, goal=1, difficulty='Easy',
+            )
+
+
+class IndexableSkipListTests(SimpleTestCase):
+    def test_matches_a_sorted_list(self):
+        rng = random.Random(7)
+        skiplist, expected = IndexableSkipList(seed=7), []
+        for _ in range(3000):
+            key = rng.randrange(500)
+            if key in expected and rng.random() < 0.5:
+                self.assertTrue(skiplist.remove(key))
+                expected.remove(key)
+            elif key not in expected:
+                skiplist.insert(key)
+                bisect.insort(expected, key)
+        self.assertEqual(len(skiplist), len(expected))
+        self.assertEqual(skiplist.slice(0, len(expected)), expected)
+        for position in range(0, len(expected), 7):
+            self.assertEqual(skiplist.rank(expected[position]), position)
+            self.assertEqual(skiplist.slice(position, position + 5), expected[position:position + 5])
+        self.assertIsNone(skiplist.rank(-1))
+        self.assertFalse(skiplist.remove(-1))
+        self.assertEqual(skiplist.slice(5, 5), [])
+
+
+class InMemoryLeaderboardTests(SimpleTestCase):
+    def setUp(self):
+        self.board = InMemoryLeaderboard()
+        self.now = timezone.now()
+
+    def test_ranks_by_progress_then_who_got_there_first(self):
+        self.board.update_many(1, [
+            (10, 3, self.now), (11, 5, self.now), (12, 3, self.now - timedelta(minutes=1)), (13, 1, self.now),
+        ])
+        self.assertEqual(self.board.range(1, 0, 10), [(11, 5), (12, 3), (10, 3), (13, 1)])
+        self.assertEqual(self.board.range(1, 0, 2), [(11, 5), (12, 3)])
+        self.assertEqual([self.board.rank(1, user_id) for user_id in (11, 12, 10, 13, 99)], [0, 1, 2, 3, None])
+        self.assertEqual(self.board.count(1), 4)
+        self.assertEqual(self.board.count(2), 0)
+
+    def test_updates_move_users_and_exact_ties_rank_higher_id_first(self):
+        self.board.update_many(1, [(9, 2, self.now), (10, 2, self.now), (20, 2, self.now)])
+        # Redis orders equal scores by zero-padded member, descending.
+        self.assertEqual([user_id for user_id, _ in self.board.range(1, 0, 3)], [20, 10, 9])
+        self.board.update_many(1, [(9, 4, self.now)])
+        self.assertEqual(self.board.range(1, 0, 3), [(9, 4), (20, 2), (10, 2)])
+        self.board.remove(1, 20)
+        self.assertEqual((self.board.rank(1, 10), self.board.count(1)), (1, 2))
+
+
+class LeaderboardTests(ChallengeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.board = get_leaderboard()
+        self.board.clear(self.challenge.id)
+        self.addCleanup(self.board.clear, self.challenge.id)
+        self.users = [User.objects.create_user(username=f'runner{index}') for index in range(12)]
+        for progress, user in enumerate(self.users):
+            with self.captureOnCommitCallbacks(execute=True):
+                UserChallenge.objects.create(user=user, challenge=self.challenge, progress=progress)
+
+    def test_top_and_around_me(self):
+        self.client.force_authenticate(self.users[5])
+        data = self.client.get(
+            f'/api/workout-challenges/{self.challenge.id}/leaderboard/', {'limit': 3, 'around_me': 1, 'radius': 2},
+        ).json()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(
+            [(row['rank'], row['username']) for row in data['top']], [(1, 'runner11'), (2, 'runner10'), (3, 'runner9')],
+        )
+        self.assertEqual(data['my_rank'], 7)
+        self.assertEqual([row['username'] for row in data['around_me']], [f'runner{index}' for index in (7, 6, 5, 4, 3)])
+
+    def test_not_on_board_has_no_rank(self):
+        data = self.client.get(f'/api/workout-challenges/{self.challenge.id}/leaderboard/', {'around_me': 'true'}).json()
+        self.assertIsNone(data['my_rank'])
+        self.assertNotIn('around_me', data)
+
+    def test_rebuild_matches_database(self):
+        UserChallenge.objects.filter(user=self.users[0]).update(progress=50)
+        self.board.update_many(self.challenge.id, [(self.user.id, 99, timezone.now())])
+        call_command('rebuild_leaderboards', challenges=[self.challenge.id], stdout=io.StringIO())
+        self.assertEqual(self.board.count(self.challenge.id), 12)
+        self.assertEqual(self.board.range(self.challenge.id, 0, 2), [(self.users[0].id, 50), (self.users[11].id, 11)])
+        self.assertIsNone(self.board.rank(self.challenge.id, self.user.id))
+
+
+class ConcurrentChallengeProgressTests(TransactionTestCase):
+    # SQLite's shared-cache test database locks out concurrent writers.
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_updates_count_each_exercise_once(self):
+        user = User.objects.create_user(username='alice')
+        muscle_group = MuscleGroup.objects.create(name='Legs')
+        exercises = [
+            Exercise.objects.create(name=f'Lunge {index}', muscle_group=muscle_group, exercise_type='Strength')
+            for index in range(2)
+        ]
+        challenge = WorkoutChallenge.objects.create(
+            name='Legs', description='Leg work', start_date=timezone.now().date(),
+            end_date=timezone.now().date(), goal=2, difficulty='Easy',
+        )
+        challenge.exercises.set(exercises)
+        user_challenge = UserChallenge.objects.create(user=user, challenge=challenge)
+        UserChallengeExercise.objects.bulk_create([
+            UserChallengeExercise(user_challenge=user_challenge, exercise=exercise) for exercise in exercises
+        ])
+
+        # Every exercise is tapped from several clients at once.
+        requests = [exercise for exercise in exercises for _ in range(3)]
+        barrier = threading.Barrier(len(requests))
+        statuses = []
+
+        def tap(exercise):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                response = client.post(
+                    f'/api/user-challenges/{user_challenge.id}/update_progress/', {'exercise_id': exercise.id}, format='json',
+                )
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=tap, args=(exercise,)) for exercise in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [200] * len(requests))
+        user_challenge.refresh_from_db()
+        self.assertEqual((user_challenge.progress, user_challenge.completed), (2, True))
+
+
+class CachedTokenAuthenticationTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.local.clear()
+        self.user = User.objects.create_user(username='alice', password='password')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_skips_queries_until_revoked(self):
+        self.assertEqual(self.client.get('/api/reminders/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/reminders/').status_code, 200)
+        self.assertFalse(any('authtoken' in query['sql'] for query in queries.captured_queries))
+
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/reminders/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/reminders/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/reminders/').status_code, 401)
+
+    def test_snapshot_loaded_before_a_revocation_is_not_served(self):
+        # The test cache stands in for one shared by every process.
+        snapshots = TokenSnapshotCache(local_ttl=0, shared=True)
+        loads = []
+
+        def revoked_while_loading(key):
+            loads.append(key)
+            if len(loads) == 1:
+                # The token is revoked after this lookup read it, but before
+                # the snapshot reaches the cache.
+                snapshots.invalidate(key)
+            return (self.user, self.token)
+
+        snapshots.get_or_load('token', revoked_while_loading)
+        snapshots.get_or_load('token', revoked_while_loading)
+        self.assertEqual(len(loads), 2)
+        snapshots.get_or_load('token', revoked_while_loading)
+        self.assertEqual(len(loads), 2)
+
+
+    def test_per_process_cache_keeps_snapshots_only_for_local_ttl(self):
+        snapshots = TokenSnapshotCache(local_ttl=0.05)
+        loads = []
+
+        def load(key):
+            loads.append(key)
+            return (self.user, self.token)
+
+        snapshots.get_or_load('token', load)
+        snapshots.get_or_load('token', load)
+        self.assertEqual(len(loads), 1)
+        # A revocation in another worker would never reach this cache.
+        time.sleep(0.1)
+        snapshots.get_or_load('token', load)
+        self.assertEqual(len(loads), 2)
+        self.assertEqual(TokenSnapshotCache(local_ttl=5, timeout=300, shared=True).shared_timeout(), 300)
+
+
+class MiddlewareTests(SimpleTestCase):
+    def test_every_middleware_is_async_capable(self):
+        # Under ASGI a single sync-only middleware makes Django serve every
+        # request below it from one shared thread.
+        for path in settings.MIDDLEWARE:
+            with self.subTest(middleware=path):
+                self.assertTrue(getattr(import_string(path), 'async_capable', False))
+
+
+class AsyncReadURLs:
+    """The async read views, as api/urls.py routes them with ASYNC_READ_ENDPOINTS on."""
+    urlpatterns = [path('api/exercises/', async_views.exercise_list, name='exercise-list')]
+
+
+@override_settings(ROOT_URLCONF=AsyncReadURLs)
+class AsyncReadViewTests(TransactionTestCase):
+    def setUp(self):
+        catalog_cache.invalidate()
+        self.token = Token.objects.create(user=User.objects.create_user(username='alice'))
+        muscle_group = MuscleGroup.objects.create(name='Chest')
+        for index in range(3):
+            Exercise.objects.create(name=f'Press {index}', muscle_group=muscle_group, exercise_type='Strength')
+
+    def asgi_get(self, path, query=b''):
+        """Serve a GET through Django's ASGI handler, as uvicorn would."""
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': query,
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Token {self.token.key}'.encode())],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(ASGIHandler())(scope, receive, send)
+        body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+        return messages[0]['status'], body
+
+    def test_streamed_fallback_is_served(self):
+        status, body = self.asgi_get('/api/exercises/')
+        self.assertEqual(status, 200)
+        listed = json.loads(body)
+        status, body = self.asgi_get('/api/exercises/', b'stream=1')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(row['id'] for row in json.loads(body)), sorted(row['id'] for row in listed))
+
+
+class MetricsMiddlewareTests(APITestCase):
+    def test_requests_and_queries_are_recorded(self):
+        def routine_list_queries():
+            for name, labels, _, counts, total in registry.snapshot()['histograms']:
+                if name == 'http_request_db_queries' and labels == ['routine-list', 'GET']:
+                    return sum(counts), total
+            return 0, 0
+
+        requests, queries = routine_list_queries()
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/api/routines/')
+        self.assertEqual(routine_list_queries(), (requests + 1, queries + len(captured)))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+class ConnectionPoolTests(TestCase):
+    def make_pool(self, **options):
+        from .db_backends.postgresql_pooled.base import _connect, _ping, _reset
+
+        params = connection.get_connection_params()
+        pool = ConnectionPool(lambda: _connect(params, {}), ping=_ping, reset=_reset, **options)
+        self.addCleanup(pool.closeall)
+        return pool
+
+    @staticmethod
+    def backend_pid(conn):
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_returned_connection_is_reused(self):
+        pool = self.make_pool(max_size=2)
+        conn = pool.getconn()
+        pid = self.backend_pid(conn)
+        self.assertEqual((pool.stats()['in_use'], pool.stats()['idle']), (1, 0))
+        pool.putconn(conn)
+        self.assertEqual((pool.stats()['in_use'], pool.stats()['idle']), (0, 1))
+        conn = pool.getconn()
+        self.assertEqual(self.backend_pid(conn), pid)
+        pool.putconn(conn)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        pool = self.make_pool(max_size=1)
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pool_leftover (id int)')
+        pool.putconn(conn)
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.pool_leftover')")
+            self.assertIsNone(cursor.fetchone()[0])
+        pool.putconn(conn)
+
+    def test_checkout_waits_for_a_free_slot_then_times_out(self):
+        pool = self.make_pool(max_size=2, timeout=0.2)
+        first, second = pool.getconn(), pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        threading.Timer(0.05, pool.putconn, args=(first,)).start()
+        third = pool.getconn()
+        self.assertIs(third, first)
+        self.assertEqual(pool.stats()['size'], 2)
+        pool.putconn(second)
+        pool.putconn(third)
+
+    def test_idle_connections_above_min_size_are_closed(self):
+        pool = self.make_pool(min_size=1, max_size=3, max_idle=0.05)
+        connections = [pool.getconn() for _ in range(3)]
+        for conn in connections[:2]:
+            pool.putconn(conn)
+        time.sleep(0.1)
+        pool.putconn(connections[2])
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['idle'], stats['discarded']), (1, 1, 2))
+        self.assertTrue(all(conn.closed for conn in connections[:2]))
+
+    def test_dead_connection_is_replaced_on_checkout(self):
+        pool = self.make_pool(max_size=1)
+        conn = pool.getconn()
+        pid = self.backend_pid(conn)
+        pool.putconn(conn)
+        other_pool = self.make_pool(max_size=1)
+        other = other_pool.getconn()
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        other_pool.putconn(other)
+        conn = pool.getconn()
+        self.assertNotEqual(self.backend_pid(conn), pid)
+        self.assertEqual(pool.stats()['discarded'], 1)
+        pool.putconn(conn)
+
+
+class MetricsEndpointTests(APITestCase):
+    def test_hidden_without_token_or_allowed_network(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        with override_settings(METRICS_ALLOWED_NETWORKS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+
+    def test_exited_processes_are_archived_without_losing_counts(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(lambda: [os.remove(os.path.join(directory, name)) for name in os.listdir(directory)])
+
+        def write(name, value):
+            with open(os.path.join(directory, name), 'w') as output:
+                json.dump({'counters': [['http_requests_total', ['routine-list', 'GET', '200'], value]], 'histograms': []}, output)
+
+        def scraped_total():
+            body = self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').content.decode()
+            line = next(line for line in body.splitlines() if line.startswith('http_requests_total{view="routine-list"'))
+            return float(line.rsplit(' ', 1)[1])
+
+        # A pid above pid_max never runs, standing in for exited workers.
+        write('99999999-a.json', 2)
+        write('99999999-b.json', 3)
+        write(f'{os.getpid()}-other.json', 4)
+        with override_settings(METRICS_MULTIPROC_DIR=directory, METRICS_ALLOWED_NETWORKS=['127.0.0.1/32']):
+            before = scraped_total()
+            archive_exited_processes(directory)
+            self.assertEqual(scraped_total(), before)
+            names = set(os.listdir(directory))
+            self.assertNotIn('99999999-a.json', names)
+            self.assertIn(f'{os.getpid()}-other.json', names)
+            self.assertIn('archive.json', names)
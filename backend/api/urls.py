@@ -3,8 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet, MuscleGroupViewSet, ExerciseViewSet, RoutineViewSet,
     RoutineExerciseViewSet, CompletedExerciseViewSet, ReminderViewSet,
-    register, login, save_completed_workout, user_profile, update_profile,
+    register, login, save_completed_workout, save_completed_workouts_batch, user_profile, update_profile,
     get_exercise_types, ExerciseOfTheDayViewSet, ProgressView,change_password, delete_account,
+    database_pool_stats,
     WorkoutChallengeViewSet, UserChallengeViewSet,
 
 )
@@ -22,11 +23,23 @@ router.register(r'reminders', ReminderViewSet, basename='reminder')
 router.register(r'exercise-of-the-day', ExerciseOfTheDayViewSet)
 router.register(r'workout-challenges', WorkoutChallengeViewSet)
 router.register(r'user-challenges', UserChallengeViewSet, basename='user-challenge')
-urlpatterns = [
+urlpatterns = []
+if settings.ASYNC_READ_ENDPOINTS:
+    from . import async_views
+    # Matched before the router, so these paths resolve to the async views.
+    urlpatterns += [
+        path('progress/', async_views.progress, name='progress'),
+        path('exercises/', async_views.exercise_list, name='exercise-list'),
+        path('routines/', async_views.routine_list, name='routine-list'),
+        path('exercise-of-the-day/today/', async_views.exercise_of_the_day_today, name='exerciseoftheday-today'),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
     path('register/', register, name='register'),
     path('login/', login, name='login'),
     path('completed-workouts/', save_completed_workout, name='save_completed_workout'),
+    path('completed-workouts/batch/', save_completed_workouts_batch, name='save_completed_workouts_batch'),
     path('user-profile/', user_profile, name='user_profile'),
     path('update-profile/', update_profile, name='update_profile'),
     path('exercise-types/', get_exercise_types, name='exercise-types'),
@@ -35,6 +48,7 @@ urlpatterns = [
     path('progress/', ProgressView.as_view(), name='progress'),
     path('change-password/', change_password, name='change_password'),
     path('delete-account/', delete_account, name='delete_account'),
+    path('db-pool-stats/', database_pool_stats, name='database_pool_stats'),
     # path('join-challenge/<int:challenge_id>/', join_challenge, name='join-challenge'),
     # path('update-challenge-progress/<int:user_challenge_id>/', update_challenge_progress, name='update-challenge-progress'),
 
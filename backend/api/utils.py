@@ -1,3 +1,5 @@
+from datetime import datetime, time, timedelta
+
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 
@@ -5,3 +7,12 @@ def parse_date_or_default(date_string, default_days=30):
     if date_string:
         return parse_date(date_string)
     return timezone.now().date() - timezone.timedelta(days=default_days)
+
+def day_bounds(day):
+    """Aware [start, end) datetimes of `day` in the current time zone.
+
+    Filtering with `__gte`/`__lt` on these instead of `__date` keeps the
+    column bare, so an index on it can be range scanned.
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
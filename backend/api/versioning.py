@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+User = get_user_model()
+
+_batch = threading.local()
+
+
+def bump_data_version(user_id=None, **lookups):
+    """Invalidate every ETag handed out for a user's data.
+
+    Pass the user's id, or lookups that select the owning user(s), e.g.
+    `bump_data_version(routines__id=routine_id)`. Inside
+    batched_data_version_bumps() the bump is held back and deduplicated.
+    """
+    if user_id is not None:
+        lookups['pk'] = user_id
+    pending = getattr(_batch, 'pending', None)
+    if pending is not None:
+        pending.add(tuple(sorted(lookups.items())))
+        return
+    User.objects.filter(**lookups).update(data_version=F('data_version') + 1)
+
+
+@contextmanager
+def batched_data_version_bumps():
+    """Collect the bumps made inside the block and apply each one once at the end.
+
+    Bulk writes touching many rows of one user would otherwise run one
+    UPDATE per row from the signal receivers.
+    """
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = set()
+    try:
+        yield
+        pending = _batch.pending
+    finally:
+        _batch.pending = None
+
+    user_ids = set()
+    for lookups in map(dict, pending):
+        if list(lookups) == ['pk']:
+            user_ids.add(lookups['pk'])
+        else:
+            bump_data_version(**lookups)
+    if user_ids:
+        User.objects.filter(pk__in=user_ids).update(data_version=F('data_version') + 1)
+
+
+def current_data_version(user):
+    """Re-read the user's data_version, which the auth snapshot may hold stale."""
+    user.data_version = User.objects.filter(pk=user.pk).values_list('data_version', flat=True).first() or 0
+    return user.data_version
+
+
+def data_version_etag(request, *parts):
+    user = request.user
+    current_data_version(user)
+    params = getattr(request, 'query_params', request.GET)
+    query = '&'.join(f'{key}={value}' for key, value in sorted(params.lists()))
+    key = ':'.join(str(part) for part in (request.path, user.pk, user.data_version, query) + parts)
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+
+def conditional_on_data_version(view_method=None, *, etag_parts=None):
+    """Answer If-None-Match with a 304 before the view does any work.
+
+    The ETag only depends on the request path, the query params and the
+    user's data_version, so a matching request costs a single primary-key
+    lookup of that one column. Views whose response also depends on
+    something else, like dates defaulted relative to today, pass
+    `etag_parts(request)` returning those values.
+    """
+    if view_method is None:
+        return partial(conditional_on_data_version, etag_parts=etag_parts)
+    # Imported here so app loading (signals use bump_data_version) doesn't pull in DRF.
+    from rest_framework import status
+    from rest_framework.response import Response
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        etag = data_version_etag(request, *(etag_parts(request) if etag_parts else ()))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+    return wrapper
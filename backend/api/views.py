@@ -7,15 +7,28 @@ from datetime import timedelta,datetime
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework.authtoken.models import Token
-from .models import MuscleGroup, Exercise, Routine, RoutineExercise, CompletedWorkout, FavoriteExercise, ExerciseOfTheDay,CompletedExercise, Reminder,WorkoutChallenge,UserChallenge,UserChallengeExercise
+from .models import MuscleGroup, Exercise, Routine, RoutineExercise, CompletedWorkout, FavoriteExercise, ExerciseOfTheDay,CompletedExercise, Reminder,WorkoutChallenge,UserChallenge,UserChallengeExercise, DailyProgress
 from django.views.decorators.csrf import csrf_exempt
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+import json
 import logging
+import os
+from collections import defaultdict
 from rest_framework.views import APIView
+from django.db import IntegrityError, transaction
 from django.db.models import Sum, Count
 from django.utils.dateparse import parse_date
 from django.db.models.functions import TruncDate, TruncWeek
 from .utils import parse_date_or_default
-from random import choice
+from .pagination import ExerciseKeysetPagination
+from .prefetch import PrefetchPlanMixin
+from .cache import catalog_cache
+from .search import get_search_backend
+from .versioning import bump_data_version, conditional_on_data_version
+from .rollups import apply_workouts_bulk
+from .db_pool import pool_stats
+from .daily_exercise import exercise_of_the_day as exercise_of_the_day_for
 from django.contrib.auth.decorators import login_required
 
 from .serializers import (
@@ -23,6 +36,7 @@ from .serializers import (
     RoutineSerializer, RoutineExerciseSerializer, CompletedExerciseSerializer,
     ReminderSerializer, RoutineDetailSerializer, CompletedWorkoutSerializer,UserProfileSerializer, UserProfileUpdateSerializer,
     RoutineDetailSerializer,FavoriteExerciseSerializer, ExerciseOfTheDaySerializer,ProgressSerializer,WorkoutChallengeSerializer,UserChallengeSerializer,
+    CompletedWorkoutBatchItemSerializer, cached_exercise_data,
 )
 
 
@@ -40,16 +54,72 @@ class MuscleGroupViewSet(viewsets.ModelViewSet):
     serializer_class = MuscleGroupSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        content = catalog_cache.get_json(
+            'muscle_groups',
+            lambda: self.get_serializer(self.get_queryset(), many=True).data,
+        )
+        return HttpResponse(content, content_type='application/json')
+
 
 class ExerciseViewSet(viewsets.ModelViewSet):
     queryset = Exercise.objects.all()
     serializer_class = ExerciseSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    keyset_pagination_class = ExerciseKeysetPagination
+    stream_chunk_size = 2000
+
     def list(self, request):
         exercises = self.get_queryset()
-        serializer = self.get_serializer(exercises, many=True)
-        return Response(serializer.data)
+
+        # Opt-in modes for large catalogs: ?cursor=/&page_size= for keyset
+        # pages, ?stream=1 for the whole catalog without buffering it.
+        if request.query_params.get('stream') in ('1', 'true'):
+            return self.stream_list(exercises)
+
+        paginator = self.keyset_pagination_class()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(exercises, request, view=self)
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        content = catalog_cache.get_json(
+            'exercises',
+            lambda: self.get_serializer(exercises, many=True).data,
+        )
+        return HttpResponse(content, content_type='application/json')
+
+    def stream_list(self, exercises):
+        fields = ExerciseSerializer.Meta.fields
+        rows = exercises.order_by('muscle_group_id', 'id').values(*fields).iterator(chunk_size=self.stream_chunk_size)
+
+        def generate():
+            yield '['
+            for index, row in enumerate(rows):
+                yield (',' if index else '') + json.dumps(row, cls=DjangoJSONEncoder)
+            yield ']'
+
+        return StreamingHttpResponse(generate(), content_type='application/json')
+
+    @action(detail=False, methods=['GET'])
+    def search(self, request):
+        query = request.query_params.get('q', '')
+        exercise_type = request.query_params.get('exercise_type') or None
+        try:
+            muscle_group = request.query_params.get('muscle_group')
+            muscle_group = int(muscle_group) if muscle_group else None
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            return Response({'error': 'muscle_group and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = get_search_backend().search(query, muscle_group=muscle_group, exercise_type=exercise_type, limit=limit)
+        results = []
+        for exercise_id, score in matches:
+            data = cached_exercise_data(exercise_id)
+            if data is not None:
+                results.append(dict(data, score=round(score, 4)))
+        return Response(results)
 
     @action(detail=False, methods=['GET'])
     def favorites(self, request):
@@ -80,27 +150,32 @@ class ExerciseOfTheDayViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=['GET'])
     def today(self, request):
-        today = timezone.now().date()
-        try:
-            exercise_of_the_day = ExerciseOfTheDay.objects.get(date=today)
-        except ExerciseOfTheDay.DoesNotExist:
-            # If there's no exercise for today, create one randomly
-            random_exercise = choice(Exercise.objects.all())
-            exercise_of_the_day = ExerciseOfTheDay.objects.create(date=today, exercise=random_exercise)
+        exercise_of_the_day = exercise_of_the_day_for(timezone.now().date())
+        if exercise_of_the_day is None:
+            return Response({"message": "No exercises available."}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = self.get_serializer(exercise_of_the_day)
         return Response(serializer.data)
 
 
-class RoutineViewSet(viewsets.ModelViewSet):
+class RoutineViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = RoutineSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return Routine.objects.filter(user=self.request.user)
 
+    @conditional_on_data_version
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_on_data_version
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+        self.refresh_prefetch(serializer.instance)
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -119,15 +194,22 @@ class RoutineViewSet(viewsets.ModelViewSet):
             logger.exception(f"Error during update: {str(e)}")
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if getattr(instance, '_prefetched_objects_cache', None):
-            instance._prefetched_objects_cache = {}
+        self.refresh_prefetch(instance)
 
         return Response(serializer.data)
 
-    @action(detail=True, methods=['get'])
-    def detail(self, request, pk=None):
+    def get_serializer_class(self):
+        if self.action == 'full_detail':
+            return RoutineDetailSerializer
+        return super().get_serializer_class()
+
+    # Not named `detail`: DRF sets self.detail on every request, which
+    # would shadow the method.
+    @action(detail=True, methods=['get'], url_path='detail')
+    @conditional_on_data_version
+    def full_detail(self, request, pk=None):
         routine = self.get_object()
-        serializer = RoutineDetailSerializer(routine)
+        serializer = self.get_serializer(routine)
         return Response(serializer.data)
 
 
@@ -241,6 +323,100 @@ def save_completed_workout(request):
 
 
 
+BATCH_UPLOAD_LIMIT = 500
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def save_completed_workouts_batch(request):
+    """Sync many offline sessions, each with its completed exercises, in one request.
+
+    Every session carries a client idempotency_key; sessions already
+    uploaded are reported as duplicates instead of being stored twice.
+    All sessions are validated up front, then the valid ones are written
+    with one bulk_create per table inside a single transaction.
+    """
+    sessions = request.data.get('sessions') if isinstance(request.data, dict) else request.data
+    if not isinstance(sessions, list) or not sessions:
+        return Response({'error': 'Expected a non-empty list of sessions.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(sessions) > BATCH_UPLOAD_LIMIT:
+        return Response({'error': f'At most {BATCH_UPLOAD_LIMIT} sessions per batch.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = [None] * len(sessions)
+    valid = []
+    for index, item in enumerate(sessions):
+        serializer = CompletedWorkoutBatchItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            key = item.get('idempotency_key') if isinstance(item, dict) else None
+            results[index] = {'idempotency_key': key, 'status': 'invalid', 'errors': serializer.errors}
+
+    user = request.user
+    routine_ids = {data['routine_id'] for _, data in valid}
+    owned_routines = set(Routine.objects.filter(user=user, id__in=routine_ids).values_list('id', flat=True))
+    routine_exercise_ids = {entry['routine_exercise_id'] for _, data in valid for entry in data.get('exercises', [])}
+    routine_exercise_routines = dict(RoutineExercise.objects.filter(
+        routine__user=user, id__in=routine_exercise_ids
+    ).values_list('id', 'routine_id'))
+    existing = dict(CompletedWorkout.objects.filter(
+        user=user, idempotency_key__in=[data['idempotency_key'] for _, data in valid]
+    ).values_list('idempotency_key', 'id'))
+
+    accepted = []
+    seen_keys = set()
+    for index, data in valid:
+        key = data['idempotency_key']
+        if key in existing:
+            results[index] = {'idempotency_key': key, 'status': 'duplicate', 'id': existing[key]}
+            continue
+        errors = {}
+        if key in seen_keys:
+            errors['idempotency_key'] = ['Repeated within this batch.']
+        if data['routine_id'] not in owned_routines:
+            errors['routine'] = ['Routine not found.']
+        elif any(routine_exercise_routines.get(entry['routine_exercise_id']) != data['routine_id']
+                 for entry in data.get('exercises', [])):
+            errors['exercises'] = ['Every exercise must belong to the session routine.']
+        if errors:
+            results[index] = {'idempotency_key': key, 'status': 'invalid', 'errors': errors}
+            continue
+        seen_keys.add(key)
+        accepted.append((index, data))
+
+    try:
+        with transaction.atomic():
+            workouts = [
+                CompletedWorkout(user=user, **{field: value for field, value in data.items() if field != 'exercises'})
+                for _, data in accepted
+            ]
+            CompletedWorkout.objects.bulk_create(workouts, batch_size=500)
+            if workouts and workouts[0].pk is None:
+                # Backends that can't return ids from a bulk insert.
+                ids = dict(CompletedWorkout.objects.filter(user=user, idempotency_key__in=seen_keys).values_list('idempotency_key', 'id'))
+                for workout in workouts:
+                    workout.pk = ids[workout.idempotency_key]
+
+            completed_exercises = [
+                CompletedExercise(completed_workout=workout, **entry)
+                for workout, (_, data) in zip(workouts, accepted)
+                for entry in data.get('exercises', [])
+            ]
+            CompletedExercise.objects.bulk_create(completed_exercises, batch_size=1000)
+
+            apply_workouts_bulk(workouts, {workout.pk: len(data.get('exercises', [])) for workout, (_, data) in zip(workouts, accepted)})
+            if workouts:
+                bump_data_version(user.pk)
+    except IntegrityError:
+        # Another upload with the same keys committed first; a retry will
+        # report those sessions as duplicates.
+        return Response({'error': 'Conflicting upload in progress, please retry.'}, status=status.HTTP_409_CONFLICT)
+
+    for workout, (index, _) in zip(workouts, accepted):
+        results[index] = {'idempotency_key': workout.idempotency_key, 'status': 'created', 'id': workout.pk}
+
+    return Response({'results': results}, status=status.HTTP_201_CREATED if workouts else status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_profile(request):
@@ -261,60 +437,77 @@ def update_profile(request):
 class ProgressView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_on_data_version(etag_parts=lambda request: progress_date_range(request.query_params))
     def get(self, request):
-        start_date = parse_date_or_default(request.query_params.get('start_date'))
-        end_date = parse_date_or_default(request.query_params.get('end_date'), default_days=0)
+        start_date, end_date = progress_date_range(request.query_params)
 
-        completed_workouts = CompletedWorkout.objects.filter(
+        # One row per active day from the rollup instead of scanning workout history.
+        daily_progress = list(DailyProgress.objects.filter(
             user=request.user,
-            started_at__date__range=[start_date, end_date]
-        ).order_by('started_at')
-
-        progress_data = completed_workouts.annotate(
-            date=TruncDate('started_at')
-        ).values('date').annotate(
-            completedExercises=Count('completed_exercises'),
-            totalWorkoutTime=Sum('duration'),
-            caloriesBurned=Sum('calories_burned')
-        ).order_by('date')
-
-        for entry in progress_data:
-            entry['totalWorkoutTime'] = entry['totalWorkoutTime'].total_seconds() // 60 if entry['totalWorkoutTime'] else 0
-
-        summary_data = {
-            'totalWorkouts': completed_workouts.count(),
-            'totalCaloriesBurned': completed_workouts.aggregate(Sum('calories_burned'))['calories_burned__sum'] or 0,
-            'totalWorkoutTime': (completed_workouts.aggregate(Sum('duration'))['duration__sum'] or timezone.timedelta()).total_seconds() // 60,
-            'totalExercisesCompleted': CompletedExercise.objects.filter(completed_workout__in=completed_workouts).count(),
-            'workoutDistribution': self.get_workout_distribution(completed_workouts),
-            'weeklyProgress': self.get_weekly_progress(completed_workouts),
-        }
+            date__range=[start_date, end_date]
+        ).order_by('date'))
+        routine_ids = {int(routine_id) for day in daily_progress for routine_id in day.routine_counts}
+        routine_names = dict(Routine.objects.filter(id__in=routine_ids).values_list('id', 'name'))
+
+        return Response(progress_data(daily_progress, routine_names))
 
-        return Response({
-            'progress': progress_data,
-            'summary': summary_data,
-        })
 
-    def get_workout_distribution(self, completed_workouts):
-        distribution = completed_workouts.values('routine__name').annotate(count=Count('id'))
-        return [{'name': item['routine__name'], 'value': item['count']} for item in distribution]
+def progress_date_range(params):
+    """The (start, end) dates of a progress request; the last 30 days by default."""
+    return (
+        parse_date_or_default(params.get('start_date')),
+        parse_date_or_default(params.get('end_date'), default_days=0),
+    )
 
-    def get_weekly_progress(self, completed_workouts):
-        weekly_progress = completed_workouts.annotate(
-            week=TruncWeek('started_at')
-        ).values('week').annotate(
-            workouts=Count('id'),
-            exercises=Count('completed_exercises')
-        ).order_by('week')
 
-        return [
+def progress_data(daily_progress, routine_names):
+    """The progress page payload from DailyProgress rows and the user's routine names."""
+    return {
+        'progress': [
             {
-                'week': item['week'].strftime('%Y-%m-%d'),
-                'workouts': item['workouts'],
-                'exercises': item['exercises']
+                'date': day.date,
+                'completedExercises': day.exercise_count,
+                'totalWorkoutTime': day.total_duration.total_seconds() // 60,
+                'caloriesBurned': day.calories_burned,
             }
-            for item in weekly_progress
-        ]
+            for day in daily_progress
+        ],
+        'summary': {
+            'totalWorkouts': sum(day.workout_count for day in daily_progress),
+            'totalCaloriesBurned': sum(day.calories_burned for day in daily_progress),
+            'totalWorkoutTime': sum((day.total_duration for day in daily_progress), timezone.timedelta()).total_seconds() // 60,
+            'totalExercisesCompleted': sum(day.exercise_count for day in daily_progress),
+            'workoutDistribution': get_workout_distribution(daily_progress, routine_names),
+            'weeklyProgress': get_weekly_progress(daily_progress),
+        },
+    }
+
+
+def get_workout_distribution(daily_progress, routine_names):
+    distribution = defaultdict(int)
+    for day in daily_progress:
+        for routine_id, count in day.routine_counts.items():
+            if int(routine_id) in routine_names:
+                distribution[routine_names[int(routine_id)]] += count
+    return [{'name': name, 'value': count} for name, count in distribution.items()]
+
+
+def get_weekly_progress(daily_progress):
+    weekly_progress = {}
+    for day in daily_progress:
+        week = day.date - timezone.timedelta(days=day.date.weekday())
+        item = weekly_progress.setdefault(week, {'workouts': 0, 'exercises': 0})
+        item['workouts'] += day.workout_count
+        item['exercises'] += day.exercise_count
+
+    return [
+        {
+            'week': week.strftime('%Y-%m-%d'),
+            'workouts': item['workouts'],
+            'exercises': item['exercises']
+        }
+        for week, item in sorted(weekly_progress.items())
+    ]
 
 from django.contrib.auth import update_session_auth_hash
 
@@ -342,15 +535,28 @@ def delete_account(request):
         return Response({'message': 'Account deleted successfully.'}, status=status.HTTP_204_NO_CONTENT)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def database_pool_stats(request):
+    # Only the pools of the process that serves this request.
+    return Response({'pid': os.getpid(), 'pools': pool_stats()})
+
+
 
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import WorkoutChallenge, UserChallenge, UserChallengeExercise
-from .serializers import WorkoutChallengeSerializer, UserChallengeSerializer, UserChallengeExerciseSerializer
-
-class WorkoutChallengeViewSet(viewsets.ModelViewSet):
+from .serializers import WorkoutChallengeSerializer, WorkoutChallengeSummarySerializer, UserChallengeSerializer, UserChallengeExerciseSerializer
+from django.db.models import BooleanField, Case, F, OuterRef, Prefetch, Subquery, Value, When
+from django.http import Http404
+from .challenge_calendar import PLAN_DAYS_AHEAD
+from .challenges import enroll_users
+from .leaderboards import get_leaderboard, record_progress
+from .tasks import enroll_users_in_challenge
+
+class WorkoutChallengeViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     queryset = WorkoutChallenge.objects.all()
     serializer_class = WorkoutChallengeSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -358,82 +564,227 @@ class WorkoutChallengeViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['POST'])
     def join(self, request, pk=None):
         challenge = self.get_object()
-        user = request.user
-        user_challenge, created = UserChallenge.objects.get_or_create(user=user, challenge=challenge)
-
-        if created:
-            for exercise in challenge.exercises.all():
-                UserChallengeExercise.objects.create(user_challenge=user_challenge, exercise=exercise)
+        if enroll_users(challenge.id, [request.user.id]):
             return Response({"message": "Successfully joined the challenge."}, status=status.HTTP_201_CREATED)
         return Response({"message": "You've already joined this challenge."}, status=status.HTTP_200_OK)
 
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        data = serializer.data
-        user_challenge = UserChallenge.objects.filter(user=request.user, challenge=instance).first()
-        if user_challenge:
-            exercise_progress = UserChallengeExercise.objects.filter(user_challenge=user_challenge)
-            data['exercises'] = [
-                {
-                    'id': progress.exercise.id,
-                    'name': progress.exercise.name,
-                    'completed': progress.completed
-                }
-                for progress in exercise_progress
-            ]
-            data['user_challenge_id'] = user_challenge.id
-            data['progress'] = user_challenge.progress
-            data['completed'] = user_challenge.completed
-            data['has_joined'] = True
-        else:
-            data['exercises'] = [
-                {
-                    'id': exercise.id,
-                    'name': exercise.name,
-                    'completed': False
-                }
-                for exercise in instance.exercises.all()
+    @action(detail=True, methods=['GET'])
+    def leaderboard(self, request, pk=None):
+        """Top participants, plus the requester's rank and neighbours with ?around_me=1."""
+        challenge = get_object_or_404(WorkoutChallenge.objects.only('id'), pk=pk)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 100))
+            radius = max(0, min(int(request.query_params.get('radius', 5)), 50))
+        except ValueError:
+            return Response({"message": "limit and radius must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        board = get_leaderboard()
+        sections = {'top': (0, board.range(challenge.id, 0, limit))}
+        rank = None
+        if request.query_params.get('around_me') in ('1', 'true'):
+            rank = board.rank(challenge.id, request.user.id)
+            if rank is not None:
+                start = max(rank - radius, 0)
+                sections['around_me'] = (start, board.range(challenge.id, start, rank + radius + 1))
+
+        user_ids = {user_id for _, entries in sections.values() for user_id, _ in entries}
+        usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+        data = {'count': board.count(challenge.id)}
+        for name, (start, entries) in sections.items():
+            data[name] = [
+                {'rank': start + offset + 1, 'user_id': user_id, 'username': usernames.get(user_id), 'progress': progress}
+                for offset, (user_id, progress) in enumerate(entries)
             ]
-            data['user_challenge_id'] = None
-            data['progress'] = 0
-            data['completed'] = False
-            data['has_joined'] = False
+        if 'around_me' in request.query_params:
+            data['my_rank'] = rank + 1 if rank is not None else None
         return Response(data)
 
-class UserChallengeViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['POST'], permission_classes=[permissions.IsAdminUser])
+    def enroll(self, request, pk=None):
+        """Enroll many users at once in a background job.
+
+        Accepts {"user_ids": [...]}, {"usernames": [...]} or
+        {"all_users": true} for every active user.
+        """
+        challenge = self.get_object()
+        user_ids = request.data.get('user_ids')
+        usernames = request.data.get('usernames')
+        if usernames is not None:
+            if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+                return Response({"message": "usernames must be a list of strings."}, status=status.HTTP_400_BAD_REQUEST)
+            user_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+        elif user_ids is not None:
+            if not isinstance(user_ids, list) or not all(
+                isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in user_ids
+            ):
+                return Response({"message": "user_ids must be a list of integers."}, status=status.HTTP_400_BAD_REQUEST)
+            # Unknown ids would fail the task's bulk insert for their whole chunk.
+            user_ids = list(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        elif not request.data.get('all_users'):
+            return Response({"message": "Provide user_ids, usernames or all_users."}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = enroll_users_in_challenge.delay(challenge.id, user_ids=user_ids)
+        return Response({"task_id": job.id}, status=status.HTTP_202_ACCEPTED)
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            return WorkoutChallengeSummarySerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'join'):
+            # The calendar keeps planning; ended challenges stay reachable
+            # by id but are no longer listed or joinable.
+            queryset = queryset.filter(end_date__gte=timezone.localdate())
+        if self.action in ('list', 'retrieve'):
+            # The requesting user's enrollment and exercise progress for every
+            # challenge come from two prefetch queries, however many challenges.
+            queryset = queryset.prefetch_related(
+                Prefetch('exercises', queryset=Exercise.objects.only('id', 'name')),
+                Prefetch(
+                    'userchallenge_set',
+                    queryset=UserChallenge.objects.filter(user=self.request.user).prefetch_related(
+                        Prefetch('exercise_progress', queryset=UserChallengeExercise.objects.select_related('exercise').only(
+                            'id', 'user_challenge_id', 'completed', 'exercise__id', 'exercise__name',
+                        ).order_by('id'))
+                    ),
+                    to_attr='user_challenges',
+                ),
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Running challenges, plus those starting within ?upcoming=<days>."""
+        try:
+            upcoming = max(0, min(int(request.query_params.get('upcoming', 0)), PLAN_DAYS_AHEAD))
+        except ValueError:
+            return Response({"message": "upcoming must be a number of days."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            start_date__lte=timezone.localdate() + timedelta(days=upcoming),
+        ).order_by('start_date', 'id')
+        return Response([
+            with_user_state(data, challenge)
+            for data, challenge in zip(self.get_serializer(queryset, many=True).data, queryset)
+        ])
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return Response(with_user_state(self.get_serializer(instance).data, instance))
+
+
+def with_user_state(data, challenge):
+    """Add the requesting user's progress to serialized challenge data.
+
+    Expects the challenge to come from WorkoutChallengeViewSet.get_queryset,
+    which prefetches the user's enrollment as `user_challenges`.
+    """
+    user_challenge = challenge.user_challenges[0] if challenge.user_challenges else None
+    if user_challenge:
+        data['exercises'] = [
+            {
+                'id': progress.exercise.id,
+                'name': progress.exercise.name,
+                'completed': progress.completed
+            }
+            for progress in user_challenge.exercise_progress.all()
+        ]
+        data['user_challenge_id'] = user_challenge.id
+        data['progress'] = user_challenge.progress
+        data['completed'] = user_challenge.completed
+        data['has_joined'] = True
+    else:
+        data['exercises'] = [
+            {
+                'id': exercise.id,
+                'name': exercise.name,
+                'completed': False
+            }
+            for exercise in challenge.exercises.all()
+        ]
+        data['user_challenge_id'] = None
+        data['progress'] = 0
+        data['completed'] = False
+        data['has_joined'] = False
+    return data
+
+class UserChallengeViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = UserChallengeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         return UserChallenge.objects.filter(user=self.request.user)
 
+    @conditional_on_data_version
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_on_data_version
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=['POST'])
     def update_progress(self, request, pk=None):
-        user_challenge = self.get_object()
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
         exercise_id = request.data.get('exercise_id')
 
         if not exercise_id:
             return Response({"message": "Exercise ID is required."}, status=status.HTTP_400_BAD_REQUEST)
-
-        exercise_progress = get_object_or_404(UserChallengeExercise, user_challenge=user_challenge, exercise_id=exercise_id)
-        exercise_progress.completed = True
-        exercise_progress.save()
-
-        user_challenge.progress = UserChallengeExercise.objects.filter(user_challenge=user_challenge, completed=True).count()
-        if user_challenge.progress >= user_challenge.challenge.goal:
-            user_challenge.completed = True
-        user_challenge.save()
+        try:
+            exercise_id = int(exercise_id)
+        except (TypeError, ValueError):
+            return Response({"message": "Exercise ID must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        with transaction.atomic():
+            if not self.get_queryset().filter(pk=pk).exists():
+                raise Http404
+            # Only a row that actually flips from incomplete to complete
+            # counts, so repeated or concurrent taps can't double count. The
+            # filter stays on this table: through a join Django updates
+            # `id IN (subquery)`, which Postgres doesn't re-check once a
+            # concurrent tap commits, so every waiting tap would count.
+            flipped = UserChallengeExercise.objects.filter(
+                user_challenge_id=pk,
+                exercise_id=exercise_id,
+                completed=False,
+            ).update(completed=True, completed_date=now)
+            if flipped:
+                goal = WorkoutChallenge.objects.filter(pk=OuterRef('challenge_id')).values('goal')[:1]
+                UserChallenge.objects.filter(pk=pk).update(
+                    progress=F('progress') + 1,
+                    completed=Case(
+                        When(progress__gte=Subquery(goal) - 1, then=Value(True)),
+                        default=F('completed'),
+                        output_field=BooleanField(),
+                    ),
+                    last_updated=now,
+                )
+                bump_data_version(request.user.pk)
+
+            user_challenge = self.get_queryset().select_related('challenge').prefetch_related(
+                Prefetch('exercise_progress', queryset=UserChallengeExercise.objects.select_related('exercise').order_by('id'))
+            ).filter(pk=pk).first()
+            if flipped and user_challenge is not None:
+                transaction.on_commit(lambda: record_progress([user_challenge]))
+
+        if user_challenge is None or not any(
+            progress.exercise_id == exercise_id for progress in user_challenge.exercise_progress.all()
+        ):
+            raise Http404
 
         # Fetch updated challenge data
-        challenge_data = WorkoutChallengeSerializer(user_challenge.challenge).data
+        challenge_data = WorkoutChallengeSummarySerializer(user_challenge.challenge).data
         challenge_data['exercises'] = [
             {
                 'id': progress.exercise.id,
                 'name': progress.exercise.name,
                 'completed': progress.completed
             }
-            for progress in UserChallengeExercise.objects.filter(user_challenge=user_challenge)
+            for progress in user_challenge.exercise_progress.all()
         ]
         challenge_data['user_challenge_id'] = user_challenge.id
         challenge_data['progress'] = user_challenge.progress
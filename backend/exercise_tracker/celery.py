@@ -1,9 +1,14 @@
 import os
 from celery import Celery
+from celery.signals import worker_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'exercise_tracker.settings')
 
+# System checks import the whole URLconf (views, serializers, DRF) just to
+# validate it; the deploy already runs them in `manage.py migrate`.
+os.environ.setdefault('CELERY_SKIP_CHECKS', 'true')
+
 # Create the Celery app instance
 app = Celery('exercise_tracker')
 
@@ -13,6 +18,12 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Automatically discover tasks.py files in installed apps
 app.autodiscover_tasks()
 
+# Workers get their own database pool sizing (DATABASE_POOL['worker']).
+@worker_init.connect
+def use_worker_database_pool(**kwargs):
+    from api.db_pool import set_pool_role
+    set_pool_role('worker')
+
 # Simple debug task for testing
 @app.task(bind=True)
 def debug_task(self):
@@ -34,9 +34,8 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from celery.schedules import crontab
+from urllib.parse import urlsplit
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -67,8 +66,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add this line
+    'api.middleware.WhiteNoiseMiddleware',  # Async-capable whitenoise.middleware.WhiteNoiseMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -113,13 +113,40 @@ WSGI_APPLICATION = 'exercise_tracker.wsgi.application'
 # }
 
 # Database for vercel development
+# With DB_POOL_ENABLED each process checks connections out of a bounded pool
+# (api/db_pool.py) instead of holding one persistent connection per thread.
+DATABASE_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'False') == 'True'
 DATABASES = {
     'default': dj_database_url.config(
         default=os.getenv('DATABASE_URL'),
-        conn_max_age=600,
+        conn_max_age=0 if DATABASE_POOL_ENABLED else 600,
         ssl_require=True
     )
 }
+if DATABASE_POOL_ENABLED:
+    DATABASES['default']['ENGINE'] = 'api.db_backends.postgresql_pooled'
+
+# Pool sizes per process; Celery workers switch to 'worker' when they start
+# (exercise_tracker/celery.py). Keep processes * max_size under Postgres'
+# max_connections.
+DATABASE_POOL = {
+    'web': {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '5')),
+        'recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'max_idle': int(os.getenv('DB_POOL_MAX_IDLE', '300')),
+        'pre_ping': os.getenv('DB_POOL_PRE_PING', 'True') == 'True',
+    },
+    'worker': {
+        'min_size': 0,
+        'max_size': int(os.getenv('DB_POOL_WORKER_MAX_SIZE', '2')),
+        'timeout': float(os.getenv('DB_POOL_WORKER_TIMEOUT', '30')),
+        'recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'max_idle': int(os.getenv('DB_POOL_WORKER_MAX_IDLE', '60')),
+        'pre_ping': os.getenv('DB_POOL_PRE_PING', 'True') == 'True',
+    },
+}
 
 
 MEDIA_URL = '/media/'
@@ -151,10 +178,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
+# Serve the hot read endpoints from api/async_views.py. Only pays off under
+# an ASGI server (see Procfile), and only while every MIDDLEWARE entry is
+# async-capable: below a sync-only one, Django 3.2 runs each request in one
+# shared thread. Under WSGI every async view runs in its own event loop per
+# request. Compare with `manage.py benchmark_async_reads`.
+ASYNC_READ_ENDPOINTS = os.getenv('ASYNC_READ_ENDPOINTS', 'False') == 'True'
+# Threads (and so database connections) per process for their queries.
+ASYNC_READ_THREADS = int(os.getenv('ASYNC_READ_THREADS', '20'))
+
+# Request and Celery task metrics served at /metrics (api/metrics.py). Point
+# METRICS_MULTIPROC_DIR at a directory shared by all gunicorn and Celery
+# processes to report them together. /metrics answers 404 unless the
+# scraper sends `Authorization: Bearer <METRICS_TOKEN>` or connects from one
+# of METRICS_ALLOWED_NETWORKS (comma-separated CIDRs, checked against
+# REMOTE_ADDR, which behind a proxy is the proxy's address).
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_ALLOWED_NETWORKS = [network for network in os.getenv('METRICS_ALLOWED_NETWORKS', '').split(',') if network]
+
+# Validated token snapshots (api/authentication.py). Other processes notice a
+# revoked token within `local_ttl` seconds. Without REDIS_URL the cache below
+# is per process, so snapshots are only kept for `local_ttl` there too.
+AUTH_TOKEN_CACHE = {
+    'max_entries': 10000,
+    'local_ttl': 5.0,
+    'timeout': 5 * 60,
+}
+
 # CORS_ALLOW_ALL_ORIGINS = True  # Only for development, configure properly for production
 CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS', '').split(',')
 
@@ -163,16 +219,55 @@ CELERY_BROKER_URL = os.getenv('REDIS_URL') # Redis server URL
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL') # Store results in Redis
 CELERY_ACCEPT_CONTENT = ['json']                # Accept only JSON format
 CELERY_TASK_SERIALIZER = 'json'                 # Serialize tasks in JSON format
+CELERY_BEAT_SCHEDULE = {
+    'schedule-exercise-of-the-day': {
+        'task': 'api.tasks.schedule_exercise_of_the_day_calendar',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'schedule-challenge-calendar': {
+        'task': 'api.tasks.schedule_challenge_calendar',
+        'schedule': crontab(hour=0, minute=15, day_of_week='mon'),
+    },
+}
 
-
-# Cloudinary configuration
-cloudinary.config(
-    cloud_name = os.getenv('CLOUDINARY_URL', '').split('@')[-1] if os.getenv('CLOUDINARY_URL') else None,
-    api_key = os.getenv('CLOUDINARY_URL', '').split('://')[1].split(':')[0] if os.getenv('CLOUDINARY_URL') else None,
-    api_secret = os.getenv('CLOUDINARY_URL', '').split('://')[1].split(':')[1].split('@')[0] if os.getenv('CLOUDINARY_URL') else None
+# Shared cache for the exercise catalog (api/cache.py); falls back to a
+# per-process cache when Redis isn't configured.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+        }
+    }
+
+# Challenge leaderboards (api/leaderboards.py): Redis sorted sets shared by
+# all processes, or an in-process skiplist for tests and local runs.
+LEADERBOARD_REDIS_URL = os.getenv('REDIS_URL')
+LEADERBOARD_BACKEND = os.getenv(
+    'LEADERBOARD_BACKEND',
+    'api.leaderboards.RedisLeaderboard' if LEADERBOARD_REDIS_URL else 'api.leaderboards.InMemoryLeaderboard',
 )
 
-CLOUDINARY_STORAGE = cloudinary.config()
+# 'memory' for the in-process index in api/search.py, 'postgres' for
+# tsvector/trigram search (needs the pg_trgm extension, see migration 0011).
+EXERCISE_SEARCH_BACKEND = os.getenv('EXERCISE_SEARCH_BACKEND', 'memory')
+
+CATALOG_CACHE = {
+    'max_entries': int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', '64')),
+    'version_ttl': float(os.getenv('CATALOG_CACHE_VERSION_TTL', '1.0')),
+}
+
+
+# Cloudinary configuration. The SDK is not imported here: django-cloudinary-storage
+# applies these credentials the first time the media storage is used, and the
+# SDK itself also reads CLOUDINARY_URL from the environment.
+_cloudinary_url = urlsplit(os.getenv('CLOUDINARY_URL', ''))
+CLOUDINARY_STORAGE = {
+    'CLOUD_NAME': _cloudinary_url.hostname,
+    'API_KEY': _cloudinary_url.username,
+    'API_SECRET': _cloudinary_url.password,
+}
 
 # Use Cloudinary for media files
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'